@@ -1,88 +1,581 @@
-from flask import Flask, render_template, request
-from flask_socketio import SocketIO, emit, join_room
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
+from flask_socketio import SocketIO, emit, join_room, disconnect
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+import atexit
+import functools
+import gzip
+import hashlib
+import logging
 import secrets
 import os
-from dotenv import load_dotenv
-from pathlib import Path
+import re
+import applog
+import assets
 import db
+import export
+import metrics
+import presence
+import profiler
+import pubsub
+import ratelimit
+import search
+import wire
+from assets import AssetStore
+from coalescer import RoomCoalescer
+from history_cache import RoomHistoryCache, HISTORY_SIZE
+from outbound import OutboundQueues
+from presence import PresenceTracker
+from profiler import HubLagMonitor, SamplingProfiler
+from ratelimit import RateLimiter
+from retention import RetentionJob
+from sessions import SessionRegistry
+from sharding import RoomRouter
+from write_queue import WriteBehindQueue
 
-# Load environment variables from .env file (in parent directory)
+# Environment variables from the .env file (in parent directory) are loaded by applog,
+# the first app module imported, so every module's settings see them.
 # NOTE: On Render, you must add these variables in the "Environment" tab manually.
-env_path = Path(__file__).parent.parent / '.env'
-load_dotenv(env_path)
+applog.setup_logging()
+log = applog.get_logger('app')
 
 app = Flask(__name__, template_folder='Templates', static_folder='../static')
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')  
 
+# Shared pub/sub bus so several workers deliver each other's room broadcasts (see pubsub.py)
+MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE', '')
+
 # IMPORTANT: Since you are using async_mode='eventlet', make sure 'eventlet' is in your requirements.txt
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet', ping_timeout=60, ping_interval=25, logger=False, engineio_logger=False)
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet', ping_timeout=60, ping_interval=25, logger=False, engineio_logger=False,
+                    **pubsub.socketio_options(MESSAGE_QUEUE))
+
+# How long the hub goes without running green threads, and what blocks it (see profiler.py)
+HUB_LAG = metrics.Histogram('chat_hub_lag_seconds', 'How late the hub ran a green thread that was due',
+                            buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+hub_monitor = HubLagMonitor(HUB_LAG.observe)
+hub_monitor.start(socketio)
+atexit.register(hub_monitor.stop)
+sampling_profiler = SamplingProfiler()
+
+# Storage is set up in the background (or by whichever call needs it first), so
+# importing the app does no database I/O; /readyz says when it is done
+db.start_warm_up(socketio)
+
+def persist_batch(rows):
+    """Flush function for the write-behind queue"""
+    # Rooms are created here, one upsert per batch for any not seen before,
+    # so joins never write and the messages' room_id foreign key is satisfied
+    if db.create_rooms({row['room_id'] for row in rows}) is None:
+        return None
+    return db.save_messages(rows)
+
+# Messages are persisted by a background worker so broadcasts don't wait on the database
+write_queue = WriteBehindQueue(persist_batch, ready=db.is_available)
+write_queue.start(socketio)
+atexit.register(write_queue.stop)
+
+# Old messages are deleted in batches on a schedule when a retention policy is set (see retention.py)
+retention_job = RetentionJob()
+retention_job.start(socketio)
+
+# Recent messages per room, served to joiners without a database round trip
+history_cache = RoomHistoryCache()
+
+# Each room's messages are coalesced, cached and queued for the database by one
+# owning worker; the others forward to it over the bus (see sharding.py)
+router = RoomRouter(lambda event, data, to: socketio.emit(event, data, to=to))
+if router.enabled and not MESSAGE_QUEUE:
+    log.warning("ROOM_SHARDING needs SOCKETIO_MESSAGE_QUEUE; every room stays on this worker")
+    router.enabled = False
+
+def load_history(room):
+    """Cold-miss loader for the history cache: the owning worker's copy, else the database"""
+    if not router.owns(room):
+        rows = router.request(room, "history", room)
+        if rows is not None:
+            return rows
+    # Write out anything still queued for this room so the read sees it
+    write_queue.flush()
+    return db.fetch_recent_messages(room, HISTORY_SIZE)
+
+# Page size for "load older messages" requests
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '50'))
+HISTORY_PAGE_MAX = int(os.getenv('HISTORY_PAGE_MAX', '200'))
+
+def history_cursor(messages, page_size):
+    """Cursor for the page before these messages, or None if there is nothing older"""
+    if len(messages) < page_size:
+        return None
+    return db.encode_cursor(messages[0])
+
+def load_older_page(room, cursor, limit=None):
+    """One page of history older than cursor; raises ValueError on a bad cursor or limit"""
+    limit = HISTORY_PAGE_SIZE if limit is None else int(limit)
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    limit = min(limit, HISTORY_PAGE_MAX)
+    before = db.decode_cursor(cursor) if cursor else None
+    messages = db.fetch_messages_before(room, before, limit)
+    if messages is None:
+        messages = []
+    return {"room": room, "messages": messages, "cursor": history_cursor(messages, limit)}
+
+def load_search_page(room, query, cursor, limit=None):
+    """One page of search results older than cursor, newest first; raises ValueError on a bad query, cursor or limit"""
+    limit = search.PAGE_SIZE if limit is None else int(limit)
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    limit = min(limit, search.PAGE_MAX)
+    if not isinstance(query, str) or not search.terms(query):
+        raise ValueError("query has no words to search for")
+    before = db.decode_cursor(cursor) if cursor else None
+    # Queued messages are written first so they can be found
+    write_queue.flush()
+    messages = db.search_messages(room, query, before, limit)
+    if messages is None:
+        messages = []
+    cursor = db.encode_cursor(messages[-1]) if len(messages) == limit else None
+    return {"room": room, "query": query, "messages": messages, "cursor": cursor}
+
+def remember_remote_message(event, data, room):
+    """Keep the history cache current with messages sent through other workers"""
+    if not room or not isinstance(data, dict):
+        return
+    if event == "message":
+        messages = [data]
+    elif event == "message_batch":
+        messages = data.get("messages") or []
+    else:
+        return
+    for message in messages:
+        history_cache.append(room, {
+            'room_id': room,
+            'user_handle': message.get("handle"),
+            'message_text': message.get("text"),
+            'created_at': message.get("created_at")
+        })
+
+pubsub.on_remote_emit(socketio.server, remember_remote_message)
+
+# Busy rooms get their messages in one "message_batch" frame per window (see coalescer.py)
+coalescer = RoomCoalescer(
+    lambda room, message: socketio.emit("message", message, to=room),
+    lambda room, messages: socketio.emit("message_batch", {"messages": messages}, to=room)
+)
+coalescer.start(socketio)
+
+# Room broadcasts to a client that reads slowly wait in a bounded queue (see outbound.py)
+OUTBOUND_DROPPED = metrics.Counter('chat_outbound_dropped_total', 'Room broadcast frames slow clients lost', ['policy'])
+outbound = OutboundQueues(socketio.server, on_drop=lambda frames: OUTBOUND_DROPPED.inc(frames, policy=outbound.policy))
+outbound.start(socketio)
+atexit.register(outbound.stop)
 
-# Initialize Supabase database
-try:
-    db.init_db()
-except Exception as e:
-    print(f"[WARNING] Database initialization failed: {e}")
+def accept_message(row):
+    """Owner-side work for a new message: broadcast, history cache and the write-behind queue"""
+    room = row['room_id']
+    coalescer.submit(room, {"handle": row['user_handle'], "text": row['message_text'], "created_at": row['created_at']})
+    history_cache.append(room, row)
+    write_queue.enqueue(row)
+
+router.handle("message", accept_message)
+router.handle("history", lambda room: history_cache.get(room, load_history))
+# Rooms that moved are read from the database by their new owner; write out what is queued here first
+router.on_change = write_queue.flush
+pubsub.on_remote_emit(socketio.server, router.on_remote_emit)
+if MESSAGE_QUEUE:
+    # Listen from startup, not from the first connection: other workers' heartbeats
+    # arrive before any client does, and a burst of first connections can stall the setup
+    pubsub.listen(socketio.server)
+router.start(socketio)
+atexit.register(router.stop)
+
+# Who each connected sid is and which rooms it is in; filled on join, cleared on disconnect
+sessions = SessionRegistry()
+
+# Joins, leaves and typing go out as one "presence" diff per room per interval (see presence.py)
+presence_tracker = PresenceTracker(lambda room, diff: socketio.emit("presence", diff, to=room), sessions.count)
+presence_tracker.start(socketio)
+
+# Flood protection for the Socket.IO handlers (see ratelimit.py)
+rate_limiter = RateLimiter()
+RATE_LIMITED = metrics.Counter('chat_rate_limited_total', 'Events dropped by the rate limiter', ['event', 'scope'])
+
+def over_limit(event, room=None):
+    """True if this event is over a rate limit; the client is told (or disconnected)"""
+    result = rate_limiter.check(request.sid, room, ratelimit.client_ip(request.environ), typing=event == "typing")
+    if result is None:
+        return False
+    scope, retry_after = result
+    RATE_LIMITED.inc(event=event, scope=scope)
+    emit("rate_limited", {"event": event, "scope": scope, "retry_after": retry_after})
+    if ratelimit.ACTION == 'disconnect':
+        log.warning("Disconnecting over-limit client", extra={'sid': request.sid, 'event': event, 'scope': scope})
+        disconnect()
+    elif applog.sampled():
+        log.info("Rate limited", extra={'sid': request.sid, 'event': event, 'scope': scope})
+    return True
+
+# Metrics read at scrape time
+CONNECTED = metrics.Gauge('chat_connected_sids', 'Socket.IO clients connected to this worker')
+
+# Room names are what lets someone into a room, so /metrics only shows how big rooms are
+ROOM_SIZE_BUCKETS = (1, 2, 5, 10, 50, 100, 500, 1000)
+
+def room_sizes():
+    """Rooms with at most `le` local connections, per bucket (cumulative, ending at '+Inf')"""
+    sizes = [size for _room, size in sessions.room_counts()]
+    return ([({'le': str(le)}, sum(1 for n in sizes if n <= le)) for le in ROOM_SIZE_BUCKETS]
+            + [({'le': '+Inf'}, len(sizes))])
+
+metrics.CallbackGauge('chat_room_connections', 'Rooms on this worker by at most how many connections they have (cumulative)',
+                      room_sizes, ['le'])
+metrics.CallbackGauge('chat_room_connections_max', 'Connections in the largest room on this worker',
+                      lambda: max((size for _room, size in sessions.room_counts()), default=0))
+metrics.CallbackGauge('chat_rooms_active', 'Rooms with at least one connection on this worker',
+                      lambda: sessions.stats()['rooms'])
+metrics.CallbackGauge('chat_write_queue', 'Write-behind queue stats', lambda: [({'stat': k}, v) for k, v in write_queue.stats().items()], ['stat'])
+metrics.CallbackGauge('chat_coalescer', 'Message coalescing stats', lambda: [({'stat': k}, v) for k, v in coalescer.stats().items()], ['stat'])
+metrics.CallbackGauge('chat_rate_limiter', 'Rate limiter stats', lambda: [({'stat': k}, v) for k, v in rate_limiter.stats().items()], ['stat'])
+metrics.CallbackGauge('chat_presence', 'Presence stats', lambda: [({'stat': k}, v) for k, v in presence_tracker.stats().items()], ['stat'])
+metrics.CallbackGauge('chat_retention', 'Retention job stats', lambda: [({'stat': k}, v) for k, v in retention_job.stats().items()], ['stat'])
+metrics.CallbackGauge('chat_db_breaker', 'Supabase circuit breaker (state: 0 closed, 1 half-open, 2 open)',
+                      lambda: [({'stat': k}, v) for k, v in db.breaker.stats().items()], ['stat'])
+metrics.CallbackGauge('chat_db_ready', 'Storage set up and accepting calls (1) or not (0)', lambda: int(db.status()['ready']))
+metrics.CallbackGauge('chat_sharding', 'Room ownership stats', lambda: [({'stat': k}, v) for k, v in router.stats().items()], ['stat'])
+metrics.CallbackGauge('chat_outbound', 'Outbound queue stats', lambda: [({'stat': k}, v) for k, v in outbound.stats().items()], ['stat'])
+# A fixed set of buckets rather than a series per client, which would churn with every connection
+metrics.CallbackGauge('chat_outbound_client_depth', 'Clients with frames held, by at most how many (cumulative)',
+                      lambda: [({'le': le}, n) for le, n in outbound.depth_histogram()], ['le'])
+metrics.CallbackGauge('chat_hub', 'Hub lag monitor stats', lambda: [({'stat': k}, v) for k, v in hub_monitor.stats().items()], ['stat'])
+metrics.CallbackGauge('chat_history_cache', 'History cache stats', lambda: [({'stat': k}, v) for k, v in history_cache.stats().items()], ['stat'])
 
 def random_handle():
     return "Anon-" + secrets.token_hex(3)
 
+# A reconnecting client sends back the signed token it got on join and keeps its handle
+SESSION_RESUME_MAX_AGE = int(os.getenv('SESSION_RESUME_MAX_AGE', '86400'))
+resume_tokens = URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='resume-handle')
+
+def resumed_handle(token):
+    """The handle a resume token was issued for, or None if it is missing, forged or expired"""
+    if not isinstance(token, str) or not token:
+        return None
+    try:
+        return resume_tokens.loads(token, max_age=SESSION_RESUME_MAX_AGE)
+    except BadSignature:
+        return None
+
+JOIN_HISTORY = metrics.Counter('chat_join_history_messages_total',
+                               'Messages sent in join history, by full replay or reconnect delta', ['kind'])
+
+def history_since(history, since):
+    """Messages in history newer than since (the created_at of the last one the client saw).
+
+    None when every cached message is newer, so the client may have missed more
+    than the cache holds and needs the full replay (also when since can't be read).
+    """
+    since = db.created_time(since)
+    if since is None:
+        return None
+    # A message whose time can't be read is sent again rather than risk skipping it
+    stamped = ((m, db.created_time(m.get('created_at'))) for m in history)
+    newer = [m for m, at in stamped if at is None or at > since]
+    if len(newer) == len(history) and len(history) >= HISTORY_SIZE:
+        return None
+    return newer
+
+# Handshake: with more than one worker, the Engine.IO long-polling handshake and
+# every poll that follows must reach the worker that issued the sid. Put workers
+# behind a load balancer with sticky sessions (e.g. nginx ip_hash or a cookie),
+# or have clients connect with transports=['websocket'] only. See HOSTING.md.
 @socketio.on("connect")
 def handle_connect():
-    print(f"[LOG] Client connected: {request.sid}")
+    CONNECTED.inc()
+    log.info("Client connected", extra={'sid': request.sid})
 
 @socketio.on("disconnect")
 def handle_disconnect():
-    print(f"[LOG] Client disconnected: {request.sid}")
+    CONNECTED.dec()
+    rate_limiter.forget(request.sid)
+    outbound.forget(socketio.server.manager.eio_sid_from_sid(request.sid, '/'))
+    session = sessions.remove(request.sid)
+    if session is not None:
+        for room in session.rooms:
+            # A client that already reconnected on a new sid is still there
+            if not sessions.present(room, session.handle):
+                presence_tracker.left(room, session.handle)
+    log.info("Client disconnected", extra={'sid': request.sid})
+
+# The page's JS and CSS as built by `python assets.py build`: one hashed, precompressed file each
+asset_store = AssetStore()
+app.jinja_env.globals['asset_url'] = asset_store.url
+
+_home_page = None
+
+def home_page():
+    """The rendered page with its gzip copy and ETag; it only changes with a deploy, so it is rendered once"""
+    global _home_page
+    if _home_page is None:
+        body = render_template("index.html").encode()
+        _home_page = ({None: body, 'gzip': gzip.compress(body, mtime=0)}, hashlib.sha256(body).hexdigest()[:16])
+    return _home_page
 
 @app.route("/")
 def home():
-    return render_template("index.html")
+    variants, etag = home_page()
+    body, coding = assets.negotiate(variants, request.headers.get("Accept-Encoding"))
+    resp = Response(body, mimetype="text/html")
+    # Browsers revalidate on every load and get a 304 while the page is unchanged
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.vary.add("Accept-Encoding")
+    if coding:
+        resp.headers["Content-Encoding"] = coding
+    resp.set_etag(f"{etag}-{coding}" if coding else etag)
+    return resp.make_conditional(request)
+
+@app.route("/assets/<name>")
+def built_asset(name):
+    """A built bundle, named after its content, so it never changes and can be cached for good"""
+    found = asset_store.get(name, request.headers.get("Accept-Encoding"))
+    if found is None:
+        return jsonify({"error": "not found"}), 404
+    body, content_type, coding = found
+    resp = Response(body, content_type=content_type)
+    resp.headers["Cache-Control"] = assets.IMMUTABLE
+    resp.vary.add("Accept-Encoding")
+    if coding:
+        resp.headers["Content-Encoding"] = coding
+    return resp
+
+@app.route("/healthz")
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({"status": "ok"})
+
+@app.route("/readyz")
+def readyz():
+    """Readiness: 200 once storage is set up and accepting calls, 503 until then"""
+    status = db.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return metrics.render(), 200, {"Content-Type": metrics.CONTENT_TYPE}
+
+# Admin endpoints answer requests with "Authorization: Bearer <ADMIN_TOKEN>"; with no ADMIN_TOKEN set they don't exist
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+
+def admin_required(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({"error": "not found"}), 404
+        if not secrets.compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {ADMIN_TOKEN}".encode()):
+            return jsonify({"error": "unauthorized"}), 401
+        return fn(*args, **kwargs)
+    return wrapper
+
+@app.route("/admin/profile", methods=["POST"])
+@admin_required
+def admin_profile():
+    """Sample this worker for ?seconds=<n> (default 10); collapsed stacks for flamegraph.pl or speedscope.
+    ?waiting=1 adds the stacks parked green threads wait in"""
+    try:
+        seconds = float(request.args.get("seconds", 10))
+    except ValueError:
+        seconds = 0
+    if not 0 < seconds <= profiler.MAX_SECONDS:
+        return jsonify({"error": f"seconds must be above 0 and at most {profiler.MAX_SECONDS:g}"}), 400
+    waiting = request.args.get("waiting", "0").lower() in ("1", "true", "yes")
+    stacks = sampling_profiler.profile(seconds, socketio.sleep, include_waiting=waiting)
+    if stacks is None:
+        return jsonify({"error": "a profile is already running"}), 409
+    return Response(stacks, mimetype="text/plain")
+
+@app.route("/admin/export")
+@admin_required
+def admin_export():
+    """Stream messages oldest first as ?format=ndjson|csv: one ?room= (all rooms without it), ?since= / ?until=
+    ISO-8601 times (until exclusive). ?after=<cursor of a row> resumes after it; gzipped if the client accepts it"""
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in export.FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(export.FORMATS)}"}), 400
+    room = request.args.get("room") or None
+    try:
+        since = export.parse_time(request.args["since"]) if request.args.get("since") else None
+        until = export.parse_time(request.args["until"]) if request.args.get("until") else None
+        after = db.decode_cursor(request.args["after"]) if request.args.get("after") else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if after is not None and db.created_time(after[0]) is None:
+        return jsonify({"error": f"invalid cursor: {request.args['after']!r}"}), 400
+    # Stored times come back with or without an offset, so they are compared as times
+    if since is not None and (after is None or db.created_time(after[0]) < db.created_time(since)):
+        after = (since, None)
+    # Queued messages are written first so the export has them
+    write_queue.flush()
+    compress = assets.accepts(request.headers.get("Accept-Encoding", ""), "gzip")
+    log.info("Export started", extra={'room': room, 'format': fmt, 'gzip': compress})
+    body = export.stream(export.pages(room, after, until), fmt, gzip=compress)
+    resp = Response(stream_with_context(body), content_type=export.FORMATS[fmt])
+    name = re.sub(r"[^\w.-]", "_", room) if room else "all-rooms"
+    resp.headers["Content-Disposition"] = f'attachment; filename="messages-{name}.{fmt}"'
+    resp.headers["Cache-Control"] = "no-store"
+    resp.vary.add("Accept-Encoding")
+    if compress:
+        resp.headers["Content-Encoding"] = "gzip"
+    return resp
+
+@app.route("/rooms/<room>/messages")
+def room_messages(room):
+    """Paginated history: ?before=<cursor>&limit=<n>&format=json|compact|msgpack, newest page first"""
+    try:
+        page = load_older_page(room, request.args.get("before"), request.args.get("limit"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    payload = wire.encode_history(room, page["messages"], page["cursor"], wire.negotiate(request.args.get("format")))
+    if payload.get("format") == "msgpack":
+        return Response(payload["data"], mimetype="application/msgpack")
+    return jsonify(payload)
+
+@app.route("/rooms/<room>/search")
+def room_search(room):
+    """Messages matching ?q=, newest first: ?before=<cursor>&limit=<n>&format=json|compact|msgpack"""
+    try:
+        page = load_search_page(room, request.args.get("q"), request.args.get("before"), request.args.get("limit"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    payload = wire.encode_history(room, page["messages"], page["cursor"], wire.negotiate(request.args.get("format")))
+    if payload.get("format") == "msgpack":
+        return Response(payload["data"], mimetype="application/msgpack")
+    return jsonify(dict(payload, query=page["query"]))
+
+@app.route("/rooms/<room>/presence")
+def room_presence(room):
+    """Who is in a room (connections on this worker)"""
+    return jsonify({"room": room, "count": sessions.count(room), "handles": sessions.handles(room)})
 
 # When user joins room
 @socketio.on("join")
+@metrics.timed(metrics.HANDLER_SECONDS, handler="join")
 def handle_join(data):
     room = data["room"]
-    handle = random_handle()
+    if over_limit("join"):
+        return
+    resumed = resumed_handle(data.get("resume"))
+    # The old sid of a reconnecting client may not have timed out yet
+    still_here = resumed is not None and sessions.present(room, resumed)
+    session = sessions.join(request.sid, room, lambda: resumed or random_handle())
+    session.format = wire.negotiate(data.get("format"))
+    handle = session.handle
     join_room(room)
     
-    print(f"[LOG] User {handle} joined room {room}")
+    log.info("User joined room", extra={'room': room, 'handle': handle, 'resumed': resumed is not None})
     
-    # Create room entry in database if enabled
+    # Room rows are created with the room's first saved messages (see persist_batch)
     try:
-        db.create_room(room)
-        # Send message history to the new user
-        history = db.get_messages(room)
-        emit("message_history", {"messages": history})
+        # Send message history to the new user (database is only read on a cold miss).
+        # A reconnecting client says what it last saw and only gets what is newer.
+        history = history_cache.get(room, load_history)
+        since = data.get("since")
+        delta = history_since(history, since) if isinstance(since, str) and since else None
+        if delta is not None:
+            JOIN_HISTORY.inc(len(delta), kind='delta')
+            emit("message_history", dict(wire.encode_history(room, delta, None, session.format), since=since))
+        else:
+            JOIN_HISTORY.inc(len(history), kind='full')
+            emit("message_history", wire.encode_history(room, history, history_cursor(history, HISTORY_SIZE), session.format))
     except Exception as e:
-        print(f"[ERROR] Database error on join: {e}")
-    
-    emit("system", f"{handle} joined the room.", to=room)
+        log.error("Database error on join", extra={'room': room, 'error': str(e)})
+        metrics.ERRORS.inc(where='join')
+
+    # The room hears about the join in its next presence diff; the joiner gets the member list now.
+    # A rejoin inside the leave grace window is not announced (see presence.py).
+    if not still_here:
+        presence_tracker.joined(room, handle)
+    emit("presence_snapshot", {"count": sessions.count(room), "handles": sessions.handles(room)[:presence.SNAPSHOT_MAX]})
     emit("your_handle", handle)
+    emit("resume_token", resume_tokens.dumps(handle))
+
+# When user scrolls back past the loaded history
+@socketio.on("load_older")
+@metrics.timed(metrics.HANDLER_SECONDS, handler="load_older")
+def handle_load_older(data):
+    room = data["room"]
+    if over_limit("load_older"):
+        return
+    try:
+        page = load_older_page(room, data.get("cursor"), data.get("limit"))
+    except ValueError as e:
+        log.warning("Bad history request", extra={'room': room, 'error': str(e)})
+        metrics.ERRORS.inc(where='load_older')
+        return
+    session = sessions.get(request.sid)
+    emit("older_messages", wire.encode_history(room, page["messages"], page["cursor"], session.format if session else 'json'))
+
+# Search a room's history: {"room", "q", "cursor"?, "limit"?} -> "search_results", newest first
+@socketio.on("search")
+@metrics.timed(metrics.HANDLER_SECONDS, handler="search")
+def handle_search(data):
+    room = data["room"]
+    if over_limit("search"):
+        return
+    try:
+        page = load_search_page(room, data.get("q"), data.get("cursor"), data.get("limit"))
+    except ValueError as e:
+        log.warning("Bad search request", extra={'room': room, 'error': str(e)})
+        emit("search_results", {"room": room, "query": data.get("q"), "messages": [], "cursor": None, "error": str(e)})
+        return
+    session = sessions.get(request.sid)
+    payload = wire.encode_history(room, page["messages"], page["cursor"], session.format if session else 'json')
+    emit("search_results", dict(payload, query=page["query"]))
+
+# Keystrokes in the composer; the tracker debounces them and expires stale indicators
+@socketio.on("typing")
+def handle_typing(data=None):
+    if over_limit("typing"):
+        return
+    session, room = sessions.resolve_room(request.sid, data.get("room") if isinstance(data, dict) else None)
+    if room is not None:
+        presence_tracker.typing(room, session.handle)
 
 # When user sends a message
 @socketio.on("message")
+@metrics.timed(metrics.HANDLER_SECONDS, handler="message")
 def handle_message(data):
-    room = data["room"]
-    handle = data["handle"]
-    text = data["text"]
+    # Clients send just the text; handle and room come from the sid's session.
+    # A {"text", "room"} object is still accepted, but room must be one the sid joined.
+    if isinstance(data, dict):
+        text, room = data.get("text"), data.get("room")
+    else:
+        text, room = data, None
+    session, room = sessions.resolve_room(request.sid, room)
+    if room is None or not isinstance(text, str):
+        return
+    handle = session.handle
+    if over_limit("message", room):
+        return
 
-    print(f"[LOG] Message from {handle} in {room}: {text}")
-    
-    # Save to Supabase if enabled
-    try:
-        db.save_message(room, handle, text)
-    except Exception as e:
-        print(f"[ERROR] Database save failed: {e}")
-    
-    emit("message", {"handle": handle, "text": text}, to=room)
+    # Per-message lines are sampled debug output, and never include the text unless LOG_PAYLOADS is on
+    if log.isEnabledFor(logging.DEBUG) and applog.sampled():
+        fields = {'room': room, 'handle': handle, 'chars': len(text)}
+        if applog.LOG_PAYLOADS:
+            fields['text'] = text
+        log.debug("Message", extra=fields)
+
+    presence_tracker.stopped_typing(room, handle)
+    # The room's owner broadcasts it and queues it for the write-behind worker (here, without sharding)
+    router.send(room, "message", db.make_message(room, handle, text))
 
 if __name__ == "__main__":
     # FIX: Get the PORT from Render environment variable, default to 5000 only for local testing
     port = int(os.environ.get("PORT", 5000))
+    # Every Socket.IO connection holds a green thread; eventlet's default cap is 1024
+    max_connections = int(os.environ.get("MAX_CONNECTIONS", 10000))
     
     print("\n" + "="*60)
     print(f"STARTING CHAT APP SERVER on PORT {port}")
     print("="*60)
     
     # FIX: Host must be '0.0.0.0' for Render to route traffic correctly
-    socketio.run(app, host='0.0.0.0', port=port, debug=False, allow_unsafe_werkzeug=True)
\ No newline at end of file
+    socketio.run(app, host='0.0.0.0', port=port, debug=False, allow_unsafe_werkzeug=True, max_size=max_connections)
\ No newline at end of file
@@ -0,0 +1,148 @@
+"""
+Logging setup for the chat app
+Leveled, JSON-structured logs written from a background thread so handlers never wait on stdout
+
+LOG_LEVEL        DEBUG / INFO (default) / WARNING / ERROR
+LOG_FORMAT       json (default) or text
+LOG_SAMPLE_RATE  fraction of per-message debug lines to keep (default 0.01)
+LOG_PAYLOADS     1 to include message bodies and response payloads (off by default)
+LOG_QUEUE_SIZE   records buffered before new ones are dropped (default 10000)
+"""
+
+import atexit
+import importlib
+import json
+import logging
+import logging.handlers
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file (in parent directory)
+load_dotenv(Path(__file__).parent.parent / '.env')
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').lower()
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '0.01'))
+LOG_PAYLOADS = os.getenv('LOG_PAYLOADS', '0').lower() in ('1', 'true', 'yes')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+ROOT = 'chat'
+
+# Attributes every LogRecord has; anything else came in through extra= and is a field
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+dropped = 0
+
+
+def _original(name):
+    # The writer must be a real OS thread even when eventlet has monkey-patched threading
+    try:
+        from eventlet.patcher import original
+        return original(name)
+    except ImportError:
+        return importlib.import_module(name)
+
+
+def get_logger(name):
+    """Logger under the app's 'chat' namespace"""
+    return logging.getLogger(f"{ROOT}.{name}")
+
+
+def sampled(rate=None):
+    """True for roughly `rate` of calls; guard per-message debug lines with it"""
+    rate = LOG_SAMPLE_RATE if rate is None else rate
+    return rate >= 1 or random.random() < rate
+
+
+def fields(record):
+    """Structured fields passed to a log call through extra="""
+    return {k: v for k, v in vars(record).items() if k not in _RESERVED and not k.startswith('_')}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        entry.update(fields(record))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """[LEVEL] logger: message key=value ..."""
+
+    def format(self, record):
+        extra = ' '.join(f"{k}={v}" for k, v in fields(record).items())
+        line = f"{time.strftime('%H:%M:%S', time.localtime(record.created))} [{record.levelname}] {record.name}: {record.getMessage()}"
+        if extra:
+            line = f"{line} {extra}"
+        if record.exc_info:
+            line = f"{line}\n{self.formatException(record.exc_info)}"
+        return line
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records instead of blocking when the queue is full"""
+
+    def enqueue(self, record):
+        global dropped
+        try:
+            self.queue.put_nowait(record)
+        except Exception:
+            dropped += 1
+
+    def prepare(self, record):
+        # Formatting happens on the writer thread; just make the record safe to hand over
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class _Listener(logging.handlers.QueueListener):
+    """QueueListener whose writer thread is a real OS thread"""
+
+    def start(self):
+        self._thread = _original('threading').Thread(target=self._monitor, daemon=True)
+        self._thread.start()
+
+
+def setup_logging(level=None, fmt=None, stream=None):
+    """Install the queued handler on the 'chat' logger (safe to call more than once)"""
+    global _listener
+    logger = logging.getLogger(ROOT)
+    logger.setLevel(level or LOG_LEVEL)
+    if _listener is not None:
+        return logger
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(TextFormatter() if (fmt or LOG_FORMAT) == 'text' else JsonFormatter())
+
+    records = _original('queue').Queue(LOG_QUEUE_SIZE)
+    logger.addHandler(DroppingQueueHandler(records))
+    logger.propagate = False
+
+    _listener = _Listener(records, output)
+    _listener.start()
+    atexit.register(shutdown)
+    return logger
+
+
+def shutdown():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,228 @@
+"""
+Static assets for the chat page
+`python assets.py build` bundles the page's JavaScript (the Socket.IO client,
+then static/chat.js) into one file and static/style.css into another, minified
+and named after a hash of their content, in static/dist/. Each gets a gzip copy
+and, with `pip install brotli`, a brotli copy, compressed once at build time.
+static/dist/manifest.json maps app.js / app.css to the built names.
+
+The app serves built files at /assets/<name> from memory, picking the smallest
+copy the browser accepts. A new build means new names, so they are cached for a
+year as immutable. Without a build the page loads static/chat.js and
+static/style.css as they are and the Socket.IO client from its CDN.
+
+The Socket.IO client is pinned to SOCKETIO_CLIENT_VERSION and downloaded once
+into static/vendor/ (the build does this if it is missing; commit the file, or
+run the build in the deploy's build command).
+
+ASSETS_DIR  where built assets are read from (default static/dist)
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+import urllib.request
+from pathlib import Path
+
+import applog
+
+log = applog.get_logger('assets')
+
+STATIC_DIR = Path(__file__).resolve().parent.parent / 'static'
+ASSETS_DIR = Path(os.getenv('ASSETS_DIR', str(STATIC_DIR / 'dist')))
+
+SOCKETIO_CLIENT_VERSION = '4.5.4'
+SOCKETIO_CLIENT = STATIC_DIR / 'vendor' / f'socket.io-{SOCKETIO_CLIENT_VERSION}.min.js'
+SOCKETIO_CLIENT_URL = f'https://cdn.socket.io/{SOCKETIO_CLIENT_VERSION}/socket.io.min.js'
+
+# Bundle name -> sources, in load order
+BUNDLES = {
+    'app.js': [SOCKETIO_CLIENT, STATIC_DIR / 'chat.js'],
+    'app.css': [STATIC_DIR / 'style.css'],
+}
+
+CONTENT_TYPES = {'.js': 'text/javascript; charset=utf-8', '.css': 'text/css; charset=utf-8'}
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def minify_css(text):
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    # Spaces next to these never matter; ':' is left alone since "a :hover" differs from "a:hover"
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    return text.replace(';}', '}').strip() + '\n'
+
+
+def minify_js(text):
+    """rjsmin when it is installed; otherwise drops indentation, blank lines and whole-line comments
+
+    Line breaks are kept, so automatic semicolon insertion still sees them.
+    """
+    try:
+        import rjsmin
+    except ImportError:
+        lines = (line.strip() for line in text.splitlines())
+        return '\n'.join(line for line in lines if line and not line.startswith('//')) + '\n'
+    return rjsmin.jsmin(text) + '\n'
+
+
+def _bundle(name, sources):
+    parts = []
+    for path in sources:
+        text = Path(path).read_text(encoding='utf-8')
+        if name.endswith('.css'):
+            parts.append(minify_css(text))
+        elif path.name.endswith('.min.js'):
+            # Already minified; its source map isn't shipped
+            parts.append(re.sub(r'^//# sourceMappingURL=.*$', '', text, flags=re.M).rstrip() + '\n')
+        else:
+            parts.append(minify_js(text))
+    # A ';' between files, in case one ends in an expression without one
+    return (';\n' if name.endswith('.js') else '').join(parts).encode('utf-8')
+
+
+def fetch_socketio_client(path=SOCKETIO_CLIENT, url=SOCKETIO_CLIENT_URL):
+    """Download the pinned Socket.IO client unless it is already there"""
+    if path.exists():
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with urllib.request.urlopen(url, timeout=30) as resp:
+        path.write_bytes(resp.read())
+    return path
+
+
+def build(out_dir=ASSETS_DIR, bundles=BUNDLES):
+    """Write the hashed, precompressed bundles and manifest.json; returns the manifest"""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    brotli = _brotli()
+    manifest = {}
+    for name, sources in bundles.items():
+        data = _bundle(name, sources)
+        stem, ext = os.path.splitext(name)
+        built = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+        (out_dir / built).write_bytes(data)
+        # mtime=0 so the same input always builds the same .gz
+        (out_dir / f'{built}.gz').write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            (out_dir / f'{built}.br').write_bytes(brotli.compress(data, quality=11))
+        manifest[name] = built
+    (out_dir / 'manifest.json').write_text(json.dumps(manifest, indent=2) + '\n')
+    return manifest
+
+
+def _quality(params):
+    """The q= weight among a coding's parameters; missing is 1, unparsable is 0"""
+    for param in params.split(';'):
+        name, _, value = param.strip().partition('=')
+        if name.strip().lower() == 'q':
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def accepts(accept_encoding, coding):
+    """True if the Accept-Encoding header allows coding; a named coding overrides *, q=0 rules it out"""
+    wildcard = None
+    for part in accept_encoding.split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if token == coding:
+            return _quality(params) > 0
+        if token == '*':
+            wildcard = _quality(params) > 0
+    return bool(wildcard)
+
+
+def negotiate(variants, accept_encoding):
+    """(body, coding) of the smallest variant the client accepts; coding None is the plain body"""
+    best = (variants[None], None)
+    for coding, body in variants.items():
+        if coding is not None and len(body) < len(best[0]) and accepts(accept_encoding or '', coding):
+            best = (body, coding)
+    return best
+
+
+class AssetStore:
+    """Built assets held in memory, looked up by their hashed name"""
+
+    def __init__(self, directory=ASSETS_DIR):
+        self.directory = Path(directory)
+        self.manifest = {}
+        self._files = {}      # built name -> {None: plain, 'gzip': ..., 'br': ...}
+        self.served = 0
+        self.load()
+
+    def load(self):
+        """Read manifest.json and the files it names; without a build there is nothing to serve"""
+        manifest_path = self.directory / 'manifest.json'
+        if not manifest_path.exists():
+            log.info("No built assets, serving sources", extra={'dir': str(self.directory)})
+            return False
+        manifest, files = json.loads(manifest_path.read_text()), {}
+        for built in manifest.values():
+            variants = {None: (self.directory / built).read_bytes()}
+            for coding, suffix in (('gzip', '.gz'), ('br', '.br')):
+                path = self.directory / f'{built}{suffix}'
+                if path.exists():
+                    variants[coding] = path.read_bytes()
+            files[built] = variants
+        self.manifest, self._files = manifest, files
+        log.info("Built assets loaded", extra={'assets': manifest})
+        return True
+
+    def url(self, name):
+        """/assets/<hashed name> for a bundle name, or None when there is no build"""
+        built = self.manifest.get(name)
+        return f'/assets/{built}' if built else None
+
+    def get(self, built, accept_encoding=''):
+        """(body, content type, coding) for a built name, or None"""
+        variants = self._files.get(built)
+        if variants is None:
+            return None
+        self.served += 1
+        body, coding = negotiate(variants, accept_encoding)
+        return body, CONTENT_TYPES.get(os.path.splitext(built)[1], 'application/octet-stream'), coding
+
+    def stats(self):
+        return {'bundles': len(self.manifest), 'served': self.served}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the chat page assets')
+    parser.add_argument('command', choices=['build'])
+    parser.add_argument('--out', default=str(ASSETS_DIR), help='output directory (default static/dist)')
+    args = parser.parse_args(argv)
+
+    try:
+        fetch_socketio_client()
+    except OSError as e:
+        print(f'Could not download the Socket.IO client from {SOCKETIO_CLIENT_URL} ({e}); '
+              f'save it as {SOCKETIO_CLIENT} and build again', file=sys.stderr)
+        return 1
+    manifest = build(args.out)
+    brotli = ' + .br' if _brotli() else ' (pip install brotli for .br copies)'
+    for name, built in manifest.items():
+        size = (Path(args.out) / built).stat().st_size
+        gz = (Path(args.out) / f'{built}.gz').stat().st_size
+        print(f'{name:<8} -> {built}  {size} bytes, {gz} gzipped{brotli}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+Export benchmark
+For each of --sizes, fills a SQLite database with one room of that many
+messages, starts the app on it and streams GET /admin/export for that room, sampling the server's memory
+while it runs. Reports rows/sec, bytes on the wire and the server's peak memory
+over idle, for each size and each of ndjson, csv and ndjson gzipped:
+
+  python bench/bench_export.py
+  python bench/bench_export.py --sizes 10000 1000000 --size 500
+
+The export reads one page at a time, so the peak should not grow with the size
+of the room.
+"""
+
+import argparse
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+from common import free_port, rss_mb, start_server, write_report
+
+from sqlite_backend import SQLiteBackend  # app modules; common put the app directory on sys.path
+
+ROOM = 'bench-export'
+TOKEN = 'bench-export-token'
+CASES = {'ndjson': ('ndjson', False), 'csv': ('csv', False), 'ndjson.gz': ('ndjson', True)}
+
+
+def seed(path, count, size, batch=5000):
+    backend = SQLiteBackend(path, readers=1, green=False)
+    backend.create_rooms([ROOM])
+    text = 'x' * size
+    for start in range(0, count, batch):
+        backend.save_messages([{'room_id': ROOM, 'user_handle': f'Anon-{i % 100}', 'message_text': text,
+                                'created_at': f'2026-01-01T00:00:00.{i:09d}'}
+                               for i in range(start, min(count, start + batch))])
+    backend.close()
+
+
+def export_once(base, fmt, gzip, pid):
+    peak, done = [rss_mb(pid)], threading.Event()
+
+    def sample():
+        while not done.is_set():
+            value = rss_mb(pid)
+            if value is not None:
+                peak[0] = max(peak[0] or 0, value)
+            time.sleep(0.1)
+    threading.Thread(target=sample, daemon=True).start()
+
+    headers = {'Authorization': f'Bearer {TOKEN}', 'Accept-Encoding': 'gzip' if gzip else 'identity'}
+    started = time.perf_counter()
+    wire = 0
+    with requests.get(f'{base}/admin/export', params={'room': ROOM, 'format': fmt},
+                      headers=headers, stream=True, timeout=600) as resp:
+        resp.raise_for_status()
+        # raw keeps the body as sent, so wire bytes are counted before decompression
+        for chunk in resp.raw.stream(65536, decode_content=False):
+            wire += len(chunk)
+    elapsed = time.perf_counter() - started
+    done.set()
+    return {'seconds': round(elapsed, 2), 'wire_mb': round(wire / 1e6, 1), 'peak_rss_mb': peak[0]}
+
+
+def run_one(args, count):
+    path = Path(tempfile.mkdtemp()) / 'export.sqlite3'
+    seed(path, count, args.size)
+    port = free_port()
+    proc = start_server(port, {'DB_BACKEND': 'sqlite', 'SQLITE_PATH': str(path), 'ADMIN_TOKEN': TOKEN,
+                               'EXPORT_PAGE_SIZE': str(args.page_size)})
+    try:
+        idle = rss_mb(proc.pid)
+        cases = {}
+        for name, (fmt, gzip) in CASES.items():
+            case = export_once(f'http://127.0.0.1:{port}', fmt, gzip, proc.pid)
+            case['rows_per_sec'] = round(count / case['seconds']) if case['seconds'] else None
+            case['rss_over_idle_mb'] = round(case['peak_rss_mb'] - idle, 1)
+            cases[name] = case
+        return {'rows': count, 'idle_rss_mb': idle, 'cases': cases}
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Streaming export benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 500000], help='messages in the room')
+    parser.add_argument('--size', type=int, default=200, help='characters per message (default 200)')
+    parser.add_argument('--page-size', type=int, default=1000, help='EXPORT_PAGE_SIZE for the server')
+    parser.add_argument('--output', help='result file (default bench/results/export-<commit>.json)')
+    args = parser.parse_args(argv)
+
+    results = {}
+    print(f"{'rows':>8} {'case':<10} {'seconds':>8} {'rows/s':>8} {'wire MB':>8} {'rss +MB':>8}")
+    for count in args.sizes:
+        result = results[str(count)] = run_one(args, count)
+        for name, case in result['cases'].items():
+            print(f"{count:>8} {name:<10} {case['seconds']:>8} {case['rows_per_sec']:>8} "
+                  f"{case['wire_mb']:>8} {case['rss_over_idle_mb']:>8}")
+
+    config = {k: v for k, v in vars(args).items() if k != 'output'}
+    print(f"\nwrote {write_report('export', 'export', config, results, args.output)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
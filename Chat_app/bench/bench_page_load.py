@@ -0,0 +1,105 @@
+"""
+Page-load benchmark
+Loads the chat page the way a browser would, in process through Flask's test
+client: GET / and then every same-origin stylesheet and script it links, with
+"Accept-Encoding: gzip, br". A repeat visit skips what the first response marked
+immutable or fresh and revalidates the rest with If-None-Match / If-Modified-Since.
+Reports requests and bytes on the wire for both visits, plus the requests to other
+origins (the Socket.IO CDN, fonts), whose bytes aren't measured.
+
+Runs the page as it is served from sources and from a build (assets.py). The
+build needs the pinned Socket.IO client in static/vendor/; without it an empty
+stand-in is bundled and the built numbers leave the client out.
+
+  python bench/bench_page_load.py
+"""
+
+import argparse
+import re
+import sys
+import tempfile
+from pathlib import Path
+
+from common import write_report
+
+import assets  # app modules; common put the app directory on sys.path
+
+LINKS = re.compile(r'<(?:link\b|script\b)[^>]*?(?:href|src)="([^"]+)"')
+
+
+def fetch(client, url, cache):
+    """One request; returns bytes on the wire (headers left out) and updates the cache"""
+    headers = {'Accept-Encoding': 'gzip, br'}
+    cached = cache.get(url)
+    if cached is not None:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+    resp = client.get(url, headers=headers)
+    body = resp.get_data()
+    if resp.status_code == 200:
+        cache[url] = {'etag': resp.headers.get('ETag'), 'last_modified': resp.headers.get('Last-Modified'),
+                      'fresh': 'immutable' in resp.headers.get('Cache-Control', '')}
+    return len(body)
+
+
+def visit(client, cache):
+    """requests, bytes and external requests for one load of the page"""
+    requests, size, external = 1, fetch(client, '/', cache), 0
+    page = client.get('/').get_data(as_text=True)    # uncompressed copy, for the links
+    for url in LINKS.findall(page):
+        if url.startswith('http'):
+            external += 1
+            continue
+        if cache.get(url, {}).get('fresh'):
+            continue
+        requests += 1
+        size += fetch(client, url, cache)
+    return {'requests': requests, 'bytes': size, 'external_requests': external}
+
+
+def run(built_dir):
+    import app as app_module
+    results = {}
+    for name, store in (('sources', assets.AssetStore(Path(tempfile.mkdtemp()) / 'none')),
+                        ('built', assets.AssetStore(built_dir))):
+        app_module.asset_store = store
+        app_module.app.jinja_env.globals['asset_url'] = store.url
+        app_module._home_page = None
+        client = app_module.app.test_client()
+        cache = {}
+        results[name] = {'first_visit': visit(client, cache), 'repeat_visit': visit(client, cache)}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Page-load bytes and requests')
+    parser.add_argument('--output', help='result file (default bench/results/page-load-<commit>.json)')
+    args = parser.parse_args(argv)
+
+    bundles = dict(assets.BUNDLES)
+    stand_in = not assets.SOCKETIO_CLIENT.exists()
+    if stand_in:
+        empty = Path(tempfile.mkdtemp()) / 'socket.io.min.js'
+        empty.write_text('')
+        bundles['app.js'] = [empty] + bundles['app.js'][1:]
+    built_dir = Path(tempfile.mkdtemp()) / 'dist'
+    assets.build(built_dir, bundles)
+
+    results = run(built_dir)
+    print(f"{'':<10} {'first visit':>26} {'repeat visit':>26}")
+    for name, case in results.items():
+        first, repeat = case['first_visit'], case['repeat_visit']
+        print(f"{name:<10} {first['requests']:>4} req {first['bytes']:>8} B +{first['external_requests']} ext "
+              f"{repeat['requests']:>4} req {repeat['bytes']:>8} B +{repeat['external_requests']} ext")
+    if stand_in:
+        print('(built: Socket.IO client left out, static/vendor/ has no copy)')
+
+    config = {'socketio_client': 'stand-in' if stand_in else assets.SOCKETIO_CLIENT_VERSION}
+    print(f"\nwrote {write_report('page-load', 'page-load', config, results, args.output)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,358 @@
+"""
+Load benchmark for Socket.IO rooms
+
+Starts app.py against the in-memory storage backend (or targets a running server
+with --url), connects many lightweight WebSocket clients spread over rooms, sends
+messages at a fixed rate and reports join latency, end-to-end delivery latency
+percentiles, throughput and server memory. Results are saved as JSON named after
+the current commit so runs can be compared.
+
+  python bench/bench_rooms.py --clients 2000 --rooms 400              # many small rooms
+  python bench/bench_rooms.py --clients 2000 --rooms 1 --rate 20      # one huge room
+  python bench/bench_rooms.py --clients 1000 --rooms 100 --distribution zipf
+  python bench/bench_rooms.py compare results/OLD.json results/NEW.json
+"""
+
+import eventlet
+eventlet.monkey_patch(thread=False)
+
+import argparse
+import json
+import random
+import socket
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from wsproto import ConnectionType, WSConnection
+from wsproto.events import CloseConnection, Message, Ping, RejectConnection, Request, TextMessage
+
+from common import free_port, percentiles, rss_mb, start_server, write_report
+
+# Metrics compared by `compare`, and whether bigger is better
+COMPARED = [
+    ('join_ms.p50', False), ('join_ms.p99', False),
+    ('delivery_ms.p50', False), ('delivery_ms.p95', False), ('delivery_ms.p99', False),
+    ('deliveries_per_sec', True), ('sent_per_sec', True), ('lost', False),
+    ('server_rss_mb.joined', False), ('server_rss_mb.peak', False),
+]
+
+
+def assign_rooms(clients, rooms, distribution, seed=0):
+    """Room name for each client: uniform, zipf (a few big rooms, a long tail) or single"""
+    rng = random.Random(seed)
+    if distribution == 'single' or rooms <= 1:
+        return ['bench-0'] * clients
+    if distribution == 'zipf':
+        weights = [1.0 / (k + 1) ** 1.1 for k in range(rooms)]
+        return [f'bench-{k}' for k in rng.choices(range(rooms), weights=weights, k=clients)]
+    return [f'bench-{i % rooms}' for i in range(clients)]
+
+
+class BenchClient:
+    """Minimal Socket.IO (Engine.IO v4) client over a raw WebSocket, one green thread each"""
+
+    def __init__(self, bench, room):
+        self.bench = bench
+        self.room = room
+        self.sock = None
+        self.ws = None
+        self.handle = None
+        self.join_started = None
+        self.joined = eventlet.event.Event()
+        self._partial = []
+        self._reader = None
+
+    def connect(self, ws_url, timeout=10, rcvbuf=None):
+        url = urlsplit(ws_url)
+        with eventlet.Timeout(timeout):
+            self.sock = socket.socket()  # green: the socket module is monkey patched
+            if rcvbuf:
+                # Set before connecting, while the TCP window can still be sized from it
+                self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+            self.sock.connect((url.hostname, url.port))
+            self.ws = WSConnection(ConnectionType.CLIENT)
+            self.sock.sendall(self.ws.send(Request(host=url.netloc, target=f'{url.path}?{url.query}')))
+            packets = self._packets()
+            packet = next(packets)
+            if packet[0] != '0':
+                raise RuntimeError(f'unexpected open packet: {packet!r}')
+            self._send('40')
+            while not next(packets).startswith('40'):
+                pass
+        self._reader = eventlet.spawn(self._read, packets)
+
+    def _send(self, text):
+        self.sock.sendall(self.ws.send(Message(data=text)))
+
+    def _packets(self):
+        """Engine.IO packets as they arrive; answers WebSocket pings along the way"""
+        while True:
+            data = self.sock.recv(65536)
+            if not data:
+                return
+            self.ws.receive_data(data)
+            for event in self.ws.events():
+                if isinstance(event, TextMessage):
+                    self._partial.append(event.data)
+                    if event.message_finished:
+                        packet, self._partial = ''.join(self._partial), []
+                        yield packet
+                elif isinstance(event, Ping):
+                    self.sock.sendall(self.ws.send(event.response()))
+                elif isinstance(event, (CloseConnection, RejectConnection)):
+                    return
+
+    def emit(self, event, data):
+        self._send('42' + json.dumps([event, data]))
+
+    def join(self):
+        self.join_started = time.perf_counter()
+        self.emit('join', {'room': self.room})
+
+    def close(self):
+        # Stop the reader first so no green thread is left waiting on the closed fd
+        if self._reader is not None:
+            self._reader.kill()
+        if self.sock is not None:
+            self.sock.close()
+
+    def _read(self, packets):
+        try:
+            for packet in packets:
+                if packet == '2':
+                    self._send('3')
+                elif packet.startswith('42'):
+                    event, *args = json.loads(packet[2:])
+                    self.bench.on_event(self, event, args[0] if args else None)
+        except OSError:
+            pass
+
+
+class RoomBench:
+    def __init__(self, args):
+        self.args = args
+        self.clients = []
+        self.room_sizes = {}
+        self.sent = {}
+        self.join_ms = []
+        self.delivery_ms = []
+        self.deliveries = 0
+        self.frames = 0
+        self.expected = 0
+        self.errors = 0
+        self.rss = {}
+        self.rss_peak = None
+        self.server_pid = None
+
+    def on_event(self, client, event, data):
+        now = time.perf_counter()
+        if event == 'message_history' and client.join_started is not None:
+            self.join_ms.append((now - client.join_started) * 1000)
+            client.join_started = None
+        elif event == 'your_handle':
+            client.handle = data
+            client.joined.send()
+        elif event == 'message' and isinstance(data, dict):
+            self.frames += 1
+            self._delivered(data.get('text'), now)
+        elif event == 'message_batch' and isinstance(data, dict):
+            self.frames += 1
+            for message in data.get('messages') or []:
+                self._delivered(message.get('text'), now)
+
+    def _delivered(self, text, now):
+        sent_at = self.sent.get(text)
+        if sent_at is not None:
+            self.deliveries += 1
+            self.delivery_ms.append((now - sent_at) * 1000)
+
+    def _sample_rss(self):
+        while self.server_pid is not None:
+            value = rss_mb(self.server_pid)
+            if value is not None:
+                self.rss_peak = max(self.rss_peak or 0, value)
+            eventlet.sleep(0.5)
+
+    def _connect_one(self, ws_url, room, rcvbuf=None):
+        client = BenchClient(self, room)
+        try:
+            client.connect(ws_url, rcvbuf=rcvbuf)
+            client.join()
+            with eventlet.Timeout(30):
+                client.joined.wait()
+        except (Exception, eventlet.Timeout):
+            self.errors += 1
+            client.close()
+            return None
+        return client
+
+    def connect_all(self, ws_url):
+        rooms = assign_rooms(self.args.clients, self.args.rooms, self.args.distribution, self.args.seed)
+        pool = eventlet.GreenPool(self.args.connect_concurrency)
+        for client in pool.imap(lambda room: self._connect_one(ws_url, room), rooms):
+            if client is not None:
+                self.clients.append(client)
+                self.room_sizes[client.room] = self.room_sizes.get(client.room, 0) + 1
+
+    def message_text(self, seq):
+        return f'bench:{seq}'
+
+    def send_load(self):
+        """Send --rate messages/sec from random clients for --duration seconds"""
+        rng = random.Random(self.args.seed)
+        interval = 1.0 / self.args.rate
+        total = int(self.args.rate * self.args.duration)
+        started = time.perf_counter()
+        for seq in range(total):
+            # Pace against the schedule rather than sleeping a fixed interval, so drift doesn't accumulate
+            delay = started + seq * interval - time.perf_counter()
+            if delay > 0:
+                eventlet.sleep(delay)
+            client = rng.choice(self.clients)
+            text = self.message_text(seq)
+            self.sent[text] = time.perf_counter()
+            self.expected += self.room_sizes[client.room]
+            try:
+                client.emit('message', text)
+            except Exception:
+                self.errors += 1
+        return time.perf_counter() - started
+
+    def drain(self):
+        deadline = time.perf_counter() + self.args.drain
+        while self.deliveries < self.expected and time.perf_counter() < deadline:
+            eventlet.sleep(0.05)
+        return time.perf_counter()
+
+    def run(self):
+        args = self.args
+        proc = None
+        if args.url:
+            base = args.url.rstrip('/')
+        else:
+            port = free_port()
+            proc = start_server(port, dict(kv.split('=', 1) for kv in args.env))
+            self.server_pid = proc.pid
+            base = f'http://127.0.0.1:{port}'
+            self.rss['idle'] = rss_mb(proc.pid)
+            eventlet.spawn_n(self._sample_rss)
+        ws_url = base.replace('http', 'ws', 1) + '/socket.io/?EIO=4&transport=websocket'
+
+        try:
+            connect_started = time.perf_counter()
+            self.connect_all(ws_url)
+            connect_seconds = time.perf_counter() - connect_started
+            if self.server_pid:
+                self.rss['joined'] = rss_mb(self.server_pid)
+            if not self.clients:
+                raise RuntimeError('no clients connected')
+
+            send_started = time.perf_counter()
+            send_seconds = self.send_load()
+            finished = self.drain()
+            if self.server_pid:
+                self.rss['after'] = rss_mb(self.server_pid)
+                self.rss['peak'] = self.rss_peak
+        finally:
+            for client in self.clients:
+                client.close()
+            self.server_pid = None
+            if proc is not None:
+                proc.terminate()
+                proc.wait(10)
+
+        elapsed = finished - send_started
+        return {
+            'clients_connected': len(self.clients),
+            'rooms_used': len(self.room_sizes),
+            'largest_room': max(self.room_sizes.values()),
+            'connect_seconds': round(connect_seconds, 3),
+            'join_ms': percentiles(self.join_ms),
+            'delivery_ms': percentiles(self.delivery_ms),
+            'messages_sent': len(self.sent),
+            'sent_per_sec': round(len(self.sent) / send_seconds, 1) if send_seconds else None,
+            'deliveries': self.deliveries,
+            'frames': self.frames,
+            'expected_deliveries': self.expected,
+            'lost': self.expected - self.deliveries,
+            'deliveries_per_sec': round(self.deliveries / elapsed, 1) if elapsed else None,
+            'errors': self.errors,
+            'server_rss_mb': self.rss,
+        }
+
+
+def lookup(result, dotted):
+    value = result.get('results', {})
+    for part in dotted.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def compare(old_path, new_path, threshold):
+    """Print old vs new for the headline metrics; returns 1 if any regressed past threshold percent"""
+    old = json.loads(Path(old_path).read_text())
+    new = json.loads(Path(new_path).read_text())
+    print(f"{'metric':<24} {old.get('commit', '?'):>12} {new.get('commit', '?'):>12} {'change':>9}")
+    regressed = False
+    for name, higher_is_better in COMPARED:
+        a, b = lookup(old, name), lookup(new, name)
+        if a is None or b is None:
+            continue
+        change = ((b - a) / a * 100) if a else 0.0
+        worse = change < -threshold if higher_is_better else change > threshold
+        regressed = regressed or worse
+        print(f"{name:<24} {a:>12} {b:>12} {change:>+8.1f}%{'  !' if worse else ''}")
+    return 1 if regressed else 0
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Socket.IO room load benchmark')
+    parser.add_argument('--clients', type=int, default=500, help='simulated clients (default 500)')
+    parser.add_argument('--rooms', type=int, default=50, help='rooms to spread them over (default 50)')
+    parser.add_argument('--distribution', choices=['uniform', 'zipf', 'single'], default='uniform')
+    parser.add_argument('--rate', type=float, default=100, help='messages sent per second, all clients (default 100)')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of sending (default 10)')
+    parser.add_argument('--drain', type=float, default=10, help='seconds to wait for outstanding deliveries')
+    parser.add_argument('--connect-concurrency', type=int, default=100, help='clients connecting at once')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--url', help='benchmark a running server instead of starting one')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='extra environment for the started server (repeatable)')
+    parser.add_argument('--output', help='result file (default bench/results/<scenario>-<commit>.json)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == 'compare':
+        parser = argparse.ArgumentParser(description='Compare two benchmark result files')
+        parser.add_argument('old')
+        parser.add_argument('new')
+        parser.add_argument('--threshold', type=float, default=10.0, help='percent change counted as a regression')
+        args = parser.parse_args(argv[1:])
+        return compare(args.old, args.new, args.threshold)
+
+    args = parse_args(argv)
+    results = RoomBench(args).run()
+    config = {k: v for k, v in vars(args).items() if k != 'output'}
+    scenario = f"rooms-{args.distribution}-{args.clients}c-{args.rooms}r"
+    output = write_report('rooms', scenario, config, results, args.output)
+
+    delivery = results['delivery_ms']
+    print(f"{results['clients_connected']} clients in {results['rooms_used']} rooms "
+          f"(largest {results['largest_room']}), {results['errors']} errors")
+    print(f"join p50 {results['join_ms']['p50']} ms, p99 {results['join_ms']['p99']} ms")
+    print(f"delivery p50 {delivery['p50']} ms, p95 {delivery['p95']} ms, p99 {delivery['p99']} ms")
+    print(f"{results['sent_per_sec']} msgs/s sent, {results['deliveries_per_sec']} deliveries/s, "
+          f"{results['lost']} lost")
+    print(f"server RSS {results['server_rss_mb']}")
+    print(f"wrote {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""
+Search benchmark
+Loads one room with 10^5 / 10^6 messages (plus a neighbouring room of the same
+size) into each storage backend, then times first-page searches for a rare word,
+a common word, two words that each occur often but rarely together, and a word
+that never occurs. A newest-first scan of the room ('scan') is timed alongside
+as the no-index baseline.
+
+  python bench/bench_search.py
+  python bench/bench_search.py --messages 100000 1000000 --backends memory sqlite
+  python bench/bench_search.py --backends pg --dsn postgresql://localhost/chat_bench
+"""
+
+import argparse
+import gc
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from common import percentiles, write_report
+
+import search  # app modules; common put the app directory on sys.path
+
+VOCABULARY = 5000
+QUERIES = {
+    'rare': ['zebra'],            # about 1 message in 20000
+    'common': ['w0'],             # the most frequent word
+    'and': ['kiwi', 'mango'],     # each in ~1% of messages, together in ~0.01%
+    'miss': ['unicorn'],
+}
+
+
+def messages(count, room, seed):
+    """Messages with Zipf-distributed words and a few planted ones"""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(VOCABULARY)]
+    words = [f'w{rank}' for rank in range(VOCABULARY)]
+    start = datetime(2026, 1, 1)
+    for i in range(count):
+        text = rng.choices(words, weights, k=rng.randint(4, 12))
+        for planted, rate in (('zebra', 1 / 20000), ('kiwi', 0.01), ('mango', 0.01)):
+            if rng.random() < rate:
+                text.append(planted)
+        yield {'room_id': room, 'user_handle': f'Anon-{i % 997:03x}', 'message_text': ' '.join(text),
+               'created_at': (start + timedelta(milliseconds=i * 50)).isoformat()}
+
+
+def open_backend(name, dsn):
+    if name == 'memory':
+        from memory_backend import MemoryBackend
+        return MemoryBackend(latency_ms=0)
+    if name == 'sqlite':
+        from sqlite_backend import SQLiteBackend
+        return SQLiteBackend(Path(tempfile.mkdtemp(prefix='bench-search-')) / 'chat.sqlite3', green=False)
+    from pg_backend import PostgresBackend
+    backend = PostgresBackend(dsn, pool_size=2, green=False)
+    backend.ensure_schema()
+    return backend
+
+
+def load(backend, rooms, count, batch=5000):
+    started = time.perf_counter()
+    backend.create_rooms(rooms)
+    for seed, room in enumerate(rooms):
+        rows = []
+        for row in messages(count, room, seed):
+            rows.append(row)
+            if len(rows) == batch:
+                backend.save_messages(rows)
+                rows = []
+        if rows:
+            backend.save_messages(rows)
+    return round(time.perf_counter() - started, 1)
+
+
+def scan(backend, room, words, limit, page=1000):
+    """Baseline without an index: page back through the room filtering in Python"""
+    wanted = set(words)
+    found, before = [], None
+    while len(found) < limit:
+        rows = backend.fetch_messages_before(room, before, page)
+        if not rows:
+            break
+        found.extend(r for r in reversed(rows) if wanted <= search.tokens(r['message_text']))
+        before = (rows[0]['created_at'], rows[0]['id'])
+    return found[:limit]
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return percentiles(samples), len(result)
+
+
+def run(sizes, backends, repeat, scan_repeat, limit, dsn):
+    results = {}
+    for name in backends:
+        for size in sizes:
+            backend = open_backend(name, dsn)
+            # Fresh room names each run, since a Postgres database keeps earlier runs' rows
+            room, neighbour = f'big-room-{time.time_ns()}', f'next-room-{time.time_ns()}'
+            load_s = load(backend, [room, neighbour], size)
+            case = {'load_s': load_s}
+            for label, words in QUERIES.items():
+                stats, hits = timed(lambda: backend.search_messages(room, words, None, limit), repeat)
+                case[label] = {'index_ms': stats, 'hits': hits}
+                if scan_repeat:
+                    stats, _ = timed(lambda: scan(backend, room, words, limit), scan_repeat)
+                    case[label]['scan_ms'] = stats
+            results[f'{name}-{size}'] = case
+            print(f"{name:<7} {size:>8} messages (+{size} in another room), loaded in {load_s}s")
+            for label in QUERIES:
+                row = case[label]
+                scan_p50 = row['scan_ms']['p50'] if 'scan_ms' in row else '-'
+                print(f"  {label:<7} hits {row['hits']:>3}  p50 {row['index_ms']['p50']:>9} ms  "
+                      f"p99 {row['index_ms']['p99']:>9} ms  scan p50 {scan_p50} ms")
+            if hasattr(backend, 'close'):
+                backend.close()
+            elif hasattr(backend, 'pool'):
+                backend.pool.closeall()
+            del backend
+            gc.collect()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Per-room search benchmark')
+    parser.add_argument('--messages', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--backends', nargs='+', default=['memory', 'sqlite'], choices=['memory', 'sqlite', 'pg'])
+    parser.add_argument('--dsn', help='Postgres DSN for the pg backend')
+    parser.add_argument('--repeat', type=int, default=50, help='timed searches per query')
+    parser.add_argument('--scan-repeat', type=int, default=3, help='timed baseline scans per query (0 = skip)')
+    parser.add_argument('--limit', type=int, default=search.PAGE_SIZE)
+    parser.add_argument('--output', help='result file (default bench/results/search-<commit>.json)')
+    args = parser.parse_args(argv)
+    if 'pg' in args.backends and not args.dsn:
+        parser.error('--dsn is required for the pg backend')
+
+    results = run(args.messages, args.backends, args.repeat, args.scan_repeat, args.limit, args.dsn)
+    config = {'messages': args.messages, 'backends': args.backends, 'repeat': args.repeat, 'limit': args.limit}
+    print(f"\nwrote {write_report('search', 'search', config, results, args.output)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
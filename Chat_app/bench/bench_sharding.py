@@ -0,0 +1,180 @@
+"""
+Worker scaling benchmark
+Starts the local pub/sub broker and 1, 2, 4 ... app.py workers on it, spreads
+WebSocket clients (and their rooms) evenly over the workers, offers --rate
+messages/sec per worker and reports delivered messages/sec, delivery latency
+and scaling efficiency (throughput with N workers / N x throughput with one).
+Run once with room ownership on and once with it off to compare; --affinity
+connects each room's clients to its owning worker, as a room-aware load
+balancer would, so no message needs forwarding:
+
+  python bench/bench_sharding.py --workers 1 2 4
+  python bench/bench_sharding.py --workers 1 2 4 --affinity
+  python bench/bench_sharding.py --workers 1 2 4 --no-sharding
+  python bench/bench_sharding.py --workers 1 2 4 --env MEMORY_BACKEND_LATENCY_MS=2
+
+Scaling can only be near-linear up to the number of CPU cores the workers and
+the broker get; the report records how many this machine has.
+"""
+
+from bench_rooms import RoomBench, assign_rooms, eventlet  # monkey patches on import
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import requests
+
+from common import APP_DIR, free_port, percentiles, write_report
+from sharding import HashRing
+
+
+def start_broker(port):
+    proc = subprocess.Popen([sys.executable, 'pubsub.py', '--port', str(port)], cwd=APP_DIR,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(0.5)
+    return proc
+
+
+def start_workers(count, broker_url, extra_env):
+    env = dict(os.environ, DB_BACKEND='memory', LOG_LEVEL='WARNING', SOCKETIO_MESSAGE_QUEUE=broker_url,
+               SHARD_HEARTBEAT_MS='200', RATE_LIMIT_SID_RATE='0', RATE_LIMIT_ROOM_RATE='0', RATE_LIMIT_IP_RATE='0')
+    env.update(extra_env)
+    workers = []
+    for i in range(count):
+        port = free_port()
+        proc = subprocess.Popen([sys.executable, 'app.py'], cwd=APP_DIR,
+                                env=dict(env, PORT=str(port), SHARD_NODE_ID=f'w{i}'),
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        workers.append((proc, f'http://127.0.0.1:{port}'))
+    deadline = time.time() + 30
+    for proc, base in workers:
+        while True:
+            try:
+                requests.get(f'{base}/healthz', timeout=1)
+                break
+            except requests.ConnectionError:
+                if time.time() > deadline:
+                    raise RuntimeError(f'worker {base} did not start')
+                eventlet.sleep(0.2)
+    return workers
+
+
+def ring_size(base):
+    for line in requests.get(f'{base}/metrics', timeout=5).text.splitlines():
+        if line.startswith('chat_sharding{stat="nodes"}'):
+            return int(float(line.split()[-1]))
+    return 0
+
+
+class ScalingBench(RoomBench):
+    """RoomBench over several workers: client i connects to worker i mod N"""
+
+    def __init__(self, args, bases):
+        super().__init__(args)
+        self.ws_urls = [base.replace('http', 'ws', 1) + '/socket.io/?EIO=4&transport=websocket' for base in bases]
+
+    def connect_all(self, ws_url=None):
+        rooms = assign_rooms(self.args.clients, self.args.rooms, self.args.distribution, self.args.seed)
+        # Each room's clients are all on one worker: its owner with --affinity, otherwise by room number
+        if self.args.affinity:
+            ring = HashRing([f'w{i}' for i in range(len(self.ws_urls))])
+            worker = lambda room: int(ring.owner(room)[1:])
+        else:
+            worker = lambda room: int(room.rsplit('-', 1)[1]) % len(self.ws_urls)
+        targets = [(self.ws_urls[worker(room)], room) for room in rooms]
+        pool = eventlet.GreenPool(self.args.connect_concurrency)
+        for client in pool.imap(lambda target: self._connect_one(*target), targets):
+            if client is not None:
+                self.clients.append(client)
+                self.room_sizes[client.room] = self.room_sizes.get(client.room, 0) + 1
+
+    def measure(self):
+        connect_started = time.perf_counter()
+        self.connect_all()
+        if not self.clients:
+            raise RuntimeError('no clients connected')
+        connect_seconds = time.perf_counter() - connect_started
+        try:
+            send_started = time.perf_counter()
+            self.send_load()
+            elapsed = self.drain() - send_started
+        finally:
+            for client in self.clients:
+                client.close()
+        return {
+            'clients_connected': len(self.clients),
+            'connect_seconds': round(connect_seconds, 3),
+            'messages_sent': len(self.sent),
+            'deliveries': self.deliveries,
+            'lost': self.expected - self.deliveries,
+            'deliveries_per_sec': round(self.deliveries / elapsed, 1) if elapsed else None,
+            'delivery_ms': percentiles(self.delivery_ms),
+            'errors': self.errors,
+        }
+
+
+def run(args):
+    extra_env = dict(kv.split('=', 1) for kv in args.env)
+    extra_env['ROOM_SHARDING'] = '0' if args.no_sharding else '1'
+    results = {}
+    for count in args.workers:
+        broker_port = free_port()
+        broker = start_broker(broker_port)
+        workers = start_workers(count, f'local://127.0.0.1:{broker_port}', extra_env)
+        try:
+            if not args.no_sharding:
+                deadline = time.time() + 10
+                while any(ring_size(base) != count for _, base in workers) and time.time() < deadline:
+                    eventlet.sleep(0.2)
+            bench_args = argparse.Namespace(**vars(args))
+            bench_args.rate = args.rate * count
+            bench_args.clients = args.clients * count
+            bench_args.rooms = args.rooms * count
+            results[str(count)] = ScalingBench(bench_args, [base for _, base in workers]).measure()
+        finally:
+            for proc, _ in workers:
+                proc.terminate()
+                proc.wait(10)
+            broker.terminate()
+            broker.wait(10)
+    single = results.get('1', {}).get('deliveries_per_sec')
+    for count, result in results.items():
+        if single:
+            result['scaling_efficiency'] = round(result['deliveries_per_sec'] / (int(count) * single), 3)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Throughput scaling with worker count')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=200, help='clients per worker')
+    parser.add_argument('--rooms', type=int, default=40, help='rooms per worker')
+    parser.add_argument('--rate', type=float, default=500, help='messages/sec offered per worker')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--drain', type=float, default=10)
+    parser.add_argument('--no-sharding', action='store_true', help='every worker handles every room (ROOM_SHARDING=0)')
+    parser.add_argument('--affinity', action='store_true', help="connect each room's clients to its owner")
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='extra environment for the workers (repeatable)')
+    parser.add_argument('--output', help='result file (default bench/results/sharding-<commit>.json)')
+    args = parser.parse_args(argv)
+    args.distribution, args.seed, args.connect_concurrency = 'uniform', 0, 100
+
+    results = run(args)
+    print(f"{'workers':>7} {'deliveries/s':>13} {'efficiency':>11} {'p50 ms':>9} {'p99 ms':>9} {'lost':>7}")
+    for count, result in results.items():
+        print(f"{count:>7} {result['deliveries_per_sec']:>13} {result.get('scaling_efficiency', '-'):>11} "
+              f"{result['delivery_ms']['p50']:>9} {result['delivery_ms']['p99']:>9} {result['lost']:>7}")
+
+    config = {k: v for k, v in vars(args).items() if k != 'output'}
+    config['cpus'] = os.cpu_count()
+    scenario = 'sharding-off' if args.no_sharding else 'sharding-affinity' if args.affinity else 'sharding'
+    print(f"\nwrote {write_report('sharding', scenario, config, results, args.output)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""
+Slow-consumer benchmark
+Puts fast clients and clients that stop reading right after they join into one
+room, sends --rate messages/sec of --size characters for --duration seconds, and
+samples the server's memory every half second. Fast clients report delivery
+latency; slow clients only ever fill their sockets. Each scenario is one
+OUTBOUND_POLICY, plus 'off' (OUTBOUND_QUEUE_MAX=0: frames go straight to the
+unbounded Engine.IO queues), for each count of slow clients:
+
+  python bench/bench_slow_clients.py
+  python bench/bench_slow_clients.py --slow 0 20 100 --policies off drop_oldest resync disconnect
+
+With bounded queues the server's memory should not grow with the number of slow
+clients or the length of the run; 'off' grows with both.
+"""
+
+from bench_rooms import RoomBench, eventlet  # monkey patches on import
+
+import argparse
+import sys
+import time
+
+import requests
+
+from common import free_port, rss_mb, start_server, write_report
+
+ROOM = 'bench-slow'
+
+
+class SlowClientBench(RoomBench):
+    """One room of --clients fast clients and `slow` clients that stop reading after joining"""
+
+    def __init__(self, args, slow):
+        super().__init__(args)
+        self.slow = slow
+        self.slow_clients = []
+        self.resyncs = 0
+        self.rss_series = []
+
+    def on_event(self, client, event, data):
+        if event == 'resync':
+            self.resyncs += 1
+        super().on_event(client, event, data)
+
+    def _sample_rss(self):
+        started = time.perf_counter()
+        while self.server_pid is not None:
+            value = rss_mb(self.server_pid)
+            if value is not None:
+                self.rss_peak = max(self.rss_peak or 0, value)
+                self.rss_series.append((round(time.perf_counter() - started, 1), value))
+            eventlet.sleep(0.5)
+
+    def _connect_slow(self, ws_url):
+        # A small receive buffer, so the kernel holds little and the backlog stays on the server
+        client = self._connect_one(ws_url, ROOM, rcvbuf=self.args.rcvbuf)
+        if client is not None:
+            # From here on nothing reads this socket
+            client._reader.kill()
+        return client
+
+    def connect_all(self, ws_url):
+        pool = eventlet.GreenPool(self.args.connect_concurrency)
+        for client in pool.imap(lambda room: self._connect_one(ws_url, room), [ROOM] * self.args.clients):
+            if client is not None:
+                self.clients.append(client)
+        # Deliveries are only expected to (and counted from) the fast clients
+        self.room_sizes[ROOM] = len(self.clients)
+        for client in pool.imap(lambda _: self._connect_slow(ws_url), range(self.slow)):
+            if client is not None:
+                self.slow_clients.append(client)
+
+    def message_text(self, seq):
+        text = super().message_text(seq)
+        return text + 'x' * max(0, self.args.size - len(text))
+
+    def run(self):
+        try:
+            return super().run()
+        finally:
+            for client in self.slow_clients:
+                client.close()
+
+
+def outbound_stats(base):
+    """chat_outbound{stat=...} values from /metrics"""
+    stats = {}
+    for line in requests.get(f'{base}/metrics', timeout=5).text.splitlines():
+        if line.startswith('chat_outbound{'):
+            name = line.split('stat="', 1)[1].split('"', 1)[0]
+            stats[name] = float(line.rsplit(' ', 1)[1])
+    return stats
+
+
+def scenario_env(policy, queue_max):
+    if policy == 'off':
+        return {'OUTBOUND_QUEUE_MAX': '0'}
+    return {'OUTBOUND_QUEUE_MAX': str(queue_max), 'OUTBOUND_POLICY': policy}
+
+
+def run_one(args, policy, slow):
+    port = free_port()
+    base = f'http://127.0.0.1:{port}'
+    env = dict(scenario_env(policy, args.queue_max), **dict(kv.split('=', 1) for kv in args.env))
+    proc = start_server(port, env)
+    bench_args = argparse.Namespace(**vars(args), url=base, distribution='single', rooms=1, seed=0)
+    bench = SlowClientBench(bench_args, slow)
+    bench.server_pid = proc.pid
+    eventlet.spawn_n(bench._sample_rss)
+    try:
+        idle = rss_mb(proc.pid)
+        result = bench.run()
+        stats = outbound_stats(base) if policy != 'off' else {}
+        series = bench.rss_series
+        return {
+            'slow_clients': len(bench.slow_clients),
+            'fast_clients': result['clients_connected'],
+            'delivery_ms': result['delivery_ms'],
+            'lost': result['lost'],
+            'resync_events': bench.resyncs,
+            'server_rss_mb': {'idle': idle, 'joined': result['server_rss_mb'].get('joined'),
+                              'peak': bench.rss_peak, 'end': series[-1][1] if series else None},
+            'rss_series': series,
+            'outbound': stats,
+        }
+    finally:
+        bench.server_pid = None
+        proc.terminate()
+        proc.wait(10)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Slow-consumer benchmark')
+    parser.add_argument('--clients', type=int, default=50, help='fast clients (default 50)')
+    parser.add_argument('--slow', type=int, nargs='+', default=[0, 20, 100], help='slow client counts to run')
+    parser.add_argument('--policies', nargs='+', default=['off', 'drop_oldest', 'resync', 'disconnect'],
+                        choices=['off', 'drop_oldest', 'resync', 'disconnect'])
+    parser.add_argument('--queue-max', type=int, default=256, help='OUTBOUND_QUEUE_MAX for the bounded runs')
+    parser.add_argument('--rate', type=float, default=50, help='messages sent per second (default 50)')
+    parser.add_argument('--size', type=int, default=2000, help='characters per message (default 2000)')
+    parser.add_argument('--duration', type=float, default=20, help='seconds of sending (default 20)')
+    parser.add_argument('--drain', type=float, default=5, help='seconds to wait for outstanding deliveries')
+    parser.add_argument('--rcvbuf', type=int, default=4096, help='receive buffer of the slow clients, bytes')
+    parser.add_argument('--connect-concurrency', type=int, default=50)
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='extra environment for the started server (repeatable)')
+    parser.add_argument('--output', help='result file (default bench/results/slow-clients-<commit>.json)')
+    args = parser.parse_args(argv)
+
+    results = {}
+    print(f"{'policy':<12} {'slow':>5} {'rss idle':>9} {'joined':>7} {'peak':>7} {'end':>7} "
+          f"{'fast p50':>9} {'fast p99':>9} {'lost':>6} {'dropped':>8}")
+    for policy in args.policies:
+        for slow in args.slow:
+            run_args = argparse.Namespace(**{k: v for k, v in vars(args).items()
+                                             if k not in ('slow', 'policies', 'output')})
+            case = run_one(run_args, policy, slow)
+            results[f'{policy}-{slow}'] = case
+            rss, delivery = case['server_rss_mb'], case['delivery_ms']
+            print(f"{policy:<12} {case['slow_clients']:>5} {rss['idle']:>9} {rss['joined']:>7} {rss['peak']:>7} "
+                  f"{rss['end']:>7} {delivery['p50']:>9} {delivery['p99']:>9} {case['lost']:>6} "
+                  f"{int(case['outbound'].get('dropped', 0)):>8}")
+
+    config = {k: v for k, v in vars(args).items() if k != 'output'}
+    print(f"\nwrote {write_report('slow-clients', 'slow-clients', config, results, args.output)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Wire-format benchmark for history payloads
+
+Builds message_history payloads of 50 and 500 messages in each format (the old
+select('*') rows, projected json, compact and msgpack), encodes them the way
+python-socketio puts them on the wire, and reports bytes per payload plus the
+server-side encode and client-side decode time.
+
+  python bench/bench_wire.py
+  python bench/bench_wire.py --sizes 50 500 2000 --repeat 500
+"""
+
+import argparse
+import random
+import string
+import sys
+import time
+from datetime import datetime, timedelta
+
+from socketio import packet
+
+from common import write_report
+
+import wire  # app module; common put the app directory on sys.path
+
+
+def sample_rows(count, room='general-' + 'x' * 24, seed=0):
+    """Rows shaped like the Supabase messages table"""
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1)
+    rows = []
+    for i in range(count):
+        created = (start + timedelta(seconds=i * 7)).isoformat()
+        rows.append({
+            'id': 100000 + i,
+            'room_id': room,
+            'user_handle': 'Anon-' + ''.join(rng.choices('0123456789abcdef', k=6)),
+            'message_text': ''.join(rng.choices(string.ascii_letters + ' ', k=rng.randint(10, 120))),
+            'created_at': created,
+            'updated_at': created,
+        })
+    return rows
+
+
+def legacy_payload(room, rows, cursor):
+    # What message_history sent before: every column of every row
+    return {"messages": rows, "cursor": cursor}
+
+
+def encode(payload):
+    """Bytes python-socketio writes for an emit of this payload (text frame plus any binary attachments)"""
+    encoded = packet.Packet(packet.EVENT, data=['message_history', payload]).encode()
+    parts = encoded if isinstance(encoded, list) else [encoded]
+    return [part.encode() if isinstance(part, str) else part for part in parts]
+
+
+def decode(parts):
+    """Client-side work: parse the frame(s) and turn the payload back into messages"""
+    pkt = packet.Packet(encoded_packet=parts[0].decode())
+    for attachment in parts[1:]:
+        pkt.add_attachment(attachment)
+    payload = pkt.data[1]
+    if 'rows' in payload or payload.get('format') == 'msgpack':
+        return wire.decode_history(payload)[1]
+    return payload['messages']
+
+
+def per_call_us(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return round((time.perf_counter() - started) / repeat * 1e6, 1)
+
+
+def run(sizes, repeat):
+    formats = {'legacy': None, 'json': 'json', 'compact': 'compact'}
+    if wire.msgpack is not None:
+        formats['msgpack'] = 'msgpack'
+    results = {}
+    for size in sizes:
+        rows = sample_rows(size)
+        room = rows[0]['room_id']
+        cursor = 'eyJjdXJzb3IiOiAxfQ'
+        by_format = {}
+        for name, fmt in formats.items():
+            if fmt is None:
+                build = lambda: legacy_payload(room, rows, cursor)
+            else:
+                build = lambda fmt=fmt: wire.encode_history(room, rows, cursor, fmt)
+            parts = encode(build())
+            assert len(decode(parts)) == size
+            by_format[name] = {
+                'bytes': sum(len(part) for part in parts),
+                'encode_us': per_call_us(lambda: encode(build()), repeat),
+                'decode_us': per_call_us(lambda: decode(parts), repeat),
+            }
+        base = by_format['legacy']['bytes']
+        for stats in by_format.values():
+            stats['bytes_vs_legacy'] = round(stats['bytes'] / base, 3)
+        results[str(size)] = by_format
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='History wire-format benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 500])
+    parser.add_argument('--repeat', type=int, default=200, help='encodes/decodes timed per format')
+    parser.add_argument('--output', help='result file (default bench/results/wire-<commit>.json)')
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.repeat)
+    if wire.msgpack is None:
+        print("msgpack is not installed; skipping the binary format (pip install msgpack)")
+    for size, by_format in results.items():
+        print(f"\n{size} messages")
+        print(f"{'format':<10} {'bytes':>9} {'vs legacy':>10} {'encode us':>10} {'decode us':>10}")
+        for name, stats in by_format.items():
+            print(f"{name:<10} {stats['bytes']:>9} {stats['bytes_vs_legacy']:>10} "
+                  f"{stats['encode_us']:>10} {stats['decode_us']:>10}")
+
+    config = {'sizes': args.sizes, 'repeat': args.repeat, 'msgpack': wire.msgpack is not None}
+    print(f"\nwrote {write_report('wire', 'wire', config, results, args.output)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
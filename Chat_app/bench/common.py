@@ -0,0 +1,104 @@
+"""
+Helpers shared by the benchmarks: percentiles, result files keyed by commit, starting app.py
+"""
+
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import requests
+
+APP_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+# Benchmarks import the app's modules (wire, db, ...) directly
+if str(APP_DIR) not in sys.path:
+    sys.path.insert(0, str(APP_DIR))
+
+
+def percentiles(samples):
+    """p50/p95/p99/max/mean of a list of millisecond samples"""
+    if not samples:
+        return {'count': 0, 'p50': None, 'p95': None, 'p99': None, 'max': None, 'mean': None}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+    return {
+        'count': len(ordered),
+        'p50': pick(0.50),
+        'p95': pick(0.95),
+        'p99': pick(0.99),
+        'max': round(ordered[-1], 3),
+        'mean': round(sum(ordered) / len(ordered), 3),
+    }
+
+
+def git_commit():
+    try:
+        sha = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_DIR, text=True).strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                             cwd=APP_DIR, text=True).strip())
+        return sha, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+
+
+def write_report(benchmark, scenario, config, results, output=None):
+    """Save a result file named after the scenario and commit; returns its path"""
+    commit, dirty = git_commit()
+    report = {
+        'benchmark': benchmark,
+        'commit': commit,
+        'dirty': dirty,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'config': config,
+        'results': results,
+    }
+    path = Path(output) if output else RESULTS_DIR / f"{scenario}-{commit}{'-dirty' if dirty else ''}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2) + '\n')
+    return path
+
+
+def rss_mb(pid):
+    """Resident memory of a process from /proc (Linux), or None"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, extra_env):
+    # Rate limits are off unless a scenario sets them, so the offered load is what gets measured
+    env = dict(os.environ, PORT=str(port), DB_BACKEND='memory', LOG_LEVEL='WARNING',
+               RATE_LIMIT_SID_RATE='0', RATE_LIMIT_ROOM_RATE='0', RATE_LIMIT_IP_RATE='0')
+    env.update(extra_env)
+    proc = subprocess.Popen([sys.executable, 'app.py'], cwd=APP_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(f'http://127.0.0.1:{port}/', timeout=1)
+            return proc
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f'server on port {port} did not start')
@@ -0,0 +1,107 @@
+"""
+Circuit breaker for calls to the hosted database
+After enough consecutive failures the breaker opens and calls fail fast instead
+of each waiting out a timeout; after a cool-down one probe call is let through
+(half-open) and its result closes or re-opens the breaker. A probe whose result
+never comes back is given up on after another cool-down and a new one let through.
+
+DB_BREAKER_FAILURES     consecutive failures that open the breaker (default 5; 0 = never open)
+DB_BREAKER_RESET_MS     how long the breaker stays open before a probe (default 10000)
+DB_BREAKER_RESET_MAX_MS cool-down cap; it doubles each time a probe fails (default 60000)
+"""
+
+import os
+import threading
+import time
+
+import applog
+
+log = applog.get_logger('breaker')
+
+FAILURES = int(os.getenv('DB_BREAKER_FAILURES', '5'))
+RESET_MS = float(os.getenv('DB_BREAKER_RESET_MS', '10000'))
+RESET_MAX_MS = float(os.getenv('DB_BREAKER_RESET_MAX_MS', '60000'))
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+# Gauge value per state (chat_db_breaker_state)
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe"""
+
+    def __init__(self, name, failures=FAILURES, reset_ms=RESET_MS, reset_max_ms=RESET_MAX_MS, clock=time.monotonic):
+        self.name = name
+        self.failures = failures
+        self.reset = reset_ms / 1000.0
+        self.reset_max = max(reset_max_ms, reset_ms) / 1000.0
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self._consecutive = 0
+        self._cooldown = self.reset
+        self._retry_at = 0.0
+        self._probing = False
+        self._probe_at = 0.0
+
+        # Counters
+        self.opened = 0
+        self.rejected = 0
+
+    def allow(self):
+        """True if a call may go ahead; False means fail fast"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and self._clock() >= self._retry_at:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and self._probing and self._clock() >= self._probe_at + self._cooldown:
+                # The probe's caller raised before reporting; without this the breaker stays half-open for good
+                self._probing = False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                self._probe_at = self._clock()
+                return True
+            self.rejected += 1
+            return False
+
+    def is_open(self):
+        """True while calls are being rejected (open and still cooling down)"""
+        return self.state == OPEN and self._clock() < self._retry_at
+
+    def success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                log.info("Circuit closed", extra={'breaker': self.name})
+            self.state = CLOSED
+            self._consecutive = 0
+            self._cooldown = self.reset
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self.state == HALF_OPEN:
+                # The probe failed: back off further before the next one
+                self._cooldown = min(self.reset_max, self._cooldown * 2)
+                self._open()
+            elif self.state == CLOSED and self.failures > 0 and self._consecutive >= self.failures:
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened += 1
+        self._probing = False
+        self._retry_at = self._clock() + self._cooldown
+        log.warning("Circuit open", extra={'breaker': self.name, 'failures': self._consecutive,
+                                           'retry_in_s': round(self._cooldown, 3)})
+
+    def stats(self):
+        """Snapshot of breaker state and counters"""
+        return {
+            'state': STATE_VALUES[self.state],
+            'consecutive_failures': self._consecutive,
+            'opened': self.opened,
+            'rejected': self.rejected,
+        }
@@ -0,0 +1,145 @@
+"""
+Per-room message coalescing
+Collects a busy room's messages for a few milliseconds and broadcasts them as one frame
+
+The first message in a quiet room goes out immediately. Messages that arrive
+within the window after a send are held and flushed together when the window
+closes (or as soon as max_batch is reached), so no message waits longer than
+one window.
+
+MESSAGE_COALESCE_WINDOW_MS  batching window (default 0 = off, every message sent on its own)
+MESSAGE_COALESCE_MAX_BATCH  messages per frame before it is sent early (default 50)
+"""
+
+import os
+import threading
+import time
+
+import applog
+
+log = applog.get_logger('coalescer')
+
+WINDOW_MS = float(os.getenv('MESSAGE_COALESCE_WINDOW_MS', '0'))
+MAX_BATCH = int(os.getenv('MESSAGE_COALESCE_MAX_BATCH', '50'))
+
+# Idle room entries are swept once this many rooms are tracked
+SWEEP_ROOMS = 1024
+
+
+def _thread_spawn(fn):
+    threading.Thread(target=fn, daemon=True).start()
+
+
+class _Room:
+    __slots__ = ('last_sent', 'pending', 'scheduled')
+
+    def __init__(self):
+        self.last_sent = 0.0
+        self.pending = []
+        self.scheduled = False
+
+
+class RoomCoalescer:
+    """Throttles per-room broadcasts to one frame per window"""
+
+    def __init__(self, send_one, send_batch, window_ms=WINDOW_MS, max_batch=MAX_BATCH,
+                 spawn=_thread_spawn, sleep=time.sleep):
+        # send_one(room, item) for a lone message, send_batch(room, items) for a frame of them
+        self.send_one = send_one
+        self.send_batch = send_batch
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._spawn = spawn
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._rooms = {}
+
+        # Counters
+        self.immediate = 0
+        self.coalesced = 0
+        self.batches = 0
+
+    @property
+    def enabled(self):
+        return self.window > 0
+
+    def start(self, socketio):
+        """Run flush timers as Socket.IO background tasks"""
+        self._spawn = socketio.start_background_task
+        self._sleep = socketio.sleep
+
+    def submit(self, room, item):
+        """Broadcast item to room now, or hold it for the room's next frame"""
+        if not self.enabled:
+            self.immediate += 1
+            self.send_one(room, item)
+            return
+
+        batch = None
+        now = time.monotonic()
+        with self._lock:
+            state = self._rooms.get(room)
+            if state is None:
+                if len(self._rooms) >= SWEEP_ROOMS:
+                    self._sweep(now)
+                state = self._rooms[room] = _Room()
+
+            if not state.pending and now - state.last_sent >= self.window:
+                state.last_sent = now
+                self.immediate += 1
+                send_now = True
+            else:
+                send_now = False
+                state.pending.append(item)
+                if len(state.pending) >= self.max_batch:
+                    batch, state.pending = state.pending, []
+                    state.last_sent = now
+                elif not state.scheduled:
+                    state.scheduled = True
+                    delay = max(0.0, state.last_sent + self.window - now)
+                    self._spawn(lambda: self._flush_later(room, delay))
+
+        if send_now:
+            self.send_one(room, item)
+        elif batch:
+            self._send(room, batch)
+
+    def _flush_later(self, room, delay):
+        self._sleep(delay)
+        with self._lock:
+            state = self._rooms.get(room)
+            if state is None:
+                return
+            state.scheduled = False
+            batch, state.pending = state.pending, []
+            if batch:
+                state.last_sent = time.monotonic()
+        if batch:
+            self._send(room, batch)
+
+    def _send(self, room, batch):
+        self.batches += 1
+        self.coalesced += len(batch)
+        try:
+            if len(batch) == 1:
+                self.send_one(room, batch[0])
+            else:
+                self.send_batch(room, batch)
+        except Exception as e:
+            log.error("Batch broadcast failed", extra={'room': room, 'messages': len(batch), 'error': str(e)})
+
+    def _sweep(self, now):
+        idle = [room for room, state in self._rooms.items()
+                if not state.pending and not state.scheduled and now - state.last_sent >= self.window]
+        for room in idle:
+            del self._rooms[room]
+
+    def stats(self):
+        """Snapshot of coalescer counters"""
+        return {
+            'immediate': self.immediate,
+            'coalesced': self.coalesced,
+            'batches': self.batches,
+            'avg_batch': round(self.coalesced / self.batches, 2) if self.batches else 0.0,
+            'rooms': len(self._rooms),
+        }
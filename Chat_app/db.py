@@ -1,176 +1,712 @@
 """
 Supabase database module for chat app
 Handles message storage and retrieval
+
+DB_BACKEND picks the storage path: 'supabase' (default, supabase client with a
+PostgREST fallback), 'postgres' (direct pooled connection, see pg_backend.py),
+'sqlite' (embedded database file, see sqlite_backend.py) or 'memory'
+(in-process stand-in for benchmarks, see memory_backend.py).
+
+The Supabase path shares one keep-alive HTTP session and a circuit breaker
+(see breaker.py) between the client and REST calls, so an outage fails fast:
+SUPABASE_CONNECT_TIMEOUT / SUPABASE_READ_TIMEOUT  per-call timeouts in seconds (default 3 / 5)
+SUPABASE_HTTP_POOL_SIZE                          keep-alive connections kept open (default 10)
+
+Storage is set up on first use: importing this module does no I/O and doesn't
+import the Supabase client. app.py runs warm_up() on a background task so it is
+usually ready before the first request needs it; status() says whether it is.
+DB_INIT_RETRY_MS  how long after a failed setup the next call tries again (default 5000)
 """
 
+import base64
+import importlib
+import json
 import os
-from supabase import create_client, Client
-from datetime import datetime
-from dotenv import load_dotenv
-from pathlib import Path
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
 import requests
+from requests.adapters import HTTPAdapter
 
-# Load environment variables from .env file (in parent directory)
-env_path = Path(__file__).parent.parent / '.env'
-load_dotenv(env_path)
+import applog
+import metrics
+import search
+from breaker import CircuitBreaker
 
-# Initialize Supabase client
+log = applog.get_logger('db')
+
+# Environment variables from the .env file are loaded by applog
+
+# Supabase client
 SUPABASE_URL = os.getenv('SUPABASE_URL', '')
 SUPABASE_ANON_KEY = os.getenv('SUPABASE_ANON_KEY', '')
 
-supabase: Client = None
+# Direct Postgres backend
+DB_BACKEND = os.getenv('DB_BACKEND', 'supabase').strip().lower()
+DATABASE_URL = os.getenv('DATABASE_URL', '')
+
+supabase = None  # supabase.Client, created on first use
+backend = None
+
+HTTP_TIMEOUT = (float(os.getenv('SUPABASE_CONNECT_TIMEOUT', '3')), float(os.getenv('SUPABASE_READ_TIMEOUT', '5')))
+HTTP_POOL_SIZE = int(os.getenv('SUPABASE_HTTP_POOL_SIZE', '10'))
+
+def _session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+_http = _session()
+breaker = CircuitBreaker('supabase')
+
+# Rooms known to exist in the rooms table (LRU-bounded), so they're never re-inserted
+KNOWN_ROOMS_MAX = int(os.getenv('KNOWN_ROOMS_MAX', '10000'))
+_known_rooms = OrderedDict()
+
+def _lock():
+    """A lock greenlets can wait on without stalling the eventlet hub (a plain lock without eventlet)"""
+    try:
+        from eventlet.semaphore import Semaphore
+    except ImportError:
+        return threading.Lock()
+    return Semaphore()
+
+# Lazy setup (see ensure_db)
+INIT_RETRY_MS = float(os.getenv('DB_INIT_RETRY_MS', '5000'))
+COLD, WARMING, READY, FAILED = 'cold', 'warming', 'ready', 'failed'
+_state = COLD
+_init_error = None
+_init_retry_at = 0.0
+_init_lock = _lock()
+warm_up_ms = None
+
+def _payload(text):
+    """Response body as a log field, only when LOG_PAYLOADS is on"""
+    return {'body': text} if applog.LOG_PAYLOADS else {'body_bytes': len(text or '')}
+
+def configured_backend():
+    """The storage the environment asks for, without setting it up: memory, sqlite, postgres, supabase or None"""
+    if DB_BACKEND in ('memory', 'sqlite'):
+        return DB_BACKEND
+    if DB_BACKEND == 'postgres':
+        return 'postgres' if DATABASE_URL else None
+    return 'supabase' if SUPABASE_URL and SUPABASE_ANON_KEY else None
 
 def init_db():
-    """Initialize Supabase connection"""
-    global supabase
+    """Set up the configured storage backend now; True if one is in use"""
+    with _init_lock:
+        return _init()
+
+def ensure_db():
+    """Set up storage on first use, waiting for a warm-up that is already under way"""
+    if _state == READY or backend is not None or supabase is not None:
+        return
+    with _init_lock:
+        # Another greenlet may have finished (or failed) setting up while this one waited
+        if _state == READY or (_state == FAILED and time.monotonic() < _init_retry_at):
+            return
+        try:
+            _init()
+        except Exception as e:
+            log.warning("Database initialization failed", extra={'error': str(e), 'retry_in_s': INIT_RETRY_MS / 1000})
+
+def _init():
+    global _state, _init_error, _init_retry_at
+    _state = WARMING
+    try:
+        enabled = _connect()
+    except Exception as e:
+        _state, _init_error = FAILED, str(e)
+        _init_retry_at = time.monotonic() + INIT_RETRY_MS / 1000
+        raise
+    _state, _init_error = READY, None
+    return enabled
+
+def _connect():
+    global supabase, backend
+    if DB_BACKEND == 'memory':
+        from memory_backend import MemoryBackend
+        backend = MemoryBackend()
+        log.info("In-memory storage backend initialized")
+        return True
+    if DB_BACKEND == 'sqlite':
+        from sqlite_backend import SQLiteBackend
+        backend = SQLiteBackend()
+        log.info("SQLite backend initialized", extra={'path': backend.path})
+        return True
+    if DB_BACKEND == 'postgres':
+        if DATABASE_URL:
+            from pg_backend import PostgresBackend
+            backend = PostgresBackend(DATABASE_URL)
+            log.info("PostgreSQL backend initialized")
+            return True
+        log.warning("DB_BACKEND=postgres but DATABASE_URL is not set - running in memory mode")
+        return False
     if SUPABASE_URL and SUPABASE_ANON_KEY:
+        # Imported here: the client stack is most of this module's import time
+        from supabase import create_client
         supabase = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-        print("[DB] Supabase initialized")
+        # supabase 1.0 doesn't pass a timeout through to its PostgREST client
+        import httpx
+        supabase.postgrest.session.timeout = httpx.Timeout(HTTP_TIMEOUT[1], connect=HTTP_TIMEOUT[0])
+        log.info("Supabase initialized")
         return True
     else:
-        print("[DB] Supabase not configured - running in memory mode")
+        log.warning("Supabase not configured - running in memory mode (set DB_BACKEND=sqlite to keep history in a local file)")
         return False
 
 def is_enabled():
-    """Check if Supabase is enabled"""
-    return supabase is not None
+    """Check if a database is enabled (setting it up on first use)"""
+    ensure_db()
+    return supabase is not None or backend is not None
 
-def save_message(room_id: str, user_handle: str, message_text: str):
-    """Save a message to the database"""
+def ping():
+    """One cheap read, which also opens a connection later calls reuse; True if it worked"""
+    return list_rooms('', 1) is not None
+
+def warm_up(call=None):
+    """Set up storage and make one round trip, so the first request finds both done.
+
+    call runs the blocking parts on the Supabase path (importing the client,
+    the HTTP round trip); start_warm_up passes eventlet's tpool.execute.
+    """
+    global warm_up_ms
+    call = call or (lambda fn, *args: fn(*args))
+    started = time.perf_counter()
+    if configured_backend() == 'supabase' and supabase is None:
+        call(importlib.import_module, 'supabase')
+    ensure_db()
     if not is_enabled():
-        return None
-    
-    data = {
+        log.info("No database configured - running in memory mode")
+        return False
+    ok = ping() if backend is not None else call(ping)
+    warm_up_ms = round((time.perf_counter() - started) * 1000, 1)
+    log.info("Storage warmed up", extra={'backend': status()['backend'], 'ok': ok, 'ms': warm_up_ms})
+    return ok
+
+def start_warm_up(socketio):
+    """Run warm_up on a Socket.IO background task"""
+    call = None
+    if configured_backend() == 'supabase' and getattr(socketio, 'async_mode', None) == 'eventlet':
+        # Without monkey patching the import and REST call would stall the hub; run them on a real thread
+        from eventlet import patcher, tpool
+        if not patcher.is_monkey_patched('socket'):
+            call = tpool.execute
+    socketio.start_background_task(warm_up, call)
+
+def status():
+    """Setup state for the readiness endpoint; ready once storage is set up and not failing fast"""
+    name = backend.name if backend is not None else ('supabase' if supabase is not None else configured_backend())
+    ready = _state == READY or backend is not None or supabase is not None
+    return {
+        'ready': ready and is_available(),
+        'state': READY if ready else _state,
+        'backend': name,
+        'available': is_available(),
+        'warm_up_ms': warm_up_ms,
+        'error': _init_error,
+    }
+
+def is_available():
+    """False while the Supabase breaker is open and calls would be rejected without trying"""
+    return backend is not None or not breaker.is_open()
+
+def _rejected(op):
+    """True (and counted) when the breaker says to fail fast instead of calling Supabase"""
+    if breaker.allow():
+        return False
+    metrics.DB_REJECTED.inc(op=op)
+    return True
+
+def _execute(query):
+    """Run a supabase client query, feeding the outcome to the breaker"""
+    try:
+        response = query.execute()
+    except Exception:
+        breaker.failure()
+        raise
+    breaker.success()
+    return response
+
+def _rest(method, table, **kwargs):
+    """PostgREST call on the shared keep-alive session; transport errors, 429 and 5xx count against the breaker"""
+    try:
+        resp = _http.request(method, f"{SUPABASE_URL.rstrip('/')}/rest/v1/{table}", timeout=HTTP_TIMEOUT, **kwargs)
+    except requests.RequestException:
+        breaker.failure()
+        raise
+    if resp.status_code >= 500 or resp.status_code == 429:
+        breaker.failure()
+    else:
+        breaker.success()
+    return resp
+
+def make_message(room_id: str, user_handle: str, message_text: str):
+    """Build a message row, stamped with the time it was sent"""
+    return {
         'room_id': str(room_id).strip(),
         'user_handle': str(user_handle).strip(),
-        'message_text': str(message_text).strip()
+        'message_text': str(message_text).strip(),
+        'created_at': datetime.utcnow().isoformat()
     }
+
+def save_message(room_id: str, user_handle: str, message_text: str):
+    """Save a message to the database"""
+    if not is_enabled():
+        return None
+
+    return save_messages([make_message(room_id, user_handle, message_text)])
+
+def save_messages(rows: list):
+    """Save a batch of message rows with a single multi-row insert.
+
+    Returns the inserted rows (or response) on success and None on failure.
+    """
+    if not is_enabled():
+        return []
+    if not rows:
+        return []
+    if backend is not None:
+        with metrics.DB_SECONDS.time(op='save_messages', path=backend.name):
+            return backend.save_messages(rows)
+    if _rejected('save_messages'):
+        return None
+
     # First attempt: supabase client
-    if is_enabled():
-        try:
-            response = supabase.table('messages').insert([data]).execute()
-            resp_data = getattr(response, 'data', None)
-            resp_error = getattr(response, 'error', None)
-            print(f"[DB] Insert response raw: {response!r}")
-            print(f"[DB] Insert response data: {resp_data}")
-            print(f"[DB] Insert response error: {resp_error}")
-            if resp_error:
-                print(f"[DB] Error saving message (supabase error): {resp_error}")
-            else:
-                print(f"[DB] Message saved (client): {user_handle} in {room_id}")
-                return response
-        except Exception as e:
-            print(f"[DB] Exception saving message with client: {e}")
+    try:
+        with metrics.DB_SECONDS.time(op='save_messages', path='client'):
+            response = _execute(supabase.table('messages').insert(rows))
+        resp_data = getattr(response, 'data', None)
+        resp_error = getattr(response, 'error', None)
+        if resp_error:
+            log.error("Error saving messages (supabase error)", extra={'error': str(resp_error), 'path': 'client'})
+        else:
+            log.debug("Saved messages", extra={'rows': len(rows), 'path': 'client'})
+            return resp_data if resp_data is not None else response
+    except Exception as e:
+        log.warning("Exception saving messages with client", extra={'error': str(e), 'path': 'client'})
 
     # Fallback: use direct REST call to PostgREST
+    metrics.DB_FALLBACKS.inc(op='save_messages')
+    if _rejected('save_messages'):
+        return None
     try:
-        url = f"{SUPABASE_URL.rstrip('/')}/rest/v1/messages"
         headers = {
             'apikey': SUPABASE_ANON_KEY,
             'Authorization': f'Bearer {SUPABASE_ANON_KEY}',
             'Content-Type': 'application/json',
             'Prefer': 'return=representation'
         }
-        resp = requests.post(url, headers=headers, json=[data], timeout=10)
-        print(f"[DB][REST] POST {url} status={resp.status_code} body={resp.text}")
+        with metrics.DB_SECONDS.time(op='save_messages', path='rest'):
+            resp = _rest('POST', 'messages', headers=headers, json=rows)
+        log.debug("Saved messages", extra={'rows': len(rows), 'status': resp.status_code, 'path': 'rest'})
         if resp.status_code in (200, 201):
             try:
                 return resp.json()
             except Exception:
                 return resp.text
         else:
-            print(f"[DB][REST] Failed to save message: {resp.status_code} {resp.text}")
+            log.error("Failed to save messages", extra={'status': resp.status_code, 'path': 'rest', **_payload(resp.text)})
+            metrics.ERRORS.inc(where='db.save_messages')
             return None
     except Exception as e:
-        print(f"[DB][REST] Exception saving message: {e}")
+        log.error("Exception saving messages", extra={'error': str(e), 'path': 'rest'})
+        metrics.ERRORS.inc(where='db.save_messages')
         return None
 
 def get_messages(room_id: str, limit: int = 50):
-    """Retrieve message history for a room"""
+    """Retrieve the newest messages for a room, in chronological order"""
+    messages = fetch_recent_messages(room_id, limit)
+    return messages if messages is not None else []
+
+def fetch_recent_messages(room_id: str, limit: int = 50):
+    """Like get_messages, but returns None when the database could not be read"""
+    return fetch_messages_before(room_id, None, limit)
+
+def encode_cursor(message: dict):
+    """Opaque keyset cursor pointing at a message's (created_at, id)"""
+    key = [message.get('created_at'), message.get('id')]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str):
+    """Turn a cursor back into (created_at, id); raises ValueError if it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, message_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError(f"invalid cursor: {cursor!r}")
+    if not isinstance(created_at, str) or not (message_id is None or isinstance(message_id, int)):
+        raise ValueError(f"invalid cursor: {cursor!r}")
+    return created_at, message_id
+
+def created_time(value):
+    """A created_at as an aware UTC datetime, or None if it can't be read.
+
+    Live messages carry naive utcnow() text; rows from storage may have trimmed
+    microseconds or an offset, so the strings can't be compared as they are.
+    """
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    return parsed.replace(tzinfo=timezone.utc) if parsed.tzinfo is None else parsed.astimezone(timezone.utc)
+
+def _keyset_params(room_id: str, before, limit: int):
+    """PostgREST params for one page, newest first, strictly older than the cursor.
+
+    Walks idx_messages_room_created_id instead of using OFFSET; id breaks ties
+    between messages with the same created_at.
+    """
+    params = {
+        'room_id': f'eq.{room_id}',
+        'order': 'created_at.desc,id.desc',
+        'limit': str(limit)
+    }
+    if before is not None:
+        created_at, message_id = before
+        if message_id is None:
+            params['created_at'] = f'lt."{created_at}"'
+        else:
+            params['or'] = f'(created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{message_id}))'
+    return params
+
+def fetch_messages_before(room_id: str, before=None, limit: int = 50):
+    """Retrieve the page of messages older than the (created_at, id) cursor, in chronological order.
+
+    With before=None this is the newest page. Returns None when the database could not be read.
+    """
     if not is_enabled():
         return []
     
     room_id = str(room_id).strip()
+    if backend is not None:
+        with metrics.DB_SECONDS.time(op='fetch_messages', path=backend.name):
+            return backend.fetch_messages_before(room_id, before, limit)
+    if _rejected('fetch_messages'):
+        return None
+    params = _keyset_params(room_id, before, limit)
     # First attempt: supabase client
+    # postgrest-py has no or_() filter, so the keyset params are added to the query directly
     if is_enabled():
         try:
-            response = supabase.table('messages').select('*').eq('room_id', room_id).order('created_at', desc=False).limit(limit).execute()
+            query = supabase.table('messages').select('*')
+            for key, value in params.items():
+                query.params = query.params.add(key, value)
+            with metrics.DB_SECONDS.time(op='fetch_messages', path='client'):
+                response = _execute(query)
             resp_data = getattr(response, 'data', None)
             resp_error = getattr(response, 'error', None)
-            print(f"[DB] Select response raw: {response!r}")
-            print(f"[DB] Select response data: {resp_data}")
-            print(f"[DB] Select response error: {resp_error}")
             if resp_error:
-                print(f"[DB] Error retrieving messages (supabase error): {resp_error}")
+                log.error("Error retrieving messages (supabase error)", extra={'error': str(resp_error), 'path': 'client'})
             else:
                 messages = resp_data if resp_data else []
-                print(f"[DB] Retrieved {len(messages)} messages for room {room_id} (client)")
-                return messages
+                log.debug("Retrieved messages", extra={'room': room_id, 'rows': len(messages), 'path': 'client'})
+                return list(reversed(messages))
         except Exception as e:
-            print(f"[DB] Exception retrieving messages with client: {e}")
+            log.warning("Exception retrieving messages with client", extra={'error': str(e), 'path': 'client'})
 
     # Fallback: direct REST GET
+    metrics.DB_FALLBACKS.inc(op='fetch_messages')
+    if _rejected('fetch_messages'):
+        return None
     try:
-        url = f"{SUPABASE_URL.rstrip('/')}/rest/v1/messages"
-        params = {
-            'select': '*',
-            'room_id': f'eq.{room_id}',
-            'order': 'created_at.asc',
-            'limit': str(limit)
-        }
         headers = {
             'apikey': SUPABASE_ANON_KEY,
             'Authorization': f'Bearer {SUPABASE_ANON_KEY}'
         }
-        resp = requests.get(url, headers=headers, params=params, timeout=10)
-        print(f"[DB][REST] GET {url} status={resp.status_code} url={resp.url}")
-        print(f"[DB][REST] body={resp.text}")
+        with metrics.DB_SECONDS.time(op='fetch_messages', path='rest'):
+            resp = _rest('GET', 'messages', headers=headers, params={'select': '*', **params})
+        log.debug("Retrieved messages", extra={'room': room_id, 'status': resp.status_code, 'path': 'rest', **_payload(resp.text)})
         if resp.status_code == 200:
             try:
-                return resp.json()
+                return list(reversed(resp.json()))
             except Exception:
-                return []
+                return None
         else:
-            print(f"[DB][REST] Failed to retrieve messages: {resp.status_code} {resp.text}")
-            return []
+            log.error("Failed to retrieve messages", extra={'status': resp.status_code, 'path': 'rest', **_payload(resp.text)})
+            metrics.ERRORS.inc(where='db.fetch_messages')
+            return None
     except Exception as e:
-        print(f"[DB][REST] Exception retrieving messages: {e}")
-        return []
+        log.error("Exception retrieving messages", extra={'error': str(e), 'path': 'rest'})
+        metrics.ERRORS.inc(where='db.fetch_messages')
+        return None
 
 def create_room(room_id: str):
-    """Create a room entry (optional)"""
+    """Create a room entry (optional); a no-op for rooms already known to exist"""
     if not is_enabled():
         return None
-    
-    try:
+    return create_rooms([room_id])
+
+def create_rooms(room_ids):
+    """Make sure these rooms exist, with one idempotent upsert for the ones not seen yet.
+
+    Rooms already created (or found to exist) are kept in a bounded in-memory
+    set, so they never cost another database write. Returns None on failure.
+    """
+    if not is_enabled():
+        return []
+
+    new_rooms = []
+    for room_id in room_ids:
         room_id = str(room_id).strip()
-        response = supabase.table('rooms').insert([{
-            'id': room_id,
-            'created_at': datetime.utcnow().isoformat()
-        }]).execute()
-        print(f"[DB] Room created: {room_id}")
+        if room_id in _known_rooms:
+            _known_rooms.move_to_end(room_id)
+        elif room_id not in new_rooms:
+            new_rooms.append(room_id)
+    if not new_rooms:
+        return []
+
+    if backend is not None:
+        with metrics.DB_SECONDS.time(op='create_rooms', path=backend.name):
+            result = backend.create_rooms(new_rooms)
+    else:
+        result = _upsert_rooms(new_rooms)
+    if result is not None:
+        _remember_rooms(new_rooms)
+    return result
+
+def _remember_rooms(room_ids):
+    for room_id in room_ids:
+        _known_rooms[room_id] = True
+        _known_rooms.move_to_end(room_id)
+    while len(_known_rooms) > KNOWN_ROOMS_MAX:
+        _known_rooms.popitem(last=False)
+
+def _upsert_rooms(room_ids):
+    # INSERT ... ON CONFLICT DO NOTHING through PostgREST (resolution=ignore-duplicates)
+    now = datetime.utcnow().isoformat()
+    rows = [{'id': room_id, 'created_at': now} for room_id in room_ids]
+    if _rejected('create_rooms'):
+        return None
+    try:
+        with metrics.DB_SECONDS.time(op='create_rooms', path='client'):
+            response = _execute(supabase.table('rooms').upsert(rows, ignore_duplicates=True))
+        log.debug("Rooms ensured", extra={'rooms': len(rows), 'path': 'client'})
         return response
     except Exception as e:
-        # Room might already exist - this is OK
-        if 'duplicate' in str(e).lower() or 'unique' in str(e).lower():
-            print(f"[DB] Room exists: {room_id}")
-        else:
-            print(f"[DB] Room: {e}")
+        log.warning("Exception upserting rooms with client", extra={'error': str(e), 'path': 'client'})
+
+    # Fallback: direct REST upsert
+    metrics.DB_FALLBACKS.inc(op='create_rooms')
+    if _rejected('create_rooms'):
+        return None
+    try:
+        headers = {
+            'apikey': SUPABASE_ANON_KEY,
+            'Authorization': f'Bearer {SUPABASE_ANON_KEY}',
+            'Content-Type': 'application/json',
+            'Prefer': 'return=minimal,resolution=ignore-duplicates'
+        }
+        with metrics.DB_SECONDS.time(op='create_rooms', path='rest'):
+            resp = _rest('POST', 'rooms', headers=headers, json=rows)
+        log.debug("Rooms ensured", extra={'rooms': len(rows), 'status': resp.status_code, 'path': 'rest'})
+        if resp.status_code in (200, 201, 204):
+            return resp
+        log.error("Failed to upsert rooms", extra={'status': resp.status_code, 'path': 'rest', **_payload(resp.text)})
+        metrics.ERRORS.inc(where='db.create_rooms')
+        return None
+    except Exception as e:
+        log.error("Exception upserting rooms", extra={'error': str(e), 'path': 'rest'})
+        metrics.ERRORS.inc(where='db.create_rooms')
+        return None
+
+def search_messages(room_id: str, query: str, before=None, limit: int = 20):
+    """Messages in a room containing every word of query, newest first, older than the (created_at, id) cursor.
+
+    Returns None when the database could not be read.
+    """
+    words = search.terms(query)
+    if not is_enabled() or not words:
+        return []
+    room_id = str(room_id).strip()
+    if backend is not None:
+        with metrics.DB_SECONDS.time(op='search', path=backend.name):
+            return backend.search_messages(room_id, words, before, limit)
+    if _rejected('search'):
         return None
 
-def delete_old_messages(room_id: str = None, days: int = 7):
-    """Delete messages older than specified days (cleanup)"""
+    # plfts on the text column is to_tsvector('simple', message_text) @@ plainto_tsquery(...),
+    # which idx_messages_fts (see CREATE_TABLES_GUIDE.md) serves
+    params = [('select', '*'), ('room_id', f'eq.{room_id}'), ('message_text', f"plfts(simple).{' '.join(words)}"),
+              ('order', 'created_at.desc,id.desc'), ('limit', str(limit))]
+    if before is not None:
+        params.append(_older_than(before))
+    try:
+        with metrics.DB_SECONDS.time(op='search', path='rest'):
+            resp = _rest('GET', 'messages', params=params,
+                         headers={'apikey': SUPABASE_ANON_KEY, 'Authorization': f'Bearer {SUPABASE_ANON_KEY}'})
+        if resp.status_code != 200:
+            log.error("Failed to search messages", extra={'status': resp.status_code, 'path': 'rest', **_payload(resp.text)})
+            metrics.ERRORS.inc(where='db.search')
+            return None
+        return resp.json()
+    except Exception as e:
+        log.error("Exception searching messages", extra={'error': str(e), 'path': 'rest'})
+        metrics.ERRORS.inc(where='db.search')
+        return None
+
+# Retention (see retention.py)
+# Deletes go through PostgREST directly. Row Level Security must allow DELETE on messages
+# for the key in use; SUPABASE_SERVICE_ROLE_KEY, if set, is used for them instead of the anon key.
+SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY', '')
+
+def _rest_headers(**extra):
+    key = SUPABASE_SERVICE_ROLE_KEY or SUPABASE_ANON_KEY
+    return {'apikey': key, 'Authorization': f'Bearer {key}', **extra}
+
+def _in_list(values):
+    """PostgREST in.(...) list with every value quoted"""
+    return '(' + ','.join('"' + str(v).replace('\\', '\\\\').replace('"', '\\"') + '"' for v in values) + ')'
+
+def _older_than(before):
+    """PostgREST filter for rows strictly older than a (created_at, id) key"""
+    created_at, message_id = before
+    if message_id is None:
+        return ('created_at', f'lt."{created_at}"')
+    return ('or', f'(created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{message_id}))')
+
+def _newer_than(after):
+    """PostgREST filter for rows strictly newer than a (created_at, id) key"""
+    created_at, message_id = after
+    if message_id is None:
+        return ('created_at', f'gte."{created_at}"')
+    return ('or', f'(created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt.{message_id}))')
+
+def delete_messages_before(room_id, before, limit: int = 500, exclude=()):
+    """Delete one batch of up to limit messages older than the (created_at, id) key.
+
+    room_id None means every room except those in exclude. Returns the number of
+    rows deleted (0 when there is nothing left) or None on failure.
+    """
     if not is_enabled():
+        return 0
+    if backend is not None:
+        with metrics.DB_SECONDS.time(op='delete_messages', path=backend.name):
+            return backend.delete_messages_before(room_id, before, limit, exclude)
+    if _rejected('delete_messages'):
+        return None
+
+    params = [('select', 'id'), _older_than(before), ('order', 'created_at.asc,id.asc'), ('limit', str(limit))]
+    if room_id is not None:
+        params.append(('room_id', f'eq.{room_id}'))
+    if exclude:
+        params.append(('room_id', f'not.in.{_in_list(exclude)}'))
+    try:
+        with metrics.DB_SECONDS.time(op='delete_messages', path='rest'):
+            resp = _rest('GET', 'messages', headers=_rest_headers(), params=params)
+            if resp.status_code != 200:
+                log.error("Failed to select expired messages", extra={'status': resp.status_code, 'path': 'rest', **_payload(resp.text)})
+                metrics.ERRORS.inc(where='db.delete_messages')
+                return None
+            ids = [row['id'] for row in resp.json()]
+            if not ids:
+                return 0
+            # Deleting by id keeps the batch bounded; rows another worker already took just don't match
+            resp = _rest('DELETE', 'messages', headers=_rest_headers(Prefer='return=minimal,count=exact'),
+                         params={'id': f"in.({','.join(str(i) for i in ids)})"})
+        if resp.status_code not in (200, 204):
+            log.error("Failed to delete messages", extra={'status': resp.status_code, 'path': 'rest', **_payload(resp.text)})
+            metrics.ERRORS.inc(where='db.delete_messages')
+            return None
+        deleted = resp.headers.get('Content-Range', '').rpartition('/')[2]
+        return int(deleted) if deleted.isdigit() else len(ids)
+    except Exception as e:
+        log.error("Exception deleting messages", extra={'error': str(e), 'path': 'rest'})
+        metrics.ERRORS.inc(where='db.delete_messages')
+        return None
+
+def nth_newest_message(room_id, offset: int):
+    """(created_at, id) of the room's message offset places below the newest; None if there is none"""
+    if not is_enabled():
+        return None
+    if backend is not None:
+        return backend.nth_newest(room_id, offset)
+    if _rejected('nth_newest'):
+        return None
+    try:
+        resp = _rest('GET', 'messages', headers=_rest_headers(), params={
+            'select': 'created_at,id', 'room_id': f'eq.{room_id}', 'order': 'created_at.desc,id.desc',
+            'offset': str(offset), 'limit': '1'
+        })
+        rows = resp.json() if resp.status_code == 200 else []
+        return (rows[0]['created_at'], rows[0]['id']) if rows else None
+    except Exception as e:
+        log.error("Exception finding retention boundary", extra={'error': str(e), 'path': 'rest'})
+        return None
+
+def list_rooms(after: str = '', limit: int = 500):
+    """One page of room ids in order, after `after`; None on failure"""
+    if not is_enabled():
+        return []
+    if backend is not None:
+        return backend.list_rooms(after, limit)
+    if _rejected('list_rooms'):
         return None
-    
     try:
-        query = supabase.table('messages').delete()
-        if room_id:
-            query = query.eq('room_id', room_id)
-        # This would require Supabase to support date comparisons
-        # For now, just log
-        print(f"[DB] Message cleanup would delete messages older than {days} days")
+        resp = _rest('GET', 'rooms', headers=_rest_headers(), params={
+            'select': 'id', 'id': f'gt."{after}"', 'order': 'id.asc', 'limit': str(limit)
+        })
+        if resp.status_code != 200:
+            log.error("Failed to list rooms", extra={'status': resp.status_code, 'path': 'rest', **_payload(resp.text)})
+            return None
+        return [row['id'] for row in resp.json()]
+    except Exception as e:
+        log.error("Exception listing rooms", extra={'error': str(e), 'path': 'rest'})
+        return None
+
+def fetch_messages_after(room_id, after=None, until: str = None, limit: int = 500):
+    """One page of messages oldest first, strictly after the (created_at, id) key and created before until.
+
+    A key with id None starts at created_at itself. room_id None means every room.
+    Returns None when the database could not be read.
+    """
+    if not is_enabled():
+        return []
+    if backend is not None:
+        with metrics.DB_SECONDS.time(op='export_messages', path=backend.name):
+            return backend.fetch_messages_after(room_id, after, until, limit)
+    if _rejected('export_messages'):
         return None
+
+    params = [('select', '*'), ('order', 'created_at.asc,id.asc'), ('limit', str(limit))]
+    if after is not None:
+        params.append(_newer_than(after))
+    if until is not None:
+        params.append(('created_at', f'lt."{until}"'))
+    if room_id is not None:
+        params.append(('room_id', f'eq.{room_id}'))
+    try:
+        with metrics.DB_SECONDS.time(op='export_messages', path='rest'):
+            resp = _rest('GET', 'messages', headers=_rest_headers(), params=params)
+        if resp.status_code != 200:
+            log.error("Failed to export messages", extra={'status': resp.status_code, 'path': 'rest', **_payload(resp.text)})
+            metrics.ERRORS.inc(where='db.export_messages')
+            return None
+        return resp.json()
     except Exception as e:
-        print(f"[DB] Error in cleanup: {e}")
+        log.error("Exception exporting messages", extra={'error': str(e), 'path': 'rest'})
+        metrics.ERRORS.inc(where='db.export_messages')
         return None
+
+def delete_old_messages(room_id: str = None, days: int = 7, batch_size: int = 500, max_batches: int = 100):
+    """Delete messages older than specified days (cleanup), in batches of batch_size.
+
+    Returns the number of rows deleted, or None if a batch failed before anything was deleted.
+    """
+    if not is_enabled():
+        return None
+
+    cutoff = (datetime.utcnow() - timedelta(days=days)).isoformat()
+    deleted = 0
+    for _ in range(max_batches):
+        removed = delete_messages_before(room_id, (cutoff, None), batch_size)
+        if removed is None:
+            return deleted or None
+        deleted += removed
+        if removed < batch_size:
+            break
+    log.info("Deleted old messages", extra={'room': room_id, 'days': days, 'rows': deleted})
+    return deleted
@@ -0,0 +1,88 @@
+"""
+Streaming history export
+Reads one room's messages, or every room's in a time range, oldest first in pages
+of EXPORT_PAGE_SIZE walked by keyset on (created_at, id), and writes each page
+out as NDJSON or CSV before the next is read. Memory stays at one page however
+many messages the export covers. Output can be gzipped as it is written.
+
+Every row carries the cursor of its own position: an export that was cut off
+resumes from the cursor of the last complete row it received.
+
+EXPORT_PAGE_SIZE   rows read per storage call (default 1000)
+EXPORT_GZIP_LEVEL  compression level of gzipped exports (default 6)
+"""
+
+import csv
+import io
+import json
+import os
+import zlib
+
+import db
+
+PAGE_SIZE = int(os.getenv('EXPORT_PAGE_SIZE', '1000'))
+GZIP_LEVEL = int(os.getenv('EXPORT_GZIP_LEVEL', '6'))
+
+FIELDS = ('id', 'room_id', 'user_handle', 'message_text', 'created_at', 'cursor')
+FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv; charset=utf-8'}
+
+
+class ExportFailed(Exception):
+    """Storage could not be read partway through an export"""
+
+
+def parse_time(value):
+    """An ISO-8601 time as the naive UTC text messages are stored with; raises ValueError"""
+    parsed = db.created_time(value)
+    if parsed is None:
+        raise ValueError(f"not an ISO-8601 time: {value!r}")
+    return parsed.replace(tzinfo=None).isoformat()
+
+
+def pages(room_id, after=None, until=None, page_size=PAGE_SIZE, fetch=None):
+    """Pages of messages oldest first, strictly after the (created_at, id) key; raises ExportFailed"""
+    fetch = fetch or db.fetch_messages_after
+    while True:
+        page = fetch(room_id, after, until, page_size)
+        if page is None:
+            raise ExportFailed(f"storage read failed after {after!r}")
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        after = (page[-1]['created_at'], page[-1]['id'])
+
+
+def _record(message):
+    return dict({key: message.get(key) for key in FIELDS[:-1]}, cursor=db.encode_cursor(message))
+
+
+def _ndjson(page):
+    return ''.join(json.dumps(_record(m), ensure_ascii=False, separators=(',', ':')) + '\n' for m in page)
+
+
+def _csv(page, header=False):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, FIELDS)
+    if header:
+        writer.writeheader()
+    writer.writerows(_record(m) for m in page)
+    return out.getvalue()
+
+
+def stream(source, fmt='ndjson', gzip=False, level=GZIP_LEVEL):
+    """Encoded chunks, one per page; gzip output is flushed at the end of each page, so what a client has decodes"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31) if gzip else None
+    encode = _csv if fmt == 'csv' else _ndjson
+
+    def chunk(text):
+        data = text.encode()
+        return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH) if gzip else data
+
+    if fmt == 'csv':
+        # The header goes out even when there are no rows
+        yield chunk(_csv([], header=True))
+    for page in source:
+        yield chunk(encode(page))
+    if gzip:
+        yield compressor.flush()
@@ -0,0 +1,148 @@
+"""
+In-process hot history cache for the chat app
+Keeps the last N messages of recently active rooms so joins don't hit the database
+"""
+
+import os
+import threading
+from collections import OrderedDict, deque
+
+import db
+
+HISTORY_SIZE = int(os.getenv('HISTORY_SIZE', '50'))
+MAX_ROOMS = int(os.getenv('HISTORY_CACHE_MAX_ROOMS', '2000'))
+MAX_MESSAGES = int(os.getenv('HISTORY_CACHE_MAX_MESSAGES', '100000'))
+LOAD_WAIT = 10.0
+
+
+def _gate():
+    """A closed gate that requests sharing a load wait on; green when eventlet is installed,
+    since the loader may yield to the hub and a plain wait would block it"""
+    try:
+        from eventlet.semaphore import Semaphore
+    except ImportError:
+        return threading.Semaphore(0)
+    return Semaphore(0)
+
+
+def _identity(row):
+    """What a message is recognised by with or without a database id; stored times may differ in format"""
+    return row.get('user_handle'), row.get('message_text'), db.created_time(row.get('created_at'))
+
+
+class RoomHistoryCache:
+    """Per-room ring buffers with LRU eviction of idle rooms and a global message cap"""
+
+    def __init__(self, per_room=HISTORY_SIZE, max_rooms=MAX_ROOMS, max_messages=MAX_MESSAGES):
+        self.per_room = per_room
+        self.max_rooms = max_rooms
+        self.max_messages = max_messages
+        self._rooms = OrderedDict()
+        self._loading = {}
+        self._arrived = {}    # room -> messages appended while its load was in flight
+        self._lock = threading.Lock()
+        self._total = 0
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, room, loader):
+        """Return the cached history for a room, calling loader(room) on a cold miss.
+
+        Concurrent misses for the same room share a single load. If the loader
+        returns None (database error) nothing is cached and [] is returned.
+        """
+        with self._lock:
+            entry = self._rooms.get(room)
+            if entry is not None:
+                self._rooms.move_to_end(room)
+                self.hits += 1
+                return list(entry)
+            pending = self._loading.get(room)
+            if pending is None:
+                pending = self._loading[room] = _gate()
+                owner = True
+                self.misses += 1
+            else:
+                owner = False
+                self.coalesced += 1
+
+        if not owner:
+            if pending.acquire(timeout=LOAD_WAIT):
+                # Pass it on to the next request waiting for this load
+                pending.release()
+            with self._lock:
+                entry = self._rooms.get(room)
+                return list(entry) if entry is not None else []
+
+        rows = None
+        try:
+            rows = loader(room)
+        finally:
+            with self._lock:
+                arrived = self._arrived.pop(room, [])
+                if rows is not None:
+                    # The load may or may not have read what arrived meanwhile
+                    loaded = {_identity(r) for r in rows}
+                    rows = list(rows) + [r for r in arrived if _identity(r) not in loaded]
+                    self._store(room, rows)
+                self._loading.pop(room, None)
+            pending.release()
+        return list(rows[-self.per_room:]) if rows else []
+
+    def append(self, room, row):
+        """Add a new message to a warm room or one being loaded; cold rooms are left to load from the database"""
+        with self._lock:
+            entry = self._rooms.get(room)
+            if entry is None:
+                if room not in self._loading:
+                    return False
+                # Kept until the load finishes, which may have started reading before this was written
+                self._arrived.setdefault(room, []).append(row)
+                return True
+            if len(entry) == entry.maxlen:
+                self._total -= 1
+            entry.append(row)
+            self._total += 1
+            self._rooms.move_to_end(room)
+            self._evict()
+            return True
+
+    def discard(self, room):
+        """Forget a room's cached history"""
+        with self._lock:
+            entry = self._rooms.pop(room, None)
+            if entry is not None:
+                self._total -= len(entry)
+
+    def _store(self, room, rows):
+        old = self._rooms.pop(room, None)
+        if old is not None:
+            self._total -= len(old)
+        entry = deque(rows[-self.per_room:], maxlen=self.per_room)
+        self._rooms[room] = entry
+        self._total += len(entry)
+        self._evict()
+
+    def _evict(self):
+        # Drop least recently used rooms, but never the one just touched
+        while len(self._rooms) > 1 and (len(self._rooms) > self.max_rooms or self._total > self.max_messages):
+            _, entry = self._rooms.popitem(last=False)
+            self._total -= len(entry)
+            self.evictions += 1
+
+    def stats(self):
+        """Snapshot of cache counters"""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            'rooms': len(self._rooms),
+            'messages': self._total,
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'evictions': self.evictions,
+            'hit_ratio': round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
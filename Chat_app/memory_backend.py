@@ -0,0 +1,128 @@
+"""
+In-process storage backend for the chat app
+Same storage contract as pg_backend.py, kept in memory; used by the benchmarks and local runs
+
+MEMORY_BACKEND_LATENCY_MS  simulated round-trip time per call (default 0)
+"""
+
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import applog
+from search import InvertedIndex
+
+log = applog.get_logger('db.memory')
+
+LATENCY_MS = float(os.getenv('MEMORY_BACKEND_LATENCY_MS', '0'))
+
+
+class MemoryBackend:
+    """save_messages / fetch_messages_before / create_rooms against dicts"""
+    name = 'memory'
+
+    def __init__(self, latency_ms=LATENCY_MS, sleep=time.sleep):
+        self.latency = latency_ms / 1000.0
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._messages = defaultdict(list)
+        self._rooms = {}
+        self._next_id = 1
+        self.index = InvertedIndex()
+
+    def _round_trip(self):
+        if self.latency > 0:
+            self._sleep(self.latency)
+
+    def save_messages(self, rows):
+        self._round_trip()
+        saved = []
+        with self._lock:
+            for row in rows:
+                row = dict(row, id=self._next_id)
+                row.setdefault('created_at', datetime.utcnow().isoformat())
+                self._next_id += 1
+                self._messages[row['room_id']].append(row)
+                self.index.add(row)
+                saved.append(row)
+        return saved
+
+    def fetch_messages_before(self, room_id, before=None, limit=50):
+        self._round_trip()
+        with self._lock:
+            rows = sorted(self._messages.get(room_id, ()), key=lambda r: (r['created_at'], r['id']))
+        if before is not None:
+            created_at, message_id = before
+            # id 0 sorts below every real id, so this means "strictly older than created_at"
+            key = (created_at, message_id or 0)
+            rows = [r for r in rows if (r['created_at'], r['id']) < key]
+        return [dict(r) for r in rows[-limit:]] if limit > 0 else []
+
+    def fetch_messages_after(self, room_id, after=None, until=None, limit=500):
+        """Oldest first, strictly after the (created_at, id) key and before until; room_id None is every room"""
+        self._round_trip()
+        with self._lock:
+            rooms = [room_id] if room_id is not None else list(self._messages)
+            rows = sorted((r for room in rooms for r in self._messages.get(room, ())),
+                          key=lambda r: (r['created_at'], r['id']))
+        if after is not None:
+            key = (after[0], after[1] or 0)
+            rows = [r for r in rows if (r['created_at'], r['id']) > key]
+        if until is not None:
+            rows = [r for r in rows if r['created_at'] < until]
+        return [dict(r) for r in rows[:limit]]
+
+    def create_rooms(self, room_ids):
+        """Returns how many rooms were actually new"""
+        self._round_trip()
+        now = datetime.utcnow().isoformat()
+        created = 0
+        with self._lock:
+            for room_id in room_ids:
+                if room_id not in self._rooms:
+                    self._rooms[room_id] = {'id': room_id, 'created_at': now}
+                    created += 1
+        return created
+
+    def delete_messages_before(self, room_id, before, limit, exclude=()):
+        self._round_trip()
+        created_at, message_id = before
+        key = (created_at, message_id or 0)
+        exclude = set(exclude)
+        deleted = 0
+        with self._lock:
+            rooms = [room_id] if room_id is not None else [r for r in self._messages if r not in exclude]
+            for room in rooms:
+                rows = self._messages.get(room, [])
+                doomed = sorted((r for r in rows if (r['created_at'], r['id']) < key),
+                                key=lambda r: (r['created_at'], r['id']))[:limit - deleted]
+                if doomed:
+                    ids = {r['id'] for r in doomed}
+                    self._messages[room] = [r for r in rows if r['id'] not in ids]
+                    self.index.remove(ids)
+                    deleted += len(doomed)
+                if deleted >= limit:
+                    break
+        return deleted
+
+    def nth_newest(self, room_id, offset):
+        self._round_trip()
+        with self._lock:
+            rows = sorted(self._messages.get(room_id, ()), key=lambda r: (r['created_at'], r['id']), reverse=True)
+        if offset < len(rows):
+            return rows[offset]['created_at'], rows[offset]['id']
+        return None
+
+    def list_rooms(self, after='', limit=500):
+        self._round_trip()
+        with self._lock:
+            rooms = sorted(set(self._rooms) | set(self._messages))
+        return [room for room in rooms if room > after][:limit]
+
+    def search_messages(self, room_id, words, before=None, limit=20):
+        """Messages containing every word, newest first, from the inverted index"""
+        self._round_trip()
+        found = self.index.search(room_id, words, before[1] if before else None, limit)
+        return [dict(r) for r in found]
@@ -0,0 +1,188 @@
+"""
+Prometheus-style metrics for the chat app
+Counters, gauges and histograms rendered in the text exposition format at /metrics
+
+Recording is a lock, a dict lookup and an add, so it is cheap enough to leave on.
+"""
+
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers sub-millisecond cache hits up to slow upstream calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels[n] for n in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in items]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class CallbackGauge(Metric):
+    """Gauge read at scrape time; fn returns a number or a list of (labels dict, value)"""
+    type = 'gauge'
+
+    def __init__(self, name, help, fn, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+
+    def samples(self):
+        try:
+            result = self.fn()
+        except Exception:
+            return []
+        if isinstance(result, (int, float)):
+            return [f"{self.name} {_number(result)}"]
+        return [f"{self.name}{_labels(self.labelnames, self._key(labels))} {_number(value)}"
+                for labels, value in result]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket counts (last slot is +Inf), sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        lines = []
+        for key, (counts, total, count) in items:
+            running = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                running += n
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, ('le', _number(float(bound))))} {running}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def timed(histogram, **labels):
+    """Decorator recording a function's duration in histogram"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def render():
+    """All registered metrics in Prometheus text format"""
+    lines = []
+    for metric in _registry:
+        samples = metric.samples()
+        if samples:
+            lines.extend(metric.header())
+            lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Shared instruments
+HANDLER_SECONDS = Histogram('chat_handler_seconds', 'Socket.IO handler latency', ['handler'])
+DB_SECONDS = Histogram('chat_db_seconds', 'Database call latency by operation and path (client, rest, pg)', ['op', 'path'])
+DB_FALLBACKS = Counter('chat_db_fallback_total', 'Supabase client failures that fell back to the REST path', ['op'])
+DB_REJECTED = Counter('chat_db_rejected_total', 'Supabase calls failed fast by the open circuit breaker', ['op'])
+ERRORS = Counter('chat_errors_total', 'Errors by where they happened', ['where'])
@@ -0,0 +1,222 @@
+"""
+Per-client outbound queues for room broadcasts
+A room broadcast is handed to each member's Engine.IO socket, whose send queue
+has no limit: a client that reads slower than the room talks (a stalled phone
+on a bad network) makes the server hold every frame sent to it since.
+
+Broadcast frames (OUTBOUND_EVENTS) are handed to a client's socket only while
+that socket has fewer than OUTBOUND_HANDOFF frames waiting; the rest wait in a
+queue of at most OUTBOUND_QUEUE_MAX frames per client. Broadcast frames are
+encoded once and shared by every member, so a waiting frame costs a client a
+pointer. When a client's queue is full, OUTBOUND_POLICY decides:
+  drop_oldest  drop the oldest waiting frame (default)
+  resync       drop everything waiting, and what comes until the client catches up,
+               then send one "resync" event ({"missed": n}); the client rejoins and
+               fetches what it missed as history
+  disconnect   disconnect the client
+
+OUTBOUND_QUEUE_MAX  frames held per client (default 256; 0 = off, frames go straight to the socket)
+OUTBOUND_HANDOFF    frames a client's socket may have waiting before frames are held back (default 16)
+OUTBOUND_DRAIN_MS   how often held frames are moved on to sockets that caught up (default 10)
+OUTBOUND_EVENTS     events that are room broadcasts (default message,message_batch,presence)
+"""
+
+import os
+import time
+from collections import deque
+
+import applog
+
+log = applog.get_logger('outbound')
+
+QUEUE_MAX = int(os.getenv('OUTBOUND_QUEUE_MAX', '256'))
+HANDOFF = int(os.getenv('OUTBOUND_HANDOFF', '16'))
+DRAIN_MS = float(os.getenv('OUTBOUND_DRAIN_MS', '10'))
+POLICY = os.getenv('OUTBOUND_POLICY', 'drop_oldest').strip().lower()
+EVENTS = [e.strip() for e in os.getenv('OUTBOUND_EVENTS', 'message,message_batch,presence').split(',') if e.strip()]
+
+POLICIES = ('drop_oldest', 'resync', 'disconnect')
+
+# Upper bounds for the depth distribution exported on /metrics
+DEPTH_BUCKETS = (1, 4, 16, 64, 256)
+
+
+class _Client:
+    __slots__ = ('held', 'peak', 'dropped', 'missed', 'closing')
+
+    def __init__(self):
+        self.held = deque()
+        self.peak = 0
+        self.dropped = 0
+        self.missed = 0       # frames dropped since the last resync marker (resync policy)
+        self.closing = False
+
+
+class OutboundQueues:
+    """Bounded per-client queues in front of Engine.IO's send queues"""
+
+    def __init__(self, server, max_frames=QUEUE_MAX, handoff=HANDOFF, policy=POLICY, events=EVENTS,
+                 drain_ms=DRAIN_MS, sleep=time.sleep, on_drop=None):
+        if policy not in POLICIES:
+            raise ValueError(f"OUTBOUND_POLICY must be one of {', '.join(POLICIES)}, not {policy!r}")
+        self.server = server
+        self.max_frames = max_frames
+        self.handoff = handoff
+        self.policy = policy
+        self.drain_interval = drain_ms / 1000.0
+        self._sleep = sleep
+        self._on_drop = on_drop   # on_drop(frames) for every frame a slow client loses
+        self._send = None
+        # Encoded Socket.IO EVENT packets start with 2, the namespace if not "/", then the JSON array
+        self._prefixes = tuple(f'2["{event}",' for event in events)
+        self._clients = {}    # eio sid -> _Client, for clients that had frames held
+        self._backlog = set() # eio sids with frames held
+        self._running = False
+
+        # Counters
+        self.held_total = 0
+        self.dropped = 0
+        self.resyncs = 0
+        self.disconnects = 0
+
+    def install(self):
+        """Route the server's outgoing packets through send()"""
+        if self._send is None and self.max_frames > 0:
+            self._send = self.server._send_eio_packet
+            self.server._send_eio_packet = self.send
+
+    def _waiting(self, eio_sid):
+        """Frames the client's Engine.IO socket has not written yet; None if it's gone"""
+        socket = self.server.eio.sockets.get(eio_sid)
+        if socket is None or socket.closed:
+            return None
+        return socket.queue.qsize()
+
+    def send(self, eio_sid, pkt):
+        data = pkt.data
+        if not (isinstance(data, str) and data.startswith(self._prefixes)):
+            return self._send(eio_sid, pkt)
+        client = self._clients.get(eio_sid)
+        if client is None or not (client.held or client.missed or client.closing):
+            waiting = self._waiting(eio_sid)
+            if waiting is None or waiting < self.handoff:
+                return self._send(eio_sid, pkt)
+            if client is None:
+                client = self._clients[eio_sid] = _Client()
+        if client.closing:
+            return
+        if client.missed:
+            # Everything up to the resync marker is fetched again by the client's rejoin
+            client.missed += 1
+            self._drop(client, 1)
+            return
+        if len(client.held) >= self.max_frames:
+            self._overflow(client)
+            if client.closing or client.missed:
+                return
+        client.held.append(pkt)
+        self.held_total += 1
+        client.peak = max(client.peak, len(client.held))
+        self._backlog.add(eio_sid)
+
+    def _drop(self, client, frames):
+        client.dropped += frames
+        self.dropped += frames
+        if self._on_drop is not None:
+            self._on_drop(frames)
+
+    def _overflow(self, client):
+        if self.policy == 'drop_oldest':
+            client.held.popleft()
+            self._drop(client, 1)
+        elif self.policy == 'resync':
+            client.missed += len(client.held) + 1
+            self._drop(client, len(client.held) + 1)
+            client.held.clear()
+        else:
+            client.closing = True
+            self._drop(client, len(client.held) + 1)
+            client.held.clear()
+
+    def _resync_packet(self, missed):
+        from engineio import packet as eio_packet
+        from socketio import packet
+        encoded = self.server.packet_class(packet.EVENT, namespace='/', data=['resync', {'missed': missed}]).encode()
+        return eio_packet.Packet(eio_packet.MESSAGE, encoded)
+
+    def drain(self):
+        """Move held frames on to sockets that have room; returns how many clients still have a backlog"""
+        for eio_sid in list(self._backlog):
+            client = self._clients.get(eio_sid)
+            waiting = self._waiting(eio_sid)
+            if client is None or waiting is None:
+                self.forget(eio_sid)
+                continue
+            if client.closing:
+                self._disconnect(eio_sid)
+                continue
+            if client.missed:
+                if waiting < self.handoff:
+                    self._send(eio_sid, self._resync_packet(client.missed))
+                    self.resyncs += 1
+                    client.missed = 0
+                    self._backlog.discard(eio_sid)
+                continue
+            while client.held and waiting < self.handoff:
+                self._send(eio_sid, client.held.popleft())
+                waiting += 1
+            if not client.held:
+                self._backlog.discard(eio_sid)
+        return len(self._backlog)
+
+    def _disconnect(self, eio_sid):
+        self.forget(eio_sid)
+        self.disconnects += 1
+        log.warning("Disconnecting slow client", extra={'eio_sid': eio_sid, 'policy': self.policy})
+        try:
+            self.server.eio.disconnect(eio_sid)
+        except Exception as e:
+            log.error("Slow client disconnect failed", extra={'eio_sid': eio_sid, 'error': str(e)})
+
+    def forget(self, eio_sid):
+        self._backlog.discard(eio_sid)
+        self._clients.pop(eio_sid, None)
+
+    def _run(self):
+        while self._running:
+            try:
+                self.drain()
+            except Exception as e:
+                log.error("Outbound drain failed", extra={'error': str(e)})
+            self._sleep(self.drain_interval)
+
+    def start(self, socketio):
+        """Install on the server and drain on a Socket.IO background task; does nothing when off"""
+        if self._running or self.max_frames <= 0:
+            return False
+        self.install()
+        self._sleep = socketio.sleep
+        self._running = True
+        socketio.start_background_task(self._run)
+        return True
+
+    def stop(self):
+        self._running = False
+
+    def depth_histogram(self, buckets=DEPTH_BUCKETS):
+        """(upper bound, clients with at most that many frames held) per bucket, cumulative, ending at '+Inf'"""
+        held = [len(c.held) for c in list(self._clients.values()) if c.held]
+        return [(str(le), sum(1 for n in held if n <= le)) for le in buckets] + [('+Inf', len(held))]
+
+    def stats(self):
+        """Snapshot of outbound queue counters"""
+        held = [len(c.held) for c in list(self._clients.values())]
+        return {
+            'clients_backlogged': len(self._backlog),
+            'frames_held': sum(held),
+            'max_client_depth': max(held, default=0),
+            'held_total': self.held_total,
+            'dropped': self.dropped,
+            'resyncs': self.resyncs,
+            'disconnects': self.disconnects,
+        }
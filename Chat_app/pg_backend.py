@@ -0,0 +1,336 @@
+"""
+Direct PostgreSQL backend for the chat app
+Same storage contract as the Supabase path in db.py, over a pooled psycopg2 connection
+"""
+
+import os
+import threading
+from collections import deque
+from datetime import datetime
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+
+import applog
+
+log = applog.get_logger('db.pg')
+
+POOL_SIZE = int(os.getenv('PG_POOL_SIZE', '10'))
+POOL_TIMEOUT = float(os.getenv('PG_POOL_TIMEOUT', '5'))
+CONNECT_TIMEOUT = int(os.getenv('PG_CONNECT_TIMEOUT', '5'))
+
+COLUMNS = 'id, room_id, user_handle, message_text, created_at, updated_at'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rooms (
+    id TEXT PRIMARY KEY,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id BIGSERIAL PRIMARY KEY,
+    room_id TEXT NOT NULL REFERENCES rooms(id),
+    user_handle TEXT NOT NULL,
+    message_text TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+-- Keyset pages compare and order on (created_at, id), so id is part of both indexes.
+-- They replace the (room_id, created_at) / (created_at) indexes of older schemas.
+CREATE INDEX IF NOT EXISTS idx_messages_room_created_id ON messages(room_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_messages_created_id ON messages(created_at, id);
+DROP INDEX IF EXISTS idx_messages_room_created;
+DROP INDEX IF EXISTS idx_messages_created;
+CREATE INDEX IF NOT EXISTS idx_messages_fts ON messages USING GIN (to_tsvector('simple', message_text));
+"""
+
+# Rows go in as one multi-row VALUES per page and come back with their ids, so the
+# cursors built from them are full (created_at, id) keys
+INSERT_MESSAGES = (
+    'INSERT INTO messages (room_id, user_handle, message_text, created_at) VALUES %s '
+    f'RETURNING {COLUMNS}'
+)
+
+# Server-side prepared statements, created once per pooled connection
+STATEMENTS = {
+    'chat_recent_messages': (
+        '(text, int)',
+        f'SELECT {COLUMNS} FROM messages WHERE room_id = $1 '
+        'ORDER BY created_at DESC, id DESC LIMIT $2'
+    ),
+    'chat_messages_before': (
+        '(text, timestamp, bigint, int)',
+        f'SELECT {COLUMNS} FROM messages WHERE room_id = $1 AND (created_at, id) < ($2, $3) '
+        'ORDER BY created_at DESC, id DESC LIMIT $4'
+    ),
+    'chat_upsert_rooms': (
+        '(text[], timestamp)',
+        'INSERT INTO rooms (id, created_at) SELECT unnest($1::text[]), $2 ON CONFLICT (id) DO NOTHING'
+    ),
+}
+
+# Search (see search.py): the 'simple' configuration lowercases words without stemming,
+# like search.terms, and the expression matches idx_messages_fts so the GIN index is used
+SEARCH = (
+    f'SELECT {COLUMNS} FROM messages WHERE room_id = %s '
+    "AND to_tsvector('simple', message_text) @@ plainto_tsquery('simple', %s) "
+    'AND (created_at, id) < (%s::timestamp, %s::bigint) ORDER BY created_at DESC, id DESC LIMIT %s'
+)
+
+# Exports (see export.py): oldest first from a key, one page per call, along idx_messages_(room_)created_id
+MESSAGES_AFTER = (
+    f'SELECT {COLUMNS} FROM messages WHERE {{room}} (created_at, id) > (%s::timestamp, %s::bigint) '
+    'AND created_at < %s::timestamp ORDER BY created_at, id LIMIT %s'
+)
+
+# Retention (see retention.py). Batches are picked with SKIP LOCKED, so workers
+# running the job at the same time delete disjoint rows instead of waiting on each other.
+DELETE_BEFORE = (
+    'DELETE FROM messages WHERE id IN ('
+    'SELECT id FROM messages WHERE {room} NOT (room_id = ANY(%s::text[])) AND (created_at, id) < (%s::timestamp, %s::bigint) '
+    'ORDER BY created_at, id LIMIT %s FOR UPDATE SKIP LOCKED)'
+)
+
+
+def eventlet_wait_callback(conn, timeout=-1):
+    """psycopg2 wait callback that yields to the eventlet hub instead of blocking it"""
+    from eventlet.hubs import trampoline
+    while True:
+        state = conn.poll()
+        if state == psycopg2.extensions.POLL_OK:
+            break
+        elif state == psycopg2.extensions.POLL_READ:
+            trampoline(conn.fileno(), read=True)
+        elif state == psycopg2.extensions.POLL_WRITE:
+            trampoline(conn.fileno(), write=True)
+        else:
+            raise psycopg2.OperationalError(f"Bad result from poll: {state!r}")
+
+
+class _Connection(psycopg2.extensions.connection):
+    """Connection that remembers which statements it has prepared"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+class ConnectionPool:
+    """Bounded connection pool; waiting callers yield instead of opening more connections"""
+
+    def __init__(self, dsn, size=POOL_SIZE, timeout=POOL_TIMEOUT, green=False):
+        self.dsn = dsn
+        self.size = size
+        self.timeout = timeout
+        self._idle = deque()
+        if green:
+            # Queries yield to the hub, so the greenlets holding connections only get to
+            # release them if a caller waiting for one yields too
+            from eventlet.semaphore import BoundedSemaphore
+            self._slots = BoundedSemaphore(size)
+        else:
+            self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def _open(self):
+        conn = psycopg2.connect(self.dsn, connection_factory=_Connection, connect_timeout=CONNECT_TIMEOUT)
+        self.opened += 1
+        return conn
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"no database connection free after {self.timeout}s")
+        try:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None or conn.closed:
+                conn = self._open()
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn, broken=False):
+        try:
+            if broken or conn.closed:
+                conn.close()
+            else:
+                if conn.status != psycopg2.extensions.STATUS_READY:
+                    conn.rollback()
+                with self._lock:
+                    self._idle.append(conn)
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        with self._lock:
+            while self._idle:
+                self._idle.pop().close()
+
+
+class PostgresBackend:
+    """save_messages / fetch_messages_before / create_rooms against Postgres directly"""
+    name = 'pg'
+
+    def __init__(self, dsn, pool_size=POOL_SIZE, green=True):
+        if green:
+            try:
+                import eventlet  # noqa: F401
+                psycopg2.extensions.set_wait_callback(eventlet_wait_callback)
+            except ImportError:
+                green = False
+        self.pool = ConnectionPool(dsn, size=pool_size, green=green)
+
+    def _run(self, work):
+        conn = self.pool.acquire()
+        broken = False
+        try:
+            with conn.cursor() as cur:
+                result = work(conn, cur)
+            conn.commit()
+            return result
+        except psycopg2.OperationalError:
+            broken = True
+            raise
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.release(conn, broken=broken)
+
+    @staticmethod
+    def _prepare(conn, cur, name):
+        if name not in conn.prepared:
+            params, sql = STATEMENTS[name]
+            cur.execute(f'PREPARE {name} {params} AS {sql}')
+            conn.prepared.add(name)
+
+    @staticmethod
+    def _row(values):
+        row = dict(zip(('id', 'room_id', 'user_handle', 'message_text', 'created_at', 'updated_at'), values))
+        for key in ('created_at', 'updated_at'):
+            if isinstance(row[key], datetime):
+                row[key] = row[key].isoformat()
+        return row
+
+    def ensure_schema(self):
+        """Create the tables and index if they don't exist"""
+        return self._run(lambda conn, cur: cur.execute(SCHEMA))
+
+    def save_messages(self, rows):
+        def work(conn, cur):
+            args = [(r['room_id'], r['user_handle'], r['message_text'], r.get('created_at')) for r in rows]
+            # One round trip per page of rows, all in a single transaction
+            saved = psycopg2.extras.execute_values(cur, INSERT_MESSAGES, args,
+                                                   '(%s, %s, %s, COALESCE(%s::timestamp, NOW()))',
+                                                   page_size=100, fetch=True)
+            return [self._row(values) for values in saved]
+        try:
+            result = self._run(work)
+            log.debug("Saved messages", extra={'rows': len(rows), 'path': 'pg'})
+            return result
+        except Exception as e:
+            log.error("Exception saving messages", extra={'error': str(e), 'path': 'pg'})
+            return None
+
+    def fetch_messages_before(self, room_id, before=None, limit=50):
+        def work(conn, cur):
+            if before is None:
+                self._prepare(conn, cur, 'chat_recent_messages')
+                cur.execute('EXECUTE chat_recent_messages (%s, %s)', (room_id, limit))
+            else:
+                created_at, message_id = before
+                self._prepare(conn, cur, 'chat_messages_before')
+                # id 0 sorts below every real id, so this means "strictly older than created_at"
+                cur.execute('EXECUTE chat_messages_before (%s, %s, %s, %s)',
+                            (room_id, created_at, message_id or 0, limit))
+            return [self._row(values) for values in reversed(cur.fetchall())]
+        try:
+            return self._run(work)
+        except Exception as e:
+            log.error("Exception retrieving messages", extra={'error': str(e), 'path': 'pg'})
+            return None
+
+    def fetch_messages_after(self, room_id, after=None, until=None, limit=500):
+        """Oldest first, strictly after the (created_at, id) key and before until; room_id None is every room"""
+        created_at, message_id = after if after is not None else ('-infinity', None)
+        def work(conn, cur):
+            if room_id is None:
+                cur.execute(MESSAGES_AFTER.format(room=''), (created_at, message_id or 0, until or 'infinity', limit))
+            else:
+                cur.execute(MESSAGES_AFTER.format(room='room_id = %s AND'),
+                            (room_id, created_at, message_id or 0, until or 'infinity', limit))
+            return [self._row(values) for values in cur.fetchall()]
+        try:
+            return self._run(work)
+        except Exception as e:
+            log.error("Exception exporting messages", extra={'error': str(e), 'path': 'pg'})
+            return None
+
+    def search_messages(self, room_id, words, before=None, limit=20):
+        """Messages containing every word, newest first, through the GIN full-text index"""
+        created_at, message_id = before if before else ('infinity', None)
+        def work(conn, cur):
+            cur.execute(SEARCH, (room_id, ' '.join(words), created_at, message_id or 0, limit))
+            return [self._row(values) for values in cur.fetchall()]
+        try:
+            return self._run(work)
+        except Exception as e:
+            log.error("Exception searching messages", extra={'error': str(e), 'path': 'pg'})
+            return None
+
+    def create_rooms(self, room_ids):
+        """Upsert rooms in one statement; returns how many were actually new"""
+        def work(conn, cur):
+            self._prepare(conn, cur, 'chat_upsert_rooms')
+            cur.execute('EXECUTE chat_upsert_rooms (%s, %s)', (list(room_ids), datetime.utcnow()))
+            return cur.rowcount
+        try:
+            created = self._run(work)
+            log.debug("Rooms ensured", extra={'rooms': len(room_ids), 'new_rooms': created, 'path': 'pg'})
+            return created
+        except Exception as e:
+            log.error("Exception upserting rooms", extra={'error': str(e), 'path': 'pg'})
+            return None
+
+    def delete_messages_before(self, room_id, before, limit, exclude=()):
+        """Delete up to limit messages older than the (created_at, id) key; returns rows deleted"""
+        created_at, message_id = before
+        def work(conn, cur):
+            if room_id is None:
+                cur.execute(DELETE_BEFORE.format(room=''), (list(exclude), created_at, message_id or 0, limit))
+            else:
+                cur.execute(DELETE_BEFORE.format(room='room_id = %s AND'),
+                            (room_id, list(exclude), created_at, message_id or 0, limit))
+            return cur.rowcount
+        try:
+            return self._run(work)
+        except Exception as e:
+            log.error("Exception deleting messages", extra={'error': str(e), 'path': 'pg'})
+            return None
+
+    def nth_newest(self, room_id, offset):
+        """(created_at, id) of the message offset places below the newest, or None"""
+        def work(conn, cur):
+            cur.execute('SELECT created_at, id FROM messages WHERE room_id = %s '
+                        'ORDER BY created_at DESC, id DESC OFFSET %s LIMIT 1', (room_id, offset))
+            found = cur.fetchone()
+            return (found[0].isoformat(), found[1]) if found else None
+        try:
+            return self._run(work)
+        except Exception as e:
+            log.error("Exception finding retention boundary", extra={'error': str(e), 'path': 'pg'})
+            return None
+
+    def list_rooms(self, after='', limit=500):
+        """Room ids in order, the page after `after`"""
+        def work(conn, cur):
+            cur.execute('SELECT id FROM rooms WHERE id > %s ORDER BY id LIMIT %s', (after, limit))
+            return [row[0] for row in cur.fetchall()]
+        try:
+            return self._run(work)
+        except Exception as e:
+            log.error("Exception listing rooms", extra={'error': str(e), 'path': 'pg'})
+            return None
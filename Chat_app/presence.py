@@ -0,0 +1,177 @@
+"""
+Room presence and typing indicators
+Joins, leaves and typing changes are collected per room and broadcast as one
+"presence" diff per interval, so a join storm or a room full of typists costs
+at most one frame per room per interval.
+
+PRESENCE_INTERVAL_MS  how often pending diffs are sent (default 1000)
+TYPING_TTL_MS         a typing indicator expires this long after the last keystroke (default 4000)
+PRESENCE_MAX_LIST     handles listed per diff field; the rest are only counted (default 20)
+PRESENCE_SNAPSHOT_MAX handles sent to a joiner in its member list (default 200)
+PRESENCE_LEAVE_GRACE_MS a leave is announced only if the handle hasn't rejoined this long after it
+                      (default 10000), so a reconnecting client is neither announced as gone nor as new
+"""
+
+import os
+import threading
+import time
+
+import applog
+
+log = applog.get_logger('presence')
+
+INTERVAL_MS = float(os.getenv('PRESENCE_INTERVAL_MS', '1000'))
+TYPING_TTL_MS = float(os.getenv('TYPING_TTL_MS', '4000'))
+MAX_LIST = int(os.getenv('PRESENCE_MAX_LIST', '20'))
+SNAPSHOT_MAX = int(os.getenv('PRESENCE_SNAPSHOT_MAX', '200'))
+LEAVE_GRACE_MS = float(os.getenv('PRESENCE_LEAVE_GRACE_MS', '10000'))
+
+
+class _RoomState:
+    __slots__ = ('joined', 'left', 'leaving', 'typing', 'typing_changed')
+
+    def __init__(self):
+        self.joined = set()
+        self.left = set()
+        self.leaving = {}       # handle -> when its leave is announced (monotonic seconds)
+        self.typing = {}        # handle -> expiry (monotonic seconds)
+        self.typing_changed = False
+
+    def idle(self):
+        return not (self.joined or self.left or self.leaving or self.typing or self.typing_changed)
+
+
+class PresenceTracker:
+    """Aggregates per-room presence changes into periodic diffs"""
+
+    def __init__(self, send, count, interval_ms=INTERVAL_MS, typing_ttl_ms=TYPING_TTL_MS,
+                 max_list=MAX_LIST, leave_grace_ms=LEAVE_GRACE_MS, clock=time.monotonic, sleep=time.sleep):
+        # send(room, diff) broadcasts a diff; count(room) is the room's current member count
+        self.send = send
+        self.count = count
+        self.interval = interval_ms / 1000.0
+        self.typing_ttl = typing_ttl_ms / 1000.0
+        self.max_list = max_list
+        self.leave_grace = leave_grace_ms / 1000.0
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._rooms = {}        # only rooms with something pending or someone typing
+        self._running = False
+
+        # Counters
+        self.diffs = 0
+        self.typing_events = 0
+        self.rejoins = 0
+
+    def _state(self, room):
+        state = self._rooms.get(room)
+        if state is None:
+            state = self._rooms[room] = _RoomState()
+        return state
+
+    def joined(self, room, handle):
+        with self._lock:
+            state = self._state(room)
+            if state.leaving.pop(handle, None) is not None:
+                # Back within the grace window: nobody was told it left
+                self.rejoins += 1
+            elif handle in state.left:
+                state.left.discard(handle)
+            else:
+                state.joined.add(handle)
+
+    def left(self, room, handle):
+        with self._lock:
+            state = self._state(room)
+            # A join and leave inside one interval cancel out
+            if handle in state.joined:
+                state.joined.discard(handle)
+            elif self.leave_grace > 0:
+                state.leaving[handle] = self._clock() + self.leave_grace
+            else:
+                state.left.add(handle)
+            if state.typing.pop(handle, None) is not None:
+                state.typing_changed = True
+
+    def typing(self, room, handle):
+        """Note a keystroke; only a handle that wasn't already typing changes the next diff"""
+        with self._lock:
+            self.typing_events += 1
+            state = self._state(room)
+            if handle not in state.typing:
+                state.typing_changed = True
+            state.typing[handle] = self._clock() + self.typing_ttl
+
+    def stopped_typing(self, room, handle):
+        with self._lock:
+            state = self._rooms.get(room)
+            if state is not None and state.typing.pop(handle, None) is not None:
+                state.typing_changed = True
+
+    def _diff(self, room, state):
+        joined, left, typing = sorted(state.joined), sorted(state.left), sorted(state.typing)
+        return {
+            'count': self.count(room),
+            'joined': joined[:self.max_list],
+            'left': left[:self.max_list],
+            'joined_count': len(joined),
+            'left_count': len(left),
+            'typing': typing[:self.max_list],
+            'typing_count': len(typing),
+        }
+
+    def flush(self):
+        """Expire typing indicators and grace windows and send each changed room's diff; returns diffs sent"""
+        now = self._clock()
+        out = []
+        with self._lock:
+            for room, state in list(self._rooms.items()):
+                gone = [h for h, at in state.leaving.items() if at <= now]
+                for handle in gone:
+                    del state.leaving[handle]
+                    state.left.add(handle)
+                expired = [h for h, expires in state.typing.items() if expires <= now]
+                for handle in expired:
+                    del state.typing[handle]
+                if expired:
+                    state.typing_changed = True
+                if state.joined or state.left or state.typing_changed:
+                    out.append((room, self._diff(room, state)))
+                    state.joined.clear()
+                    state.left.clear()
+                    state.typing_changed = False
+                if state.idle():
+                    del self._rooms[room]
+        for room, diff in out:
+            try:
+                self.send(room, diff)
+            except Exception as e:
+                log.error("Presence broadcast failed", extra={'room': room, 'error': str(e)})
+        self.diffs += len(out)
+        return len(out)
+
+    def _run(self):
+        while self._running:
+            self._sleep(self.interval)
+            self.flush()
+
+    def start(self, socketio):
+        """Send diffs from a Socket.IO background task"""
+        if self._running:
+            return
+        self._sleep = socketio.sleep
+        self._running = True
+        socketio.start_background_task(self._run)
+
+    def stop(self):
+        self._running = False
+
+    def stats(self):
+        """Snapshot of presence counters"""
+        return {
+            'pending_rooms': len(self._rooms),
+            'diffs': self.diffs,
+            'typing_events': self.typing_events,
+            'rejoins': self.rejoins,
+        }
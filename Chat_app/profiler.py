@@ -0,0 +1,261 @@
+"""
+Sampling profiler and hub-lag monitor for the eventlet worker
+Every green thread runs on the one OS thread the eventlet hub runs on, so a call
+that blocks (a synchronous HTTP request, a big JSON encode) stalls them all. Both
+tools watch that thread from a separate OS thread, which keeps running while the
+hub is stuck.
+
+SamplingProfiler samples, every PROFILE_INTERVAL_MS, the stack of the code
+running on the hub's thread and, on request, the stack each waiting green thread
+is parked in (a tenth as often). The result is in the collapsed-stack format flamegraph.pl and
+speedscope read: one "frame;frame;frame count" line per distinct stack.
+
+HubLagMonitor is always on: a green thread asks to wake every HUB_LAG_INTERVAL_MS
+and records how late it woke (the time the hub was blocked) in a histogram. A
+watchdog thread grabs the stack of whatever is blocking the hub once a stall
+passes HUB_LAG_SLOW_MS, and the stall is logged with that stack.
+
+PROFILE_INTERVAL_MS   sampling interval (default 5)
+PROFILE_MAX_SECONDS   longest profile one request may ask for (default 60)
+PROFILE_STACK_DEPTH   frames kept per stack, innermost first (default 64)
+HUB_LAG_INTERVAL_MS   how often the lag monitor wakes (default 100; 0 = off)
+HUB_LAG_SLOW_MS       lag at which a stall is logged with the blocking stack (default 100)
+"""
+
+import gc
+import importlib
+import os
+import sys
+import time
+from collections import Counter, deque
+
+import applog
+
+log = applog.get_logger('profiler')
+
+INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '60'))
+STACK_DEPTH = int(os.getenv('PROFILE_STACK_DEPTH', '64'))
+HUB_LAG_INTERVAL_MS = float(os.getenv('HUB_LAG_INTERVAL_MS', '100'))
+HUB_LAG_SLOW_MS = float(os.getenv('HUB_LAG_SLOW_MS', '100'))
+
+
+def _original(name):
+    """A standard module as it was before eventlet monkey patched it"""
+    try:
+        from eventlet import patcher
+    except ImportError:
+        return importlib.import_module(name)
+    return patcher.original(name)
+
+
+# Walking every parked green thread's stack costs far more than the running one's
+WAITING_EVERY = 10
+
+_thread = _original('_thread')
+_time = _original('time')
+
+_labels = {}
+
+
+def _label(code):
+    label = _labels.get(code)
+    if label is None:
+        path = code.co_filename.replace(os.sep, '/').rsplit('/', 2)
+        where = '/'.join(path[-2:]) if path[-1] == '__init__.py' else path[-1]
+        name = getattr(code, 'co_qualname', code.co_name)
+        # ';' separates frames in a collapsed stack
+        label = _labels[code] = f'{name} ({where}:{code.co_firstlineno})'.replace(';', ':')
+    return label
+
+
+def collapse(frame, depth=STACK_DEPTH):
+    """frame's stack as 'outermost;...;innermost'"""
+    names = []
+    while frame is not None and len(names) < depth:
+        names.append(_label(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def render(counts):
+    """Collapsed-stack text, heaviest stacks first"""
+    return ''.join(f'{stack} {n}\n' for stack, n in counts.most_common())
+
+
+class SamplingProfiler:
+    """Samples the hub thread's stacks from an OS thread; one profile at a time
+
+    Stacks of the code running on the hub are rooted at "running"; with
+    include_waiting, the stacks green threads are parked in are rooted at
+    "waiting" and sampled every WAITING_EVERY-th time.
+    """
+
+    def __init__(self, interval_ms=INTERVAL_MS, depth=STACK_DEPTH):
+        self.interval = interval_ms / 1000.0
+        self.depth = depth
+        self._counts = None       # this profile's samples per stack; None when not profiling
+        self._thread_id = None
+        self._include_waiting = False
+        self._greenlets = None
+        self._spawned = deque()   # greenlets first seen by the tracer, for the sampler to pick up
+        self._previous_trace = None
+        self._done = None          # held by the sampler thread until it exits
+        self.samples = 0
+        self.profiles = 0
+
+    @property
+    def running(self):
+        return self._counts is not None
+
+    def start(self, include_waiting=False):
+        """Start sampling the calling OS thread (the hub's); False if a profile is already running"""
+        if self._counts is not None:
+            return False
+        self._counts = Counter()
+        self.samples = 0
+        self._thread_id = _thread.get_ident()
+        self._include_waiting = include_waiting
+        if include_waiting:
+            import greenlet
+            import weakref
+            # Green threads alive now, then the ones the tracer sees switched to
+            self._greenlets = weakref.WeakSet(o for o in gc.get_objects() if isinstance(o, greenlet.greenlet))
+            self._previous_trace = greenlet.settrace(self._trace)
+        self.profiles += 1
+        self._done = _thread.allocate_lock()
+        self._done.acquire()
+        _thread.start_new_thread(self._run, (self._counts, self._done))
+        return True
+
+    def stop(self):
+        """Stop sampling; returns the sample count per collapsed stack"""
+        if self._counts is None:
+            return Counter()
+        if self._include_waiting:
+            import greenlet
+            greenlet.settrace(self._previous_trace)
+            self._previous_trace = None
+        counts, self._counts = self._counts, None
+        # Wait out the sample in progress (at most one interval) so counts no longer change
+        self._done.acquire()
+        return counts
+
+    def profile(self, seconds, sleep, include_waiting=False):
+        """Sample for `seconds`, waiting with the green `sleep`; collapsed stacks, or None if one is running"""
+        if not self.start(include_waiting):
+            return None
+        try:
+            sleep(seconds)
+        finally:
+            counts = self.stop()
+        log.info("Profile taken", extra={'seconds': seconds, 'samples': self.samples, 'stacks': len(counts)})
+        return render(counts)
+
+    def _trace(self, event, args):
+        if event in ('switch', 'throw'):
+            self._spawned.append(args[1])
+        if self._previous_trace is not None:
+            self._previous_trace(event, args)
+
+    def _run(self, counts, done):
+        try:
+            self._sample(counts)
+        finally:
+            done.release()
+
+    def _sample(self, counts):
+        # A sampler stops when its profile does, even if the next one has already started
+        while self._counts is counts:
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                counts['running;' + collapse(frame, self.depth)] += 1
+            if self._include_waiting and self.samples % WAITING_EVERY == 0:
+                while self._spawned:
+                    self._greenlets.add(self._spawned.popleft())
+                for green in list(self._greenlets):
+                    # gr_frame is None for the green thread that is running and for finished ones
+                    parked = green.gr_frame
+                    if parked is not None:
+                        counts['waiting;' + collapse(parked, self.depth)] += 1
+            self.samples += 1
+            del frame
+            _time.sleep(self.interval)
+
+    def stats(self):
+        return {'running': int(self.running), 'profiles': self.profiles, 'samples': self.samples}
+
+
+class HubLagMonitor:
+    """How long the hub went without running its green threads, and what held it up"""
+
+    def __init__(self, observe, interval_ms=HUB_LAG_INTERVAL_MS, slow_ms=HUB_LAG_SLOW_MS,
+                 clock=time.monotonic, sleep=time.sleep):
+        self._observe = observe   # observe(seconds late)
+        self.interval = interval_ms / 1000.0
+        self.slow = slow_ms / 1000.0
+        self._clock = clock
+        self._sleep = sleep
+        self._running = False
+        self._thread_id = None
+        self._due = None          # when the monitor's green thread should next wake
+        self._tick = 0
+        self._blocked = None      # (tick, stack) grabbed by the watchdog during a stall
+
+        # Counters
+        self.ticks = 0
+        self.stalls = 0
+        self.max_lag_ms = 0.0
+        self.last_stall_stack = ''
+
+    def tick(self, late):
+        """Record one wake-up that came `late` seconds after it was due"""
+        late = max(0.0, late)
+        self._observe(late)
+        self.ticks += 1
+        self.max_lag_ms = max(self.max_lag_ms, round(late * 1000, 1))
+        if late < self.slow:
+            return
+        self.stalls += 1
+        blocked = self._blocked
+        stack = blocked[1] if blocked is not None and blocked[0] == self._tick else ''
+        self.last_stall_stack = stack
+        log.warning("Hub blocked", extra={'lag_ms': round(late * 1000, 1), 'stack': stack})
+
+    def _run(self):
+        while self._running:
+            self._tick += 1
+            self._due = self._clock() + self.interval
+            self._sleep(self.interval)
+            if self._running:
+                self.tick(self._clock() - self._due)
+
+    def _watch(self):
+        # Checks twice per slow threshold, so a stall is caught by the time it is 1.5x the threshold
+        while self._running:
+            _time.sleep(self.slow / 2)
+            due, tick = self._due, self._tick
+            if due is None or self._clock() - due < self.slow:
+                continue
+            if self._blocked is None or self._blocked[0] != tick:
+                frame = sys._current_frames().get(self._thread_id)
+                self._blocked = (tick, collapse(frame) if frame is not None else '')
+                del frame
+
+    def start(self, socketio):
+        """Watch the hub of the calling OS thread; does nothing when the interval is 0"""
+        if self._running or self.interval <= 0:
+            return False
+        self._sleep = socketio.sleep
+        self._thread_id = _thread.get_ident()
+        self._running = True
+        socketio.start_background_task(self._run)
+        _thread.start_new_thread(self._watch, ())
+        return True
+
+    def stop(self):
+        self._running = False
+
+    def stats(self):
+        """Snapshot of lag counters"""
+        return {'ticks': self.ticks, 'stalls': self.stalls, 'max_lag_ms': self.max_lag_ms}
@@ -0,0 +1,205 @@
+"""
+Inter-process pub/sub for room broadcasts
+Lets several app.py workers deliver each other's room messages
+
+SOCKETIO_MESSAGE_QUEUE selects the backend:
+  (empty)                 single process, no message queue
+  redis://host:6379/0     Redis (or any Redis-compatible server)
+  kafka://, zmq+tcp://,
+  amqp://                 the other Flask-SocketIO message queues
+  local://host:port       the pure-Python broker below (tests and single-host setups)
+
+Run the local broker with:  python pubsub.py --port 6390
+"""
+
+import argparse
+import importlib.util
+import json
+import socketserver
+import threading
+import time
+
+import socketio
+
+import applog
+
+log = applog.get_logger('pubsub')
+
+CHANNEL = 'flask-socketio'
+
+
+def socketio_options(url, channel=CHANNEL):
+    """Extra SocketIO(...) keyword arguments for the configured message queue"""
+    if not url:
+        return {}
+    if url.startswith('local://'):
+        return {'client_manager': LocalBrokerManager(url, channel=channel)}
+    if url.startswith(('redis://', 'rediss://')) and importlib.util.find_spec('redis') is None:
+        # Flask-SocketIO would only fail later, inside the manager, with a less helpful message
+        raise RuntimeError(f"SOCKETIO_MESSAGE_QUEUE={url} needs the redis package: pip install redis")
+    return {'message_queue': url, 'channel': channel}
+
+
+def on_remote_emit(server, callback):
+    """Call callback(event, data, room) for every emit relayed from another worker.
+
+    Used to keep per-process state (like the history cache) in step with
+    messages that arrive over the bus instead of through a local handler.
+    """
+    manager = server.manager
+    if not isinstance(manager, socketio.PubSubManager):
+        return False
+    original = manager._handle_emit
+
+    def handle_emit(message):
+        original(message)
+        # emit() runs this for the sending worker's own emits too; those aren't remote
+        if message.get('host_id') == manager.host_id:
+            return
+        try:
+            callback(message.get('event'), message.get('data'), message.get('room'))
+        except Exception as e:
+            log.error("Remote emit hook failed", extra={'error': str(e)})
+
+    manager._handle_emit = handle_emit
+    return True
+
+
+def listen(server):
+    """Start receiving from the bus now; python-socketio otherwise waits for the first client to connect"""
+    if not server.manager_initialized:
+        server.manager_initialized = True
+        server.manager.initialize()
+
+
+def _parse_url(url):
+    host, _, port = url[len('local://'):].rstrip('/').rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+class LocalBrokerManager(socketio.PubSubManager):
+    """Socket.IO client manager that talks to the local broker over TCP"""
+    name = 'local'
+
+    def __init__(self, url='local://127.0.0.1:6390', channel=CHANNEL, write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.address = _parse_url(url)
+        self._pub = None
+        self._pub_lock = None
+
+    def _green(self):
+        return self.server is not None and getattr(self.server, 'async_mode', None) == 'eventlet'
+
+    def _socket_module(self):
+        # Use green sockets under eventlet so the listener doesn't block the hub
+        if self._green():
+            from eventlet.green import socket
+            return socket
+        import socket
+        return socket
+
+    def _lock(self):
+        # Connecting the publisher yields to the hub; a greenlet waiting on a plain
+        # lock meanwhile would block the hub and the connect would never finish
+        if self._pub_lock is None:
+            if self._green():
+                from eventlet.semaphore import Semaphore
+                self._pub_lock = Semaphore()
+            else:
+                self._pub_lock = threading.Lock()
+        return self._pub_lock
+
+    def _connect(self):
+        sock = self._socket_module().create_connection(self.address, timeout=5)
+        sock.settimeout(None)
+        return sock
+
+    def _publish(self, data):
+        frame = (json.dumps({'channel': self.channel, 'data': data}) + '\n').encode()
+        with self._lock():
+            for attempt in range(2):
+                try:
+                    if self._pub is None:
+                        self._pub = self._connect()
+                    self._pub.sendall(frame)
+                    return
+                except OSError as e:
+                    log.warning("Publish failed, reconnecting", extra={'error': str(e)})
+                    if self._pub is not None:
+                        self._pub.close()
+                    self._pub = None
+
+    def _listen(self):
+        delay = 0.5
+        while True:
+            try:
+                sock = self._connect()
+                reader = sock.makefile('rb')
+                delay = 0.5
+                for line in reader:
+                    try:
+                        message = json.loads(line)
+                    except ValueError:
+                        continue
+                    if message.get('channel') == self.channel and 'data' in message:
+                        yield message['data']
+                sock.close()
+            except OSError as e:
+                log.warning("Broker connection lost", extra={'error': str(e), 'retry_in': delay})
+            sleep = self.server.sleep if self.server is not None else time.sleep
+            sleep(delay)
+            delay = min(delay * 2, 10)
+
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        broker = self.server
+        with broker.lock:
+            broker.clients.add(self.wfile)
+        try:
+            for line in self.rfile:
+                with broker.lock:
+                    dead = []
+                    for out in broker.clients:
+                        try:
+                            out.write(line)
+                            out.flush()
+                        except OSError:
+                            dead.append(out)
+                    for out in dead:
+                        broker.clients.discard(out)
+        finally:
+            with broker.lock:
+                broker.clients.discard(self.wfile)
+
+
+class LocalBroker(socketserver.ThreadingTCPServer):
+    """Minimal fan-out broker: every line a client sends goes to every client"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=6390):
+        super().__init__((host, port), _BrokerHandler)
+        self.lock = threading.Lock()
+        self.clients = set()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"local://{host}:{port}"
+
+    def start(self):
+        """Serve from a background thread (for tests)"""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local pub/sub broker for multi-worker chat')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6390)
+    args = parser.parse_args()
+    broker = LocalBroker(args.host, args.port)
+    print(f"[PUBSUB] Broker listening on {broker.url}")
+    broker.serve_forever()
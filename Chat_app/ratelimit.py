@@ -0,0 +1,133 @@
+"""
+Token-bucket rate limiting for Socket.IO events
+Each sid, room and (optionally) client IP gets a bucket that refills at `rate` per second up to `burst`
+
+RATE_LIMIT_SID_RATE / _BURST    per connection (default 5/s, burst 10; 0 = off)
+RATE_LIMIT_ROOM_RATE / _BURST   per room across all senders (default 50/s, burst 100; 0 = off)
+RATE_LIMIT_IP_RATE / _BURST     per client IP across its connections (default 0 = off)
+RATE_LIMIT_TYPING_RATE / _BURST typing events per connection, kept apart from the others (default 1/s, burst 3)
+RATE_LIMIT_ACTION               throttle (default: drop the event and tell the client) or disconnect
+RATE_LIMIT_TRUST_PROXY          1 to take the client IP from X-Forwarded-For (behind Render's proxy etc.)
+RATE_LIMIT_MAX_KEYS             room / IP buckets kept before the least recently used are dropped
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import applog
+
+log = applog.get_logger('ratelimit')
+
+Limit = namedtuple('Limit', 'rate burst')
+
+
+def _limit(prefix, rate, burst):
+    return Limit(float(os.getenv(f'{prefix}_RATE', rate)), float(os.getenv(f'{prefix}_BURST', burst)))
+
+
+SID_LIMIT = _limit('RATE_LIMIT_SID', '5', '10')
+ROOM_LIMIT = _limit('RATE_LIMIT_ROOM', '50', '100')
+IP_LIMIT = _limit('RATE_LIMIT_IP', '0', '20')
+# The page sends at most one typing event every 2 s, so this only stops floods
+TYPING_LIMIT = _limit('RATE_LIMIT_TYPING', '1', '3')
+ACTION = os.getenv('RATE_LIMIT_ACTION', 'throttle').strip().lower()
+TRUST_PROXY = os.getenv('RATE_LIMIT_TRUST_PROXY', '0').lower() in ('1', 'true', 'yes')
+MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', '10000'))
+
+
+def client_ip(environ):
+    """Client address from a WSGI environ, honouring X-Forwarded-For when TRUST_PROXY is on"""
+    if TRUST_PROXY:
+        forwarded = environ.get('HTTP_X_FORWARDED_FOR', '')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return environ.get('REMOTE_ADDR')
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, burst, now):
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, limit, now):
+        self.tokens = min(limit.burst, self.tokens + (now - self.updated) * limit.rate)
+        self.updated = now
+
+
+class RateLimiter:
+    """Buckets per sid and typing per sid (removed on disconnect) plus LRU-bounded buckets per room and IP"""
+
+    def __init__(self, sid_limit=SID_LIMIT, room_limit=ROOM_LIMIT, ip_limit=IP_LIMIT,
+                 max_keys=MAX_KEYS, clock=time.monotonic, typing_limit=TYPING_LIMIT):
+        self.limits = {'sid': sid_limit, 'room': room_limit, 'ip': ip_limit, 'typing': typing_limit}
+        self.max_keys = max_keys
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets = {'sid': {}, 'room': OrderedDict(), 'ip': OrderedDict(), 'typing': {}}
+
+        # Counters
+        self.allowed = 0
+        self.limited = {'sid': 0, 'room': 0, 'ip': 0, 'typing': 0}
+
+    def _bucket(self, scope, key, now):
+        buckets = self._buckets[scope]
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(self.limits[scope].burst, now)
+            # An evicted bucket has usually refilled anyway, so dropping the oldest loses nothing
+            if scope in ('room', 'ip') and len(buckets) > self.max_keys:
+                buckets.popitem(last=False)
+        else:
+            bucket.refill(self.limits[scope], now)
+            if scope in ('room', 'ip'):
+                buckets.move_to_end(key)
+        return bucket
+
+    def check(self, sid, room=None, ip=None, cost=1, typing=False):
+        """Take cost tokens from every applicable bucket.
+
+        Returns None if allowed, else (scope, retry_after_seconds) for the first
+        bucket that is short; nothing is taken from any bucket in that case.
+        A typing event only draws on the sid's typing bucket, so typing never
+        uses up the budget for messages.
+        """
+        now = self._clock()
+        scopes = (('typing', sid),) if typing else (('sid', sid), ('room', room), ('ip', ip))
+        with self._lock:
+            taken = []
+            for scope, key in scopes:
+                limit = self.limits[scope]
+                if key is None or limit.rate <= 0:
+                    continue
+                bucket = self._bucket(scope, key, now)
+                if bucket.tokens < cost:
+                    self.limited[scope] += 1
+                    return scope, round((cost - bucket.tokens) / limit.rate, 3)
+                taken.append(bucket)
+            for bucket in taken:
+                bucket.tokens -= cost
+            self.allowed += 1
+            return None
+
+    def forget(self, sid):
+        """Drop a disconnected sid's bucket"""
+        with self._lock:
+            self._buckets['sid'].pop(sid, None)
+            self._buckets['typing'].pop(sid, None)
+
+    def stats(self):
+        """Snapshot of limiter counters"""
+        return {
+            'allowed': self.allowed,
+            'limited_sid': self.limited['sid'],
+            'limited_room': self.limited['room'],
+            'limited_ip': self.limited['ip'],
+            'limited_typing': self.limited['typing'],
+            'sids': len(self._buckets['sid']),
+            'rooms': len(self._buckets['room']),
+            'ips': len(self._buckets['ip']),
+        }
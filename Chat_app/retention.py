@@ -0,0 +1,185 @@
+"""
+Message retention
+Deletes old messages on a schedule, in bounded batches, by age and by count per room
+
+RETENTION_MAX_AGE_DAYS      delete messages older than this (default 0 = keep forever)
+RETENTION_MAX_COUNT         keep at most this many messages per room (default 0 = no limit)
+RETENTION_ROOM_POLICIES     per-room overrides as JSON, e.g. {"lobby": {"max_age_days": 1, "max_count": 500}}
+RETENTION_INTERVAL_SECONDS  time between runs (default 3600)
+RETENTION_BATCH_SIZE        rows deleted per statement (default 500)
+RETENTION_BATCH_PAUSE_MS    pause between batches so other queries get the database (default 50)
+
+Every delete is a predicate on (created_at, id), so several workers running the
+job at once is safe: each row is deleted by whichever worker reaches it first.
+"""
+
+import json
+import os
+import random
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import applog
+import db
+import metrics
+
+log = applog.get_logger('retention')
+
+Policy = namedtuple('Policy', 'max_age_days max_count')
+
+DEFAULT_POLICY = Policy(float(os.getenv('RETENTION_MAX_AGE_DAYS', '0')), int(os.getenv('RETENTION_MAX_COUNT', '0')))
+ROOM_POLICIES = os.getenv('RETENTION_ROOM_POLICIES', '')
+INTERVAL = float(os.getenv('RETENTION_INTERVAL_SECONDS', '3600'))
+BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '500'))
+BATCH_PAUSE_MS = float(os.getenv('RETENTION_BATCH_PAUSE_MS', '50'))
+ROOMS_PAGE = 500
+
+DELETED = metrics.Counter('chat_retention_deleted_total', 'Messages removed by the retention job', ['reason'])
+
+
+def load_policies(raw, default=DEFAULT_POLICY):
+    """Per-room Policy from RETENTION_ROOM_POLICIES JSON; unset fields fall back to the default"""
+    if not raw:
+        return {}
+    try:
+        overrides = json.loads(raw)
+    except ValueError as e:
+        log.error("Ignoring malformed RETENTION_ROOM_POLICIES", extra={'error': str(e)})
+        return {}
+    return {
+        str(room): Policy(float(policy.get('max_age_days', default.max_age_days)),
+                          int(policy.get('max_count', default.max_count)))
+        for room, policy in overrides.items()
+    }
+
+
+class RetentionJob:
+    """Periodic age and per-room count cleanup through db.delete_messages_before"""
+
+    def __init__(self, default=DEFAULT_POLICY, rooms=None, interval=INTERVAL, batch_size=BATCH_SIZE,
+                 batch_pause_ms=BATCH_PAUSE_MS, sleep=time.sleep, now=datetime.utcnow):
+        self.default = default
+        self.rooms = load_policies(ROOM_POLICIES, default) if rooms is None else rooms
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause_ms / 1000.0
+        self._sleep = sleep
+        self._now = now
+        self._call = lambda fn, *args: fn(*args)
+        self._running = False
+
+        # Counters
+        self.runs = 0
+        self.deleted_by_age = 0
+        self.deleted_by_count = 0
+        self.failures = 0
+        self.last_run_ms = 0.0
+
+    @property
+    def enabled(self):
+        policies = [self.default, *self.rooms.values()]
+        return any(p.max_age_days > 0 or p.max_count > 0 for p in policies)
+
+    def _delete_all(self, room, before, exclude=()):
+        """Delete everything older than before, one bounded batch at a time"""
+        total = 0
+        while True:
+            removed = self._call(db.delete_messages_before, room, before, self.batch_size, exclude)
+            if removed is None:
+                self.failures += 1
+                return total
+            total += removed
+            if removed < self.batch_size:
+                return total
+            self._sleep(self.batch_pause)
+
+    def _cutoff(self, days):
+        return ((self._now() - timedelta(days=days)).isoformat(), None)
+
+    def _count_limits(self):
+        """(room, max_count) for every room that has a count limit"""
+        if self.default.max_count <= 0:
+            yield from ((room, p.max_count) for room, p in self.rooms.items() if p.max_count > 0)
+            return
+        after = ''
+        while True:
+            page = self._call(db.list_rooms, after, ROOMS_PAGE)
+            if page is None:
+                self.failures += 1
+                return
+            for room in page:
+                keep = self.rooms[room].max_count if room in self.rooms else self.default.max_count
+                if keep > 0:
+                    yield room, keep
+            if len(page) < ROOMS_PAGE:
+                return
+            after = page[-1]
+
+    def run_once(self):
+        """One retention pass; returns rows removed by age and by count"""
+        started = time.perf_counter()
+        by_age = by_count = 0
+
+        # Rooms with their own max age are swept separately and left out of the global sweep
+        own_age = {room: p.max_age_days for room, p in self.rooms.items()
+                   if p.max_age_days != self.default.max_age_days}
+        for room, days in own_age.items():
+            if days > 0:
+                by_age += self._delete_all(room, self._cutoff(days))
+        if self.default.max_age_days > 0:
+            by_age += self._delete_all(None, self._cutoff(self.default.max_age_days), sorted(own_age))
+
+        for room, keep in self._count_limits():
+            # Everything older than the keep-th newest message goes
+            boundary = self._call(db.nth_newest_message, room, keep - 1)
+            if boundary is not None:
+                by_count += self._delete_all(room, boundary)
+
+        self.runs += 1
+        self.deleted_by_age += by_age
+        self.deleted_by_count += by_count
+        self.last_run_ms = (time.perf_counter() - started) * 1000
+        DELETED.inc(by_age, reason='age')
+        DELETED.inc(by_count, reason='count')
+        log.info("Retention run", extra={'deleted_by_age': by_age, 'deleted_by_count': by_count,
+                                         'ms': round(self.last_run_ms, 1)})
+        return {'deleted_by_age': by_age, 'deleted_by_count': by_count}
+
+    def _run(self):
+        # Spread workers out so they don't all start their run at the same moment
+        self._sleep(random.uniform(1, min(60, self.interval)))
+        while self._running:
+            try:
+                self.run_once()
+            except Exception as e:
+                self.failures += 1
+                log.error("Retention run failed", extra={'error': str(e)})
+            self._sleep(self.interval)
+
+    def start(self, socketio):
+        """Run on a Socket.IO background task; does nothing when no policy is configured"""
+        if self._running or not self.enabled or db.configured_backend() is None:
+            return False
+        self._sleep = socketio.sleep
+        if db.configured_backend() == 'supabase' and getattr(socketio, 'async_mode', None) == 'eventlet':
+            # Without monkey patching, blocking REST calls would stall the hub; run them on real threads
+            from eventlet import patcher, tpool
+            if not patcher.is_monkey_patched('socket'):
+                self._call = tpool.execute
+        self._running = True
+        socketio.start_background_task(self._run)
+        return True
+
+    def stop(self):
+        self._running = False
+
+    def stats(self):
+        """Snapshot of retention counters"""
+        return {
+            'runs': self.runs,
+            'deleted_by_age': self.deleted_by_age,
+            'deleted_by_count': self.deleted_by_count,
+            'failures': self.failures,
+            'last_run_ms': round(self.last_run_ms, 3),
+        }
@@ -0,0 +1,121 @@
+"""
+Per-room message search
+Query parsing shared by every backend, and the in-process inverted index the
+memory backend searches with (Postgres and SQLite use their own full-text indexes)
+
+A query matches messages containing every one of its words (case-insensitive,
+whole words), newest first.
+
+SEARCH_PAGE_SIZE  results per page (default 20)
+SEARCH_PAGE_MAX   largest page a client may ask for (default 100)
+SEARCH_MAX_TERMS  words of a query that are used; the rest are ignored (default 8)
+"""
+
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_left, insort
+
+PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', '20'))
+PAGE_MAX = int(os.getenv('SEARCH_PAGE_MAX', '100'))
+MAX_TERMS = int(os.getenv('SEARCH_MAX_TERMS', '8'))
+
+_WORD = re.compile(r'\w+')
+
+
+def tokens(text):
+    """Distinct lowercase words of a message"""
+    return set(_WORD.findall((text or '').lower()))
+
+
+def terms(query):
+    """The words a query searches for, in order, without repeats"""
+    words = []
+    for word in _WORD.findall((query or '').lower()):
+        if word not in words:
+            words.append(word)
+    return words[:MAX_TERMS]
+
+
+def _contains(postings, message_id):
+    i = bisect_left(postings, message_id)
+    return i < len(postings) and postings[i] == message_id
+
+
+class InvertedIndex:
+    """room -> word -> ascending message ids, added to as messages are saved
+
+    A query walks the shortest posting list of its words from the newest end and
+    checks the others by binary search, so its cost depends on how often the
+    rarest word occurs, not on how many messages the room has.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rooms = {}
+        self._docs = {}       # id -> message; deleted ids are dropped here and skipped in postings
+        self._stale = 0       # ids still in posting lists after their message was deleted
+
+    def add(self, message):
+        message_id = message['id']
+        with self._lock:
+            self._docs[message_id] = message
+            room = self._rooms.setdefault(message['room_id'], {})
+            for word in tokens(message['message_text']):
+                postings = room.get(word)
+                if postings is None:
+                    postings = room[word] = array('q')
+                if not postings or postings[-1] < message_id:
+                    postings.append(message_id)
+                else:
+                    insort(postings, message_id)
+
+    def remove(self, message_ids):
+        with self._lock:
+            for message_id in message_ids:
+                if self._docs.pop(message_id, None) is not None:
+                    self._stale += 1
+            if self._stale > max(1000, len(self._docs)):
+                self._compact()
+
+    def _compact(self):
+        """Drop deleted ids from every posting list"""
+        for room in self._rooms.values():
+            for word in list(room):
+                kept = array('q', (i for i in room[word] if i in self._docs))
+                if kept:
+                    room[word] = kept
+                else:
+                    del room[word]
+        self._stale = 0
+
+    def search(self, room_id, words, before_id=None, limit=PAGE_SIZE):
+        """Messages in room_id containing every word, newest first, with ids below before_id"""
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if not words or room is None:
+                return []
+            lists = [room.get(word) for word in words]
+            if any(postings is None for postings in lists):
+                return []
+            lists.sort(key=len)
+            shortest, others = lists[0], lists[1:]
+            end = len(shortest) if before_id is None else bisect_left(shortest, before_id)
+            found = []
+            for i in range(end - 1, -1, -1):
+                message_id = shortest[i]
+                message = self._docs.get(message_id)
+                if message is None or not all(_contains(postings, message_id) for postings in others):
+                    continue
+                found.append(message)
+                if len(found) >= limit:
+                    break
+            return found
+
+    def stats(self):
+        return {
+            'rooms': len(self._rooms),
+            'messages': len(self._docs),
+            'stale': self._stale,
+        }
@@ -0,0 +1,103 @@
+"""
+Server-side session registry
+Maps each connected sid to its handle and rooms, so messages only need to carry their text
+
+Membership is per worker (the sids connected to this process).
+"""
+
+import threading
+
+
+class Session:
+    __slots__ = ('sid', 'handle', 'rooms', 'room', 'format')
+
+    def __init__(self, sid, handle):
+        self.sid = sid
+        self.handle = handle
+        self.rooms = set()
+        # The room joined most recently; where a bare-text message goes
+        self.room = None
+        # History wire format the client negotiated (see wire.py)
+        self.format = 'json'
+
+
+class SessionRegistry:
+    """sid -> Session, plus room -> {sid: handle} for O(1) counts and presence lists"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._rooms = {}
+        # room -> {handle: sids}; a resumed handle can briefly be on two sids (old one not yet timed out)
+        self._handles = {}
+
+    def get(self, sid):
+        return self._sessions.get(sid)
+
+    def join(self, sid, room, new_handle):
+        """Add sid to room, creating its session (handle from new_handle()) on first join"""
+        with self._lock:
+            session = self._sessions.get(sid)
+            if session is None:
+                session = self._sessions[sid] = Session(sid, new_handle())
+            members = self._rooms.setdefault(room, {})
+            if sid not in members:
+                members[sid] = session.handle
+                handles = self._handles.setdefault(room, {})
+                handles[session.handle] = handles.get(session.handle, 0) + 1
+            session.rooms.add(room)
+            session.room = room
+            return session
+
+    def remove(self, sid):
+        """Forget a disconnected sid; returns its Session (or None)"""
+        with self._lock:
+            session = self._sessions.pop(sid, None)
+            if session is not None:
+                for room in session.rooms:
+                    self._drop_member(room, sid)
+            return session
+
+    def _drop_member(self, room, sid):
+        members = self._rooms.get(room)
+        if members is None or sid not in members:
+            return
+        handle = members.pop(sid)
+        if not members:
+            del self._rooms[room]
+        handles = self._handles[room]
+        if handles[handle] > 1:
+            handles[handle] -= 1
+        else:
+            del handles[handle]
+            if not handles:
+                del self._handles[room]
+
+    def resolve_room(self, sid, room=None):
+        """Room a message from sid goes to: the given one if sid is in it, else its current room"""
+        session = self._sessions.get(sid)
+        if session is None:
+            return None, None
+        if room is None:
+            return session, session.room
+        return session, (room if room in session.rooms else None)
+
+    def count(self, room):
+        members = self._rooms.get(room)
+        return len(members) if members else 0
+
+    def present(self, room, handle):
+        """True if any sid with this handle is in room"""
+        return handle in self._handles.get(room, ())
+
+    def handles(self, room):
+        """Handles present in room, in join order"""
+        return list(self._handles.get(room, ()))
+
+    def room_counts(self):
+        """(room, connections) for every room with members"""
+        with self._lock:
+            return [(room, len(members)) for room, members in self._rooms.items()]
+
+    def stats(self):
+        return {'sessions': len(self._sessions), 'rooms': len(self._rooms)}
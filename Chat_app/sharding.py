@@ -0,0 +1,250 @@
+"""
+Room ownership across workers
+With several app.py workers on one pub/sub bus, each room is owned by one of
+them: the owner coalesces the room's broadcasts, keeps its history cache and
+queues its messages for the database, and the other workers forward their
+clients' messages (and cold history loads) to it over the bus.
+
+Owners come from a consistent-hash ring of the workers that are alive, learned
+from heartbeats on the bus. When a worker joins or leaves only the rooms that
+hash next to it change owner (about 1/N of them).
+
+ROOM_SHARDING          1 to give rooms an owning worker (default 0; needs SOCKETIO_MESSAGE_QUEUE)
+SHARD_NODE_ID          this worker's name on the ring (default host-pid)
+SHARD_VNODES           points per worker on the ring; more evens out the split (default 64)
+SHARD_HEARTBEAT_MS     how often a worker announces itself (default 1000)
+SHARD_NODE_TIMEOUT_MS  silence after which a worker is taken off the ring (default 5000)
+SHARD_REQUEST_TIMEOUT_MS  how long to wait for an owner's answer before falling back (default 1000)
+"""
+
+import hashlib
+import itertools
+import os
+import socket
+import time
+from bisect import bisect, insort
+
+import applog
+
+log = applog.get_logger('sharding')
+
+ENABLED = os.getenv('ROOM_SHARDING', '0').lower() in ('1', 'true', 'yes')
+NODE_ID = os.getenv('SHARD_NODE_ID', '') or f'{socket.gethostname()}-{os.getpid()}'
+VNODES = int(os.getenv('SHARD_VNODES', '64'))
+HEARTBEAT_MS = float(os.getenv('SHARD_HEARTBEAT_MS', '1000'))
+NODE_TIMEOUT_MS = float(os.getenv('SHARD_NODE_TIMEOUT_MS', '5000'))
+REQUEST_TIMEOUT_MS = float(os.getenv('SHARD_REQUEST_TIMEOUT_MS', '1000'))
+
+# Bus traffic between workers is a Socket.IO emit of EVENT into a room no client joins
+EVENT = '_shard'
+MEMBERS = 'shard:members'
+
+
+def inbox(node):
+    """Room a worker's forwarded work is emitted to"""
+    return f'shard:node:{node}'
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Consistent hashing of keys onto nodes, with vnodes points per node"""
+
+    def __init__(self, nodes=(), vnodes=VNODES):
+        self.vnodes = vnodes
+        self._points = []     # sorted (hash, node)
+        self.nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        if node in self.nodes:
+            return False
+        self.nodes.add(node)
+        for i in range(self.vnodes):
+            insort(self._points, (_hash(f'{node}#{i}'), node))
+        return True
+
+    def remove(self, node):
+        if node not in self.nodes:
+            return False
+        self.nodes.discard(node)
+        self._points = [point for point in self._points if point[1] != node]
+        return True
+
+    def owner(self, key):
+        """The node a key belongs to: the first point clockwise from its hash"""
+        if not self._points:
+            return None
+        i = bisect(self._points, (_hash(key), chr(0x10ffff)))
+        return self._points[i % len(self._points)][1]
+
+
+class RoomRouter:
+    """Who owns each room, and forwarding of work to the owner over the pub/sub bus
+
+    Work kinds are registered with handle(kind, fn). send() runs fn on the
+    owner and returns nothing; request() runs it there and waits for the result.
+    Both run fn in place when this worker is the owner (always, when sharding
+    is off).
+    """
+
+    def __init__(self, emit, node_id=NODE_ID, enabled=ENABLED, vnodes=VNODES, heartbeat_ms=HEARTBEAT_MS,
+                 node_timeout_ms=NODE_TIMEOUT_MS, request_timeout_ms=REQUEST_TIMEOUT_MS,
+                 clock=time.monotonic, sleep=time.sleep):
+        self._emit = emit     # emit(event, data, to)
+        self.node = node_id
+        self.enabled = enabled
+        self.heartbeat = heartbeat_ms / 1000.0
+        self.node_timeout = node_timeout_ms / 1000.0
+        self.request_timeout = request_timeout_ms / 1000.0
+        self._clock = clock
+        self._sleep = sleep
+        self._spawn = lambda fn, *args: fn(*args)
+        self.ring = HashRing([node_id], vnodes)
+        self._seen = {}       # other node -> last heartbeat
+        self._handlers = {}
+        self._waiting = set()  # ids of requests still being waited for
+        self._replies = {}     # request id -> result, until the waiter takes it
+        self._ids = itertools.count(1)
+        self._running = False
+        self.on_change = None
+
+        # Counters
+        self.forwarded = 0
+        self.received = 0
+        self.requests = 0
+        self.request_timeouts = 0
+        self.ring_changes = 0
+
+    def owner(self, room):
+        return self.ring.owner(room) if self.enabled else self.node
+
+    def owns(self, room):
+        return self.owner(room) == self.node
+
+    def handle(self, kind, fn):
+        self._handlers[kind] = fn
+
+    def send(self, room, kind, data):
+        """Have the room's owner run the kind handler on data"""
+        owner = self.owner(room)
+        if owner == self.node:
+            self._handlers[kind](data)
+            return
+        self.forwarded += 1
+        self._emit(EVENT, {'kind': kind, 'data': data, 'from': self.node}, inbox(owner))
+
+    def request(self, room, kind, data):
+        """The owner's result for data, or None if it didn't answer in time"""
+        owner = self.owner(room)
+        if owner == self.node:
+            return self._handlers[kind](data)
+        request_id = f'{self.node}:{next(self._ids)}'
+        self.requests += 1
+        self._waiting.add(request_id)
+        self._emit(EVENT, {'kind': kind, 'data': data, 'from': self.node, 'id': request_id}, inbox(owner))
+        deadline = self._clock() + self.request_timeout
+        try:
+            while request_id not in self._replies:
+                if self._clock() >= deadline:
+                    self.request_timeouts += 1
+                    log.warning("Owner did not answer", extra={'room': room, 'owner': owner, 'kind': kind})
+                    return None
+                self._sleep(0.002)
+            return self._replies.pop(request_id)
+        finally:
+            self._waiting.discard(request_id)
+
+    def on_remote_emit(self, event, message, room):
+        """pubsub.on_remote_emit hook: heartbeats, forwarded work and replies from other workers"""
+        if event != EVENT or not isinstance(message, dict):
+            return
+        kind = message.get('kind')
+        if room == MEMBERS:
+            if kind == 'heartbeat':
+                self._heard(message.get('from'))
+            elif kind == 'leave':
+                self._forget(message.get('from'))
+            return
+        if room != inbox(self.node):
+            return
+        if kind == 'reply':
+            # A reply that comes after its request timed out is dropped
+            if message.get('id') in self._waiting:
+                self._replies[message['id']] = message.get('data')
+            return
+        handler = self._handlers.get(kind)
+        if handler is None:
+            return
+        self.received += 1
+        if message.get('id') is None:
+            handler(message.get('data'))
+        else:
+            # Answering may read the database; don't hold up the bus listener
+            self._spawn(self._answer, handler, message)
+
+    def _answer(self, handler, message):
+        try:
+            result = handler(message.get('data'))
+        except Exception as e:
+            log.error("Forwarded request failed", extra={'kind': message.get('kind'), 'error': str(e)})
+            return
+        self._emit(EVENT, {'kind': 'reply', 'id': message['id'], 'data': result}, inbox(message['from']))
+
+    def _heard(self, node):
+        if not node or node == self.node:
+            return
+        self._seen[node] = self._clock()
+        if self.ring.add(node):
+            self._changed('joined', node)
+
+    def _forget(self, node):
+        self._seen.pop(node, None)
+        if node != self.node and self.ring.remove(node):
+            self._changed('left', node)
+
+    def _changed(self, how, node):
+        self.ring_changes += 1
+        log.info("Ring changed", extra={'node': node, 'change': how, 'nodes': len(self.ring.nodes)})
+        if self.on_change is not None:
+            self.on_change()
+
+    def _run(self):
+        while self._running:
+            self._emit(EVENT, {'kind': 'heartbeat', 'from': self.node}, MEMBERS)
+            cutoff = self._clock() - self.node_timeout
+            for node, seen in list(self._seen.items()):
+                if seen < cutoff:
+                    self._forget(node)
+            self._sleep(self.heartbeat)
+
+    def start(self, socketio):
+        """Announce this worker and track the others on a Socket.IO background task"""
+        if self._running or not self.enabled:
+            return False
+        self._sleep = socketio.sleep
+        self._spawn = socketio.start_background_task
+        self._running = True
+        socketio.start_background_task(self._run)
+        log.info("Room sharding on", extra={'node': self.node})
+        return True
+
+    def stop(self):
+        """Leave the ring so the other workers take over this one's rooms now, not after the timeout"""
+        if self._running:
+            self._running = False
+            self._emit(EVENT, {'kind': 'leave', 'from': self.node}, MEMBERS)
+
+    def stats(self):
+        """Snapshot of ring size and forwarding counters"""
+        return {
+            'nodes': len(self.ring.nodes),
+            'forwarded': self.forwarded,
+            'received': self.received,
+            'requests': self.requests,
+            'request_timeouts': self.request_timeouts,
+            'ring_changes': self.ring_changes,
+        }
@@ -0,0 +1,276 @@
+"""
+Embedded SQLite backend for the chat app
+Same storage contract as pg_backend.py, in a local database file; for offline,
+single-host and edge deployments that have no Postgres to talk to
+
+SQLITE_PATH             database file (default chat.sqlite3 next to this module)
+SQLITE_READERS          read connections kept open (default 4)
+SQLITE_BUSY_TIMEOUT_MS  how long a write waits for the file lock (default 5000)
+
+The database runs in WAL mode: readers see the last committed state and never
+wait for the writer, and the single writer connection commits each batch in one
+transaction. SQLite calls block the calling thread, patched or not, so under
+eventlet a call made from a green thread (a request, a background task) runs on
+eventlet's thread pool and the hub keeps serving others meanwhile, including
+under plain python app.py. The backend's own locks are green for the same
+reason. Calls from a real thread or the main greenlet run in place.
+"""
+
+import os
+import sqlite3
+import threading
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+import applog
+
+log = applog.get_logger('db.sqlite')
+
+SQLITE_PATH = os.getenv('SQLITE_PATH', str(Path(__file__).parent / 'chat.sqlite3'))
+READERS = int(os.getenv('SQLITE_READERS', '4'))
+BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+
+COLUMNS = 'id, room_id, user_handle, message_text, created_at, updated_at'
+
+# Timestamps are ISO-8601 text, which sorts the same way as the times it holds
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rooms (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    room_id TEXT NOT NULL REFERENCES rooms(id),
+    user_handle TEXT NOT NULL,
+    message_text TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_messages_room_created ON messages(room_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_messages_created ON messages(created_at, id);
+"""
+
+# Full-text index over message text, kept in step with messages by triggers. The
+# room is indexed too, so a search only visits that room's postings.
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    room_id, message_text, content='messages', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, room_id, message_text) VALUES (new.id, new.room_id, new.message_text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, room_id, message_text)
+    VALUES ('delete', old.id, old.room_id, old.message_text);
+END;
+"""
+
+INSERT_MESSAGE = ('INSERT INTO messages (room_id, user_handle, message_text, created_at, updated_at) '
+                  'VALUES (?, ?, ?, ?, ?)')
+RECENT_MESSAGES = (f'SELECT {COLUMNS} FROM messages WHERE room_id = ? '
+                   'ORDER BY created_at DESC, id DESC LIMIT ?')
+MESSAGES_BEFORE = (f'SELECT {COLUMNS} FROM messages WHERE room_id = ? AND (created_at, id) < (?, ?) '
+                   'ORDER BY created_at DESC, id DESC LIMIT ?')
+# Oldest first from a key, for exports; walks idx_messages_room_created, or idx_messages_created across rooms
+MESSAGES_AFTER = (f'SELECT {COLUMNS} FROM messages WHERE {{room}} (created_at, id) > (?, ?) {{until}} '
+                  'ORDER BY created_at, id LIMIT ?')
+SEARCH = ('SELECT m.id, m.room_id, m.user_handle, m.message_text, m.created_at, m.updated_at '
+          'FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid '
+          'WHERE messages_fts MATCH ? AND messages_fts.rowid < ? AND m.room_id = ? '
+          'ORDER BY messages_fts.rowid DESC LIMIT ?')
+DELETE_BEFORE = ('DELETE FROM messages WHERE id IN ('
+                 'SELECT id FROM messages WHERE {room} room_id NOT IN ({exclude}) AND (created_at, id) < (?, ?) '
+                 'ORDER BY created_at, id LIMIT ?)')
+
+
+def _green():
+    """A call that moves green threads' queries onto eventlet's thread pool, and green semaphores; None without eventlet"""
+    try:
+        from eventlet import greenthread, semaphore, tpool
+    except ImportError:
+        return None
+
+    def call(fn, *args):
+        # Only a green thread has the hub as its parent; blocking anything else stalls nobody
+        if greenthread.getcurrent().parent is None:
+            return fn(*args)
+        return tpool.execute(fn, *args)
+    return call, semaphore.Semaphore, semaphore.BoundedSemaphore
+
+
+class SQLiteBackend:
+    """save_messages / fetch_messages_before / create_rooms against a WAL-mode SQLite file"""
+    name = 'sqlite'
+
+    def __init__(self, path=SQLITE_PATH, readers=READERS, busy_timeout_ms=BUSY_TIMEOUT_MS, green=True):
+        self.path = str(path)
+        self.busy_timeout = busy_timeout_ms / 1000.0
+        green = _green() if green else None
+        if green is not None:
+            # Locks are taken by the calling greenlet and only the query runs on a pool thread
+            self._call, lock, bounded = green
+        else:
+            self._call, lock, bounded = (lambda fn, *args: fn(*args)), threading.Lock, threading.BoundedSemaphore
+        self._write_lock = lock()
+        self._writer = self._connect()
+        self._writer.execute('PRAGMA journal_mode=WAL')
+        # In WAL mode NORMAL only risks the last commits on power loss, never corruption
+        self._writer.execute('PRAGMA synchronous=NORMAL')
+        self._writer.executescript(SCHEMA)
+        had_fts = self._writer.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone()
+        self._writer.executescript(FTS_SCHEMA)
+        if not had_fts:
+            # A database from before search existed: index the messages it already has
+            self._writer.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+        self._readers = deque(self._connect(read_only=True) for _ in range(max(1, readers)))
+        self._slots = bounded(len(self._readers))
+
+    def _connect(self, read_only=False):
+        # Autocommit mode; transactions are opened explicitly with BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+        if read_only:
+            conn.execute('PRAGMA query_only=1')
+        return conn
+
+    def _read(self, work):
+        self._slots.acquire()
+        conn = self._readers.pop()
+        try:
+            return self._call(work, conn)
+        finally:
+            self._readers.append(conn)
+            self._slots.release()
+
+    def _write(self, work):
+        def transaction(conn):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = work(conn)
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+            return result
+        with self._write_lock:
+            return self._call(transaction, self._writer)
+
+    @staticmethod
+    def _row(values):
+        return dict(zip(('id', 'room_id', 'user_handle', 'message_text', 'created_at', 'updated_at'), values))
+
+    def save_messages(self, rows):
+        now = datetime.utcnow().isoformat()
+        args = [(r['room_id'], r['user_handle'], r['message_text'], r.get('created_at') or now,
+                 r.get('updated_at') or r.get('created_at') or now) for r in rows]
+        def work(conn):
+            # lastrowid is the id of each row, so callers get full (created_at, id) cursor keys
+            return [self._row((conn.execute(INSERT_MESSAGE, values).lastrowid,) + values) for values in args]
+        try:
+            # The whole batch is one transaction: one fsync instead of one per row
+            saved = self._write(work)
+            log.debug("Saved messages", extra={'rows': len(rows), 'path': 'sqlite'})
+            return saved
+        except Exception as e:
+            log.error("Exception saving messages", extra={'error': str(e), 'path': 'sqlite'})
+            return None
+
+    def fetch_messages_before(self, room_id, before=None, limit=50):
+        def work(conn):
+            if before is None:
+                cur = conn.execute(RECENT_MESSAGES, (room_id, limit))
+            else:
+                created_at, message_id = before
+                # id 0 sorts below every real id, so this means "strictly older than created_at"
+                cur = conn.execute(MESSAGES_BEFORE, (room_id, created_at, message_id or 0, limit))
+            return [self._row(values) for values in reversed(cur.fetchall())]
+        try:
+            return self._read(work)
+        except Exception as e:
+            log.error("Exception retrieving messages", extra={'error': str(e), 'path': 'sqlite'})
+            return None
+
+    def fetch_messages_after(self, room_id, after=None, until=None, limit=500):
+        """Oldest first, strictly after the (created_at, id) key and before until; room_id None is every room"""
+        created_at, message_id = after if after is not None else ('', None)
+        sql = MESSAGES_AFTER.format(room='room_id = ? AND' if room_id is not None else '',
+                                    until='AND created_at < ?' if until is not None else '')
+        args = (([room_id] if room_id is not None else []) + [created_at, message_id or 0]
+                + ([until] if until is not None else []) + [limit])
+        try:
+            return self._read(lambda conn: [self._row(values) for values in conn.execute(sql, args).fetchall()])
+        except Exception as e:
+            log.error("Exception exporting messages", extra={'error': str(e), 'path': 'sqlite'})
+            return None
+
+    def search_messages(self, room_id, words, before=None, limit=20):
+        """Messages containing every word, newest first, through the FTS5 index"""
+        # Every word is quoted, so FTS5 operators in a query are just text
+        phrase = lambda text: '"' + text.replace('"', '""') + '"'
+        match = f"room_id:{phrase(room_id)} AND message_text:({' '.join(phrase(w) for w in words)})"
+        before_id = before[1] if before and before[1] is not None else 2 ** 63 - 1
+        try:
+            return self._read(lambda conn: [self._row(values) for values in
+                                            conn.execute(SEARCH, (match, before_id, room_id, limit)).fetchall()])
+        except Exception as e:
+            log.error("Exception searching messages", extra={'error': str(e), 'path': 'sqlite'})
+            return None
+
+    def create_rooms(self, room_ids):
+        """Insert rooms that don't exist yet in one transaction; returns how many were new"""
+        now = datetime.utcnow().isoformat()
+        def work(conn):
+            before = conn.total_changes
+            conn.executemany('INSERT OR IGNORE INTO rooms (id, created_at) VALUES (?, ?)',
+                             [(room_id, now) for room_id in room_ids])
+            return conn.total_changes - before
+        try:
+            created = self._write(work)
+            log.debug("Rooms ensured", extra={'rooms': len(room_ids), 'new_rooms': created, 'path': 'sqlite'})
+            return created
+        except Exception as e:
+            log.error("Exception upserting rooms", extra={'error': str(e), 'path': 'sqlite'})
+            return None
+
+    def delete_messages_before(self, room_id, before, limit, exclude=()):
+        """Delete up to limit messages older than the (created_at, id) key; returns rows deleted"""
+        created_at, message_id = before
+        exclude = list(exclude)
+        sql = DELETE_BEFORE.format(room='room_id = ? AND' if room_id is not None else '',
+                                   exclude=', '.join('?' * len(exclude)))
+        args = ([room_id] if room_id is not None else []) + exclude + [created_at, message_id or 0, limit]
+        try:
+            return self._write(lambda conn: conn.execute(sql, args).rowcount)
+        except Exception as e:
+            log.error("Exception deleting messages", extra={'error': str(e), 'path': 'sqlite'})
+            return None
+
+    def nth_newest(self, room_id, offset):
+        """(created_at, id) of the message offset places below the newest, or None"""
+        def work(conn):
+            found = conn.execute('SELECT created_at, id FROM messages WHERE room_id = ? '
+                                 'ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET ?', (room_id, offset)).fetchone()
+            return tuple(found) if found else None
+        try:
+            return self._read(work)
+        except Exception as e:
+            log.error("Exception finding retention boundary", extra={'error': str(e), 'path': 'sqlite'})
+            return None
+
+    def list_rooms(self, after='', limit=500):
+        """Room ids in order, the page after `after`"""
+        def work(conn):
+            cur = conn.execute('SELECT id FROM rooms WHERE id > ? ORDER BY id LIMIT ?', (after, limit))
+            return [row[0] for row in cur.fetchall()]
+        try:
+            return self._read(work)
+        except Exception as e:
+            log.error("Exception listing rooms", extra={'error': str(e), 'path': 'sqlite'})
+            return None
+
+    def close(self):
+        while self._readers:
+            self._readers.pop().close()
+        with self._write_lock:
+            self._writer.close()
@@ -1,7 +1,15 @@
 #!/usr/bin/env python
+# Usage: python test_socketio.py [URL_1] [URL_2]
+# Pass two different worker URLs (sharing SOCKETIO_MESSAGE_QUEUE) to check
+# that room messages are delivered across workers.
 import socketio
+import sys
 import time
 
+urls = [arg for arg in sys.argv[1:] if arg.startswith('http')] or ['http://localhost:5000']
+url1 = urls[0]
+url2 = urls[1] if len(urls) > 1 else url1
+
 # Create two Socket.IO clients
 sio1 = socketio.Client()
 sio2 = socketio.Client()
@@ -58,7 +66,7 @@ def on_message_2(data):
 
 try:
     print("Connecting Client 1...")
-    sio1.connect('http://localhost:5000')
+    sio1.connect(url1)
     time.sleep(0.5)
     
     print(f"\nClient 1 joining room '{room}'...")
@@ -66,7 +74,7 @@ try:
     time.sleep(1)
     
     print("\nConnecting Client 2...")
-    sio2.connect('http://localhost:5000')
+    sio2.connect(url2)
     time.sleep(0.5)
     
     print(f"\nClient 2 joining room '{room}'...")
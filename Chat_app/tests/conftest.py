@@ -0,0 +1,13 @@
+import os
+import tempfile
+
+# The suite runs with storage off unless TEST_DB_BACKEND names a backend, e.g.
+#   TEST_DB_BACKEND=sqlite python -m pytest -q tests
+# This has to happen before db.py (and app.py, which initializes it) is imported.
+if os.getenv('TEST_DB_BACKEND'):
+    os.environ['DB_BACKEND'] = os.environ['TEST_DB_BACKEND']
+    os.environ.setdefault('SQLITE_PATH', os.path.join(tempfile.mkdtemp(prefix='chat-tests-'), 'chat.sqlite3'))
+
+# The test client runs handlers without yielding to the eventlet hub, so the hub-lag
+# monitor would read every test as a stall
+os.environ.setdefault('HUB_LAG_INTERVAL_MS', '0')
@@ -8,3 +8,341 @@ def test_index_page_returns_200_and_contains_title():
     resp = client.get('/')
     assert resp.status_code == 200
     assert b'Anonymous Chat' in resp.data
+
+
+def test_join_serves_recent_messages_from_history_cache():
+    from app import socketio
+
+    sender = socketio.test_client(app)
+    sender.emit('join', {'room': 'cache-room'})
+    sender.emit('message', {'room': 'cache-room', 'handle': 'Anon-1', 'text': 'hello'})
+
+    joiner = socketio.test_client(app)
+    joiner.emit('join', {'room': 'cache-room'})
+    history = [e for e in joiner.get_received() if e['name'] == 'message_history']
+    assert [m['message_text'] for m in history[0]['args'][0]['messages']] == ['hello']
+
+
+def test_readiness_waits_for_storage_but_liveness_does_not(monkeypatch):
+    import db
+
+    monkeypatch.setattr(db, 'backend', None)
+    monkeypatch.setattr(db, 'supabase', None)
+    monkeypatch.setattr(db, '_state', db.COLD)
+    client = app.test_client()
+    assert client.get('/healthz').status_code == 200
+    assert client.get('/readyz').status_code == 503
+
+    db.warm_up()
+    resp = client.get('/readyz')
+    assert resp.status_code == 200 and resp.get_json()['state'] == 'ready'
+
+
+def test_room_messages_endpoint_validates_cursor():
+    client = app.test_client()
+    assert client.get('/rooms/r1/messages?before=bogus').status_code == 400
+
+    resp = client.get('/rooms/r1/messages?limit=10')
+    assert resp.status_code == 200
+    assert resp.get_json() == {'room': 'r1', 'messages': [], 'cursor': None}
+
+
+def test_metrics_endpoint_reports_handler_latency():
+    from app import socketio
+
+    client = socketio.test_client(app)
+    client.emit('join', {'room': 'metrics-room'})
+
+    resp = app.test_client().get('/metrics')
+    assert resp.status_code == 200
+    assert resp.content_type.startswith('text/plain')
+    assert b'chat_handler_seconds_count{handler="join"}' in resp.data
+    assert b'chat_room_connections{le="+Inf"}' in resp.data and b'chat_room_connections_max ' in resp.data
+    assert b'metrics-room' not in resp.data
+    client.disconnect()
+
+
+def test_busy_room_messages_arrive_as_one_batch(monkeypatch):
+    from app import coalescer, socketio
+
+    monkeypatch.setattr(coalescer, 'window', 0.05)
+    client = socketio.test_client(app)
+    client.emit('join', {'room': 'batch-room'})
+    client.get_received()
+
+    for i in range(3):
+        client.emit('message', {'room': 'batch-room', 'handle': 'Anon-x', 'text': f'm{i}'})
+    socketio.sleep(0.2)
+
+    received = client.get_received()
+    assert [p['name'] for p in received] == ['message', 'message_batch']
+    assert [m['text'] for m in received[1]['args'][0]['messages']] == ['m1', 'm2']
+
+
+def test_flooding_client_gets_rate_limited(monkeypatch):
+    from app import socketio, rate_limiter
+    from ratelimit import Limit
+
+    # Burst of 3: the join and two messages
+    monkeypatch.setitem(rate_limiter.limits, 'sid', Limit(1, 3))
+    client = socketio.test_client(app)
+    client.emit('join', {'room': 'flood-room'})
+    client.get_received()
+
+    for i in range(3):
+        client.emit('message', {'room': 'flood-room', 'handle': 'Anon-x', 'text': f'm{i}'})
+    received = client.get_received()
+    assert [p['name'] for p in received] == ['message', 'message', 'rate_limited']
+    assert received[2]['args'][0]['scope'] == 'sid'
+
+    tracked = rate_limiter.stats()['sids']
+    client.disconnect()
+    assert rate_limiter.stats()['sids'] == tracked - 1
+
+
+def test_typing_floods_are_rate_limited_apart_from_messages(monkeypatch):
+    from app import socketio, rate_limiter
+    from ratelimit import Limit
+
+    monkeypatch.setitem(rate_limiter.limits, 'typing', Limit(1, 2))
+    client = socketio.test_client(app)
+    client.emit('join', {'room': 'typing-flood'})
+    client.get_received()
+    for _ in range(5):
+        client.emit('typing')
+    limited = [p['args'][0] for p in client.get_received() if p['name'] == 'rate_limited']
+    assert [(p['event'], p['scope']) for p in limited] == [('typing', 'typing')] * 3
+
+    client.emit('message', 'still allowed')
+    assert [p['name'] for p in client.get_received()] == ['message']
+    client.disconnect()
+
+
+def test_message_uses_the_server_side_handle_and_room():
+    from app import socketio
+
+    client = socketio.test_client(app)
+    client.emit('join', {'room': 'session-room'})
+    handle = [p for p in client.get_received() if p['name'] == 'your_handle'][0]['args'][0]
+
+    client.emit('message', 'just text')
+    client.emit('message', {'room': 'not-joined', 'handle': 'Spoofed', 'text': 'nope'})
+    # The test client hands 'message' payloads over unwrapped (it's the send() event)
+    messages = [p['args'] for p in client.get_received() if p['name'] == 'message']
+    assert [(m['handle'], m['text']) for m in messages] == [(handle, 'just text')]
+
+    resp = app.test_client().get('/rooms/session-room/presence')
+    assert resp.get_json() == {'room': 'session-room', 'count': 1, 'handles': [handle]}
+    client.disconnect()
+
+
+def test_presence_diff_reports_joins_typing_and_leaves(monkeypatch):
+    from app import socketio, presence_tracker
+
+    monkeypatch.setattr(presence_tracker, 'leave_grace', 0)
+
+    def diffs(client):
+        # The background task may also have flushed, so look at every diff received
+        presence_tracker.flush()
+        return [p['args'][0] for p in client.get_received() if p['name'] == 'presence']
+
+    first = socketio.test_client(app)
+    first.emit('join', {'room': 'presence-room'})
+    second = socketio.test_client(app)
+    second.emit('join', {'room': 'presence-room'})
+    snapshot = [p for p in second.get_received() if p['name'] == 'presence_snapshot'][0]['args'][0]
+    assert snapshot['count'] == 2
+    other = snapshot['handles'][1]
+
+    second.emit('typing')
+    received = diffs(first)
+    assert other in {h for diff in received for h in diff['joined']}
+    assert received[-1]['typing'] == [other] and received[-1]['count'] == 2
+
+    second.disconnect()
+    received = diffs(first)
+    assert received[-1]['left'] == [other] and received[-1]['typing'] == [] and received[-1]['count'] == 1
+    first.disconnect()
+
+
+def test_join_sends_history_in_the_negotiated_format():
+    from app import socketio
+
+    client = socketio.test_client(app)
+    client.emit('join', {'room': 'format-room', 'format': 'compact'})
+    history = [p for p in client.get_received() if p['name'] == 'message_history'][0]['args'][0]
+    assert history['format'] == 'compact'
+    assert history['fields'] == ['user_handle', 'message_text', 'created_at']
+    assert history['room'] == 'format-room'
+    client.disconnect()
+
+
+def test_search_endpoint_and_event_find_saved_messages(monkeypatch):
+    import db
+    from app import socketio
+    from memory_backend import MemoryBackend
+
+    monkeypatch.setattr(db, 'backend', MemoryBackend())
+    client = socketio.test_client(app)
+    client.emit('join', {'room': 'search-room'})
+    for text in ('the quick fox', 'a slow fox', 'quick thinking'):
+        client.emit('message', text)
+
+    resp = app.test_client().get('/rooms/search-room/search?q=QUICK+fox')
+    assert [m['message_text'] for m in resp.get_json()['messages']] == ['the quick fox']
+    assert app.test_client().get('/rooms/search-room/search?q=%20').status_code == 400
+
+    client.get_received()
+    client.emit('search', {'room': 'search-room', 'q': 'fox', 'limit': 1})
+    results = [p for p in client.get_received() if p['name'] == 'search_results'][0]['args'][0]
+    assert [m['message_text'] for m in results['messages']] == ['a slow fox']
+    assert results['query'] == 'fox' and results['cursor']
+    client.disconnect()
+
+
+def test_history_since_compares_times_not_strings():
+    from app import history_since
+
+    history = [{'message_text': 'stored', 'created_at': '2026-01-01T10:00:00.5+00:00'},
+               {'message_text': 'live', 'created_at': '2026-01-01T10:00:01.000002'}]
+    # As strings '...00.5+00:00' sorts after '...00.500000', and '...01' before '...01.000002'
+    assert [m['message_text'] for m in history_since(history, '2026-01-01T10:00:00.500000')] == ['live']
+    assert history_since(history, '2026-01-01T12:00:01.000002+02:00') == []
+    assert history_since(history, 'yesterday') is None
+
+
+def test_reconnect_gets_only_newer_messages_and_keeps_its_handle():
+    from app import socketio, presence_tracker
+
+    client = socketio.test_client(app)
+    client.emit('join', {'room': 'resume-room'})
+    received = client.get_received()
+    handle = [p for p in received if p['name'] == 'your_handle'][0]['args'][0]
+    token = [p for p in received if p['name'] == 'resume_token'][0]['args'][0]
+    client.emit('message', 'seen before the drop')
+    seen = [p for p in client.get_received() if p['name'] == 'message'][0]['args']['created_at']
+    presence_tracker.flush()
+    client.disconnect()
+
+    other = socketio.test_client(app)
+    other.emit('join', {'room': 'resume-room'})
+    other.emit('message', 'sent while away')
+    presence_tracker.flush()
+    other.get_received()
+
+    back = socketio.test_client(app)
+    back.emit('join', {'room': 'resume-room', 'since': seen, 'resume': token})
+    received = back.get_received()
+    delta = [p for p in received if p['name'] == 'message_history'][0]['args'][0]
+    assert [m['message_text'] for m in delta['messages']] == ['sent while away']
+    assert delta['since'] == seen
+    assert [p for p in received if p['name'] == 'your_handle'][0]['args'][0] == handle
+
+    # Nobody was told the client left or came back
+    presence_tracker.flush()
+    diffs = [p['args'][0] for p in other.get_received() if p['name'] == 'presence']
+    assert not any(handle in diff['left'] + diff['joined'] for diff in diffs)
+
+    # Without a last-seen marker (or with a forged token) it is a normal join
+    fresh = socketio.test_client(app)
+    fresh.emit('join', {'room': 'resume-room', 'resume': token + 'x'})
+    received = fresh.get_received()
+    assert len([p for p in received if p['name'] == 'message_history'][0]['args'][0]['messages']) == 2
+    assert [p for p in received if p['name'] == 'your_handle'][0]['args'][0] != handle
+    for c in (other, back, fresh):
+        c.disconnect()
+
+
+def test_profile_endpoint_needs_the_admin_token(monkeypatch):
+    import app as app_module
+
+    client = app.test_client()
+    assert client.post('/admin/profile?seconds=0.05').status_code == 404
+
+    monkeypatch.setattr(app_module, 'ADMIN_TOKEN', 'sekrit')
+    assert client.post('/admin/profile?seconds=0.05').status_code == 401
+    auth = {'Authorization': 'Bearer sekrit'}
+    assert client.post('/admin/profile?seconds=0', headers=auth).status_code == 400
+
+    resp = client.post('/admin/profile?seconds=0.05', headers=auth)
+    assert resp.status_code == 200 and resp.content_type.startswith('text/plain')
+    assert all(line.startswith('running;') and line.rsplit(' ', 1)[1].isdigit()
+               for line in resp.get_data(as_text=True).splitlines())
+
+
+def test_index_page_is_gzipped_and_revalidated_with_etag():
+    client = app.test_client()
+    resp = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip' and resp.headers['Cache-Control'] == 'no-cache'
+    again = client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': resp.headers['ETag']})
+    assert again.status_code == 304 and again.data == b''
+    assert client.get('/', headers={'If-None-Match': resp.headers['ETag']}).status_code == 200
+
+
+def test_built_assets_are_served_immutable(monkeypatch, tmp_path):
+    import app as app_module
+    from assets import AssetStore, build
+
+    css = tmp_path / 'style.css'
+    css.write_text('body { margin: 0; }\n')
+    manifest = build(tmp_path / 'dist', {'app.css': [css]})
+    monkeypatch.setattr(app_module, 'asset_store', AssetStore(tmp_path / 'dist'))
+
+    client = app.test_client()
+    resp = client.get(f"/assets/{manifest['app.css']}")
+    assert resp.status_code == 200 and resp.data == b'body{margin: 0}\n'
+    assert 'immutable' in resp.headers['Cache-Control'] and resp.content_type.startswith('text/css')
+    assert client.get('/assets/app.css').status_code == 404
+
+
+def test_export_streams_a_room_and_resumes_from_a_cursor(monkeypatch):
+    import gzip
+    import json
+    import app as app_module
+    import db
+    from app import socketio
+    from memory_backend import MemoryBackend
+
+    monkeypatch.setattr(db, 'backend', MemoryBackend())
+    sender = socketio.test_client(app)
+    sender.emit('join', {'room': 'export-room'})
+    for text in ('one', 'two', 'three'):
+        sender.emit('message', text)
+    sender.disconnect()
+
+    client = app.test_client()
+    assert client.get('/admin/export?room=export-room').status_code == 404
+    monkeypatch.setattr(app_module, 'ADMIN_TOKEN', 'sekrit')
+    auth = {'Authorization': 'Bearer sekrit'}
+    assert client.get('/admin/export?room=export-room&format=xml', headers=auth).status_code == 400
+    assert client.get('/admin/export?room=export-room&after=bogus', headers=auth).status_code == 400
+
+    resp = client.get('/admin/export?room=export-room', headers=dict(auth, **{'Accept-Encoding': 'gzip'}))
+    assert resp.status_code == 200 and resp.is_streamed and resp.headers['Content-Encoding'] == 'gzip'
+    rows = [json.loads(line) for line in gzip.decompress(resp.data).decode().splitlines()]
+    assert [r['message_text'] for r in rows] == ['one', 'two', 'three']
+
+    resp = client.get(f"/admin/export?room=export-room&format=csv&after={rows[0]['cursor']}", headers=auth)
+    assert resp.content_type.startswith('text/csv') and 'Content-Encoding' not in resp.headers
+    assert [line.split(',')[3] for line in resp.get_data(as_text=True).splitlines()[1:]] == ['two', 'three']
+
+
+def test_export_since_wins_over_an_older_cursor_in_another_time_format(monkeypatch):
+    import json
+    import app as app_module
+    import db
+    from memory_backend import MemoryBackend
+
+    backend = MemoryBackend()
+    backend.save_messages([{'room_id': 'tz-room', 'user_handle': 'a', 'message_text': text, 'created_at': at}
+                           for text, at in (('early', '2026-01-01T10:10:00'), ('late', '2026-01-01T10:40:00'))])
+    monkeypatch.setattr(db, 'backend', backend)
+    monkeypatch.setattr(app_module, 'ADMIN_TOKEN', 'sekrit')
+    auth = {'Authorization': 'Bearer sekrit'}
+
+    # 11:00+01:00 is 10:00 UTC, before since, though it sorts after it as a string
+    cursor = db.encode_cursor({'created_at': '2026-01-01T11:00:00+01:00', 'id': 0})
+    resp = app.test_client().get(f'/admin/export?room=tz-room&since=2026-01-01T10:30:00&after={cursor}', headers=auth)
+    assert [json.loads(line)['message_text'] for line in resp.get_data(as_text=True).splitlines()] == ['late']
+    bad = db.encode_cursor({'created_at': 'whenever', 'id': 1})
+    assert app.test_client().get(f'/admin/export?room=tz-room&after={bad}', headers=auth).status_code == 400
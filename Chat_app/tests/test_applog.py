@@ -0,0 +1,31 @@
+import json
+import logging
+import queue
+
+import applog
+
+
+def make_record(**extra):
+    logger = logging.getLogger('chat.test')
+    return logger.makeRecord('chat.test', logging.INFO, __file__, 1, 'User joined room', (), None, extra=extra)
+
+
+def test_json_formatter_emits_structured_fields():
+    line = applog.JsonFormatter().format(make_record(room='r1', handle='Anon-1'))
+    entry = json.loads(line)
+    assert entry['msg'] == 'User joined room'
+    assert entry['level'] == 'INFO'
+    assert entry['room'] == 'r1' and entry['handle'] == 'Anon-1'
+
+
+def test_queue_handler_drops_instead_of_blocking():
+    before = applog.dropped
+    handler = applog.DroppingQueueHandler(queue.Queue(1))
+    handler.emit(make_record())
+    handler.emit(make_record())
+    assert applog.dropped == before + 1
+
+
+def test_sampling_rate_bounds():
+    assert applog.sampled(1)
+    assert not any(applog.sampled(0) for _ in range(100))
@@ -0,0 +1,71 @@
+import gzip
+import json
+import re
+
+import assets
+from assets import AssetStore, build, minify_css, minify_js, negotiate
+
+
+def sources(tmp_path, js='let a = 1;\n'):
+    vendor = tmp_path / 'socket.io-4.5.4.min.js'
+    vendor.write_text('!function(){window.io=function(){}}();\n//# sourceMappingURL=socket.io.min.js.map\n')
+    chat = tmp_path / 'chat.js'
+    chat.write_text(js)
+    css = tmp_path / 'style.css'
+    css.write_text('/* theme */\nbody {\n    margin: 0;\n    color: red;\n}\n')
+    return {'app.js': [vendor, chat], 'app.css': [css]}
+
+
+def test_build_writes_hashed_minified_and_precompressed_bundles(tmp_path):
+    bundles = sources(tmp_path, js='// setup\nconst socket = io();\n\n    socket.on("x", () => {});\n')
+    manifest = build(tmp_path / 'dist', bundles)
+    assert re.fullmatch(r'app\.[0-9a-f]{12}\.js', manifest['app.js'])
+    assert json.loads((tmp_path / 'dist' / 'manifest.json').read_text()) == manifest
+
+    js = (tmp_path / 'dist' / manifest['app.js']).read_bytes()
+    assert js == b'!function(){window.io=function(){}}();\n;\nconst socket = io();\nsocket.on("x", () => {});\n'
+    assert gzip.decompress((tmp_path / 'dist' / f"{manifest['app.js']}.gz").read_bytes()) == js
+    assert (tmp_path / 'dist' / manifest['app.css']).read_text() == 'body{margin: 0;color: red}\n'
+
+    # Same sources, same names; a change gets a new one
+    assert build(tmp_path / 'dist', bundles) == manifest
+    changed = build(tmp_path / 'dist', sources(tmp_path, js='let b = 2;\n'))
+    assert changed['app.js'] != manifest['app.js'] and changed['app.css'] == manifest['app.css']
+
+
+def test_minifiers_keep_what_matters():
+    assert minify_css('a :hover , b > c { x : 1 ; }') == 'a :hover,b>c{x : 1}\n'
+    assert minify_js('const u = "http://x";  // trailing\n\n  // whole line\nf()\n') == \
+        'const u = "http://x";  // trailing\nf()\n'
+
+
+def test_negotiate_picks_the_smallest_accepted_copy():
+    variants = {None: b'x' * 100, 'gzip': b'x' * 40, 'br': b'x' * 30}
+    assert negotiate(variants, '')[1] is None
+    assert negotiate(variants, 'gzip, deflate')[1] == 'gzip'
+    assert negotiate(variants, 'gzip, deflate, br')[1] == 'br'
+    assert negotiate(variants, 'br;q=0, gzip;q=0.5')[1] == 'gzip'
+
+
+def test_malformed_and_wildcard_accept_encoding():
+    variants = {None: b'x' * 100, 'gzip': b'x' * 40, 'br': b'x' * 30}
+    assert negotiate(variants, 'gzip;q=abc')[1] is None
+    assert negotiate(variants, 'br;q=, gzip')[1] == 'gzip'
+    assert negotiate(variants, '*')[1] == 'br'
+    assert negotiate(variants, 'br;q=0, *;q=0.1')[1] == 'gzip'
+    assert negotiate(variants, '*;q=0')[1] is None
+
+
+def test_store_serves_built_files_from_memory(tmp_path):
+    assert AssetStore(tmp_path / 'missing').url('app.js') is None
+
+    bundles = sources(tmp_path)
+    # Big enough that the gzip copy is the smaller one
+    bundles['app.css'][0].write_text(''.join(f'.c{i} {{ color: red; }}\n' for i in range(100)))
+    manifest = build(tmp_path / 'dist', bundles)
+    store = AssetStore(tmp_path / 'dist')
+    assert store.url('app.css') == f"/assets/{manifest['app.css']}"
+    body, content_type, coding = store.get(manifest['app.css'], 'gzip')
+    assert coding == 'gzip' and content_type == assets.CONTENT_TYPES['.css']
+    assert gzip.decompress(body) == (tmp_path / 'dist' / manifest['app.css']).read_bytes()
+    assert store.get('app.css') is None
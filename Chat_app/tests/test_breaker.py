@@ -0,0 +1,75 @@
+from breaker import CircuitBreaker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make(**kwargs):
+    clock = Clock()
+    return CircuitBreaker('test', clock=clock, **kwargs), clock
+
+
+def test_opens_after_consecutive_failures_and_fails_fast():
+    breaker, clock = make(failures=3, reset_ms=1000)
+    breaker.failure()
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    breaker.failure()
+    assert breaker.allow() and breaker.state == 'closed'
+
+    breaker.failure()
+    assert breaker.state == 'open' and breaker.is_open()
+    assert not breaker.allow()
+    assert breaker.stats()['rejected'] == 1
+
+
+def test_half_open_lets_one_probe_through():
+    breaker, clock = make(failures=1, reset_ms=1000)
+    breaker.failure()
+    clock.now = 1.0
+    assert not breaker.is_open()
+    assert breaker.allow()
+    assert breaker.state == 'half_open'
+    assert not breaker.allow()
+
+    breaker.success()
+    assert breaker.state == 'closed' and breaker.allow()
+
+
+def test_a_probe_that_never_reports_is_replaced_after_the_cooldown():
+    breaker, clock = make(failures=1, reset_ms=1000)
+    breaker.failure()
+    clock.now = 1.0
+    assert breaker.allow()
+    # The probe's caller raised before success() or failure()
+    clock.now = 1.99
+    assert not breaker.allow()
+    clock.now = 2.0
+    assert breaker.allow() and not breaker.allow()
+    breaker.success()
+    assert breaker.state == 'closed'
+
+
+def test_failed_probe_reopens_with_a_longer_cooldown():
+    breaker, clock = make(failures=1, reset_ms=1000, reset_max_ms=3000)
+    breaker.failure()
+    for now, cooldown in ((1.0, 2.0), (3.0, 3.0), (6.0, 3.0)):
+        clock.now = now
+        assert breaker.allow()
+        breaker.failure()
+        clock.now = now + cooldown - 0.01
+        assert not breaker.allow()
+    assert breaker.stats()['opened'] == 4
+
+
+def test_zero_threshold_never_opens():
+    breaker, _ = make(failures=0)
+    for _ in range(100):
+        breaker.failure()
+    assert breaker.allow()
@@ -0,0 +1,55 @@
+from coalescer import RoomCoalescer
+
+
+class Recorder:
+    def __init__(self):
+        self.sent = []
+        self.timers = []
+
+    def one(self, room, item):
+        self.sent.append((room, [item]))
+
+    def batch(self, room, items):
+        self.sent.append((room, list(items)))
+
+
+def make(window_ms=1000, max_batch=50):
+    rec = Recorder()
+    coalescer = RoomCoalescer(rec.one, rec.batch, window_ms=window_ms, max_batch=max_batch,
+                              spawn=rec.timers.append, sleep=lambda s: None)
+    return coalescer, rec
+
+
+def test_quiet_room_sends_immediately_and_busy_room_waits_for_window():
+    coalescer, rec = make()
+    coalescer.submit('r', 1)
+    assert rec.sent == [('r', [1])]
+
+    coalescer.submit('r', 2)
+    coalescer.submit('r', 3)
+    coalescer.submit('other', 'x')
+    assert rec.sent == [('r', [1]), ('other', ['x'])]
+    assert len(rec.timers) == 1
+
+    rec.timers.pop()()
+    assert rec.sent[-1] == ('r', [2, 3])
+    assert coalescer.stats()['batches'] == 1
+
+
+def test_full_batch_is_sent_before_the_window_closes():
+    coalescer, rec = make(max_batch=3)
+    for i in range(4):
+        coalescer.submit('r', i)
+    assert rec.sent == [('r', [0]), ('r', [1, 2, 3])]
+
+    # The pending timer finds nothing left to send
+    rec.timers.pop()()
+    assert len(rec.sent) == 2
+
+
+def test_disabled_sends_every_message_on_its_own():
+    coalescer, rec = make(window_ms=0)
+    for i in range(3):
+        coalescer.submit('r', i)
+    assert rec.sent == [('r', [0]), ('r', [1]), ('r', [2])]
+    assert rec.timers == []
@@ -0,0 +1,140 @@
+import httpx
+import pytest
+
+import db
+
+
+def test_cursor_round_trip():
+    cursor = db.encode_cursor({'created_at': '2026-01-02T03:04:05.123456', 'id': 42})
+    assert db.decode_cursor(cursor) == ('2026-01-02T03:04:05.123456', 42)
+
+
+def test_decode_cursor_rejects_garbage():
+    with pytest.raises(ValueError):
+        db.decode_cursor('not-a-cursor')
+
+
+def test_keyset_params_page_before_cursor():
+    params = db._keyset_params('r1', ('2026-01-02T03:04:05', 42), 20)
+    assert params['order'] == 'created_at.desc,id.desc'
+    assert params['limit'] == '20'
+    assert params['or'] == '(created_at.lt."2026-01-02T03:04:05",and(created_at.eq."2026-01-02T03:04:05",id.lt.42))'
+
+    first_page = db._keyset_params('r1', None, 20)
+    assert 'or' not in first_page and 'created_at' not in first_page
+
+
+class FakeBackend:
+    name = 'fake'
+
+    def __init__(self):
+        self.upserts = []
+
+    def create_rooms(self, room_ids):
+        self.upserts.append(list(room_ids))
+        return len(room_ids)
+
+
+def test_create_rooms_upserts_unknown_rooms_once(monkeypatch):
+    fake = FakeBackend()
+    monkeypatch.setattr(db, 'backend', fake)
+    monkeypatch.setattr(db, '_known_rooms', db.OrderedDict())
+
+    db.create_rooms(['a', 'b', 'a'])
+    db.create_room('a')
+    db.create_rooms(['b', 'c'])
+
+    assert fake.upserts == [['a', 'b'], ['c']]
+
+
+def test_known_rooms_are_bounded(monkeypatch):
+    monkeypatch.setattr(db, 'backend', FakeBackend())
+    monkeypatch.setattr(db, '_known_rooms', db.OrderedDict())
+    monkeypatch.setattr(db, 'KNOWN_ROOMS_MAX', 2)
+
+    db.create_rooms(['a', 'b', 'c'])
+    assert list(db._known_rooms) == ['b', 'c']
+
+
+class DownSession:
+    def __init__(self):
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        raise db.requests.ConnectionError('upstream down')
+
+
+class DownClient:
+    """Just enough of the supabase client for the insert and select paths; execute() never connects"""
+    params = httpx.QueryParams()
+
+    def table(self, name):
+        return self
+
+    def insert(self, rows):
+        return self
+
+    def select(self, columns):
+        return DownClient()
+
+    def execute(self):
+        raise db.requests.ConnectionError('upstream down')
+
+
+def test_open_breaker_fails_fast_and_holds_writes(monkeypatch):
+    from breaker import CircuitBreaker
+
+    session = DownSession()
+    monkeypatch.setattr(db, 'supabase', DownClient())
+    monkeypatch.setattr(db, 'backend', None)
+    monkeypatch.setattr(db, '_http', session)
+    monkeypatch.setattr(db, 'breaker', CircuitBreaker('test', failures=4, reset_ms=60000))
+
+    # Each call fails on the client and then the REST path: two calls open the breaker
+    assert db.save_messages([db.make_message('r', 'Anon-1', 'hi')]) is None
+    assert db.fetch_messages_before('r') is None
+    assert session.calls == 2 and db.breaker.state == 'open'
+
+    assert db.save_messages([db.make_message('r', 'Anon-1', 'hi')]) is None
+    assert db.fetch_messages_before('r') is None
+    assert session.calls == 2
+    assert not db.is_available()
+
+
+def cold(monkeypatch, name='memory'):
+    """db as it is right after import: nothing set up yet"""
+    monkeypatch.setattr(db, 'DB_BACKEND', name)
+    monkeypatch.setattr(db, 'backend', None)
+    monkeypatch.setattr(db, 'supabase', None)
+    monkeypatch.setattr(db, '_state', db.COLD)
+    monkeypatch.setattr(db, '_init_error', None)
+    monkeypatch.setattr(db, '_init_retry_at', 0.0)
+
+
+def test_storage_is_set_up_on_first_use(monkeypatch):
+    cold(monkeypatch)
+    assert db.status()['state'] == 'cold' and not db.status()['ready']
+
+    assert db.fetch_recent_messages('r') == []
+    assert db.backend.name == 'memory'
+    assert db.status()['ready'] and db.status()['backend'] == 'memory'
+
+
+def test_failed_setup_is_retried_after_a_pause(monkeypatch):
+    cold(monkeypatch)
+    attempts = []
+
+    def broken():
+        attempts.append(1)
+        raise RuntimeError('no route to host')
+    monkeypatch.setattr(db, '_connect', broken)
+
+    assert not db.is_enabled() and not db.is_enabled()
+    assert len(attempts) == 1
+    status = db.status()
+    assert status['state'] == 'failed' and status['error'] == 'no route to host' and not status['ready']
+
+    monkeypatch.setattr(db, '_init_retry_at', 0.0)
+    db.ensure_db()
+    assert len(attempts) == 2
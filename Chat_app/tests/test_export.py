@@ -0,0 +1,77 @@
+import csv
+import gzip
+import io
+import json
+import zlib
+
+import pytest
+
+import db
+import export
+from memory_backend import MemoryBackend
+
+
+@pytest.fixture
+def backend():
+    backend = MemoryBackend()
+    backend.save_messages([
+        {'room_id': 'r' if i % 3 else 'other', 'user_handle': 'a', 'message_text': f'm{i}',
+         'created_at': f'2026-01-01T00:00:{i // 2:02d}'}
+        for i in range(12)
+    ])
+    return backend
+
+
+def test_pages_walk_forward_by_keyset_and_stop_on_a_short_page(backend):
+    calls = []
+    def fetch(room_id, after, until, limit):
+        calls.append(after)
+        return backend.fetch_messages_after(room_id, after, until, limit)
+
+    pages = list(export.pages('r', page_size=3, fetch=fetch))
+    assert [[m['message_text'] for m in page] for page in pages] == [['m1', 'm2', 'm4'], ['m5', 'm7', 'm8'],
+                                                                     ['m10', 'm11']]
+    assert calls[1] == (pages[0][-1]['created_at'], pages[0][-1]['id']) and len(calls) == 3
+
+
+def test_time_range_spans_rooms_and_until_is_exclusive(backend):
+    rows = [m for page in export.pages(None, ('2026-01-01T00:00:02', None), '2026-01-01T00:00:04',
+                                       page_size=2, fetch=backend.fetch_messages_after) for m in page]
+    assert [m['message_text'] for m in rows] == ['m4', 'm5', 'm6', 'm7']
+
+
+def test_resuming_from_a_row_cursor_continues_after_it(backend):
+    lines = b''.join(export.stream(export.pages('r', fetch=backend.fetch_messages_after))).decode().splitlines()
+    cut = json.loads(lines[2])
+    after = db.decode_cursor(cut['cursor'])
+    rest = [m['message_text'] for page in export.pages('r', after, fetch=backend.fetch_messages_after) for m in page]
+    assert rest == [json.loads(line)['message_text'] for line in lines[3:]]
+
+
+def test_csv_and_gzip_round_trip(backend):
+    chunks = list(export.stream(export.pages('r', page_size=4, fetch=backend.fetch_messages_after), 'csv', gzip=True))
+    # Header, two pages, end of stream; each flushed chunk decodes on its own
+    assert len(chunks) == 4
+    partial = zlib.decompressobj(31).decompress(b''.join(chunks[:2])).decode()
+    assert partial.splitlines()[0] == ','.join(export.FIELDS) and len(partial.splitlines()) == 5
+
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(b''.join(chunks)).decode())))
+    assert [r['message_text'] for r in rows] == ['m1', 'm2', 'm4', 'm5', 'm7', 'm8', 'm10', 'm11']
+    assert db.decode_cursor(rows[0]['cursor']) == (rows[0]['created_at'], int(rows[0]['id']))
+
+
+def test_a_failed_read_ends_the_export_with_an_error():
+    def fetch(room_id, after, until, limit):
+        return [{'id': 1, 'created_at': '2026-01-01T00:00:00'}] * limit if after is None else None
+
+    body = export.stream(export.pages('r', page_size=2, fetch=fetch))
+    next(body)
+    with pytest.raises(export.ExportFailed):
+        next(body)
+
+
+def test_times_are_read_as_utc():
+    assert export.parse_time('2026-01-01T02:00:00+02:00') == '2026-01-01T00:00:00'
+    assert export.parse_time('2026-01-01') == '2026-01-01T00:00:00'
+    with pytest.raises(ValueError):
+        export.parse_time('yesterday')
@@ -0,0 +1,85 @@
+from history_cache import RoomHistoryCache
+
+
+def test_cold_miss_loads_once_then_serves_from_cache():
+    loads = []
+
+    def loader(room):
+        loads.append(room)
+        return [{'message_text': str(i)} for i in range(5)]
+
+    cache = RoomHistoryCache(per_room=3)
+    first = cache.get('r1', loader)
+    second = cache.get('r1', loader)
+
+    assert [m['message_text'] for m in first] == ['2', '3', '4']
+    assert first == second
+    assert loads == ['r1']
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_append_only_fills_warm_rooms_and_keeps_last_n():
+    cache = RoomHistoryCache(per_room=2)
+    assert not cache.append('cold', {'message_text': 'x'})
+
+    cache.get('r1', lambda room: [])
+    for text in 'abc':
+        cache.append('r1', {'message_text': text})
+
+    assert [m['message_text'] for m in cache.get('r1', None)] == ['b', 'c']
+    assert cache.stats()['messages'] == 2
+
+
+def test_failed_load_is_not_cached():
+    cache = RoomHistoryCache()
+    assert cache.get('r1', lambda room: None) == []
+    assert cache.get('r1', lambda room: [{'message_text': 'a'}]) == [{'message_text': 'a'}]
+
+
+def test_idle_rooms_are_evicted_under_the_global_cap():
+    cache = RoomHistoryCache(per_room=10, max_rooms=10, max_messages=4)
+    cache.get('old', lambda room: [{}, {}])
+    cache.get('busy', lambda room: [{}, {}])
+    cache.get('old', None)  # touch so 'busy' becomes least recently used
+    cache.get('new', lambda room: [{}, {}])
+
+    stats = cache.stats()
+    assert stats['rooms'] == 2
+    assert stats['messages'] == 4
+    assert stats['evictions'] == 1
+    assert cache.get('busy', lambda room: None) == []
+
+
+def test_requests_sharing_a_load_wait_green_for_a_loader_that_yields():
+    import eventlet
+
+    loads = []
+    def loader(room):
+        loads.append(room)
+        eventlet.sleep(0.01)    # like a storage call that yields to the hub
+        return [{'message_text': 'a'}]
+
+    cache = RoomHistoryCache()
+    joins = [eventlet.spawn(cache.get, 'r1', loader) for _ in range(3)]
+    started = eventlet.hubs.get_hub().clock()
+    assert [join.wait() for join in joins] == [[{'message_text': 'a'}]] * 3
+    assert loads == ['r1'] and cache.stats()['coalesced'] == 2
+    assert eventlet.hubs.get_hub().clock() - started < 1
+
+
+def test_messages_appended_during_a_load_are_kept_once():
+    cache = RoomHistoryCache()
+    written = {'user_handle': 'a', 'message_text': 'written', 'created_at': '2026-01-01T10:00:00.000000'}
+    unwritten = {'user_handle': 'b', 'message_text': 'unwritten', 'created_at': '2026-01-01T10:00:01'}
+
+    def loader(room):
+        # Both arrive while the read is in flight; only the first made it to the database
+        assert cache.append(room, written) and cache.append(room, unwritten)
+        return [{'id': 1, 'user_handle': 'a', 'message_text': 'old', 'created_at': '2026-01-01T09:00:00+00:00'},
+                dict(written, id=2, created_at='2026-01-01T10:00:00+00:00')]
+
+    first = cache.get('r1', loader)
+    assert [m['message_text'] for m in first] == ['old', 'written', 'unwritten']
+    assert cache.get('r1', None) == first
+    assert not cache.append('cold', written)
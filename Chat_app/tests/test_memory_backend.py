@@ -0,0 +1,31 @@
+from memory_backend import MemoryBackend
+
+
+def test_pages_walk_back_by_created_at_then_id():
+    backend = MemoryBackend()
+    backend.save_messages([
+        {'room_id': 'r', 'user_handle': 'a', 'message_text': str(i), 'created_at': f'2026-01-01T00:00:0{i // 2}'}
+        for i in range(6)
+    ])
+    newest = backend.fetch_messages_before('r', None, 4)
+    assert [m['message_text'] for m in newest] == ['2', '3', '4', '5']
+
+    first = newest[0]
+    older = backend.fetch_messages_before('r', (first['created_at'], first['id']), 4)
+    assert [m['message_text'] for m in older] == ['0', '1']
+    assert backend.fetch_messages_before('other', None, 4) == []
+
+
+def test_create_rooms_counts_only_new_rooms():
+    backend = MemoryBackend()
+    assert backend.create_rooms(['a', 'b']) == 2
+    assert backend.create_rooms(['b', 'c']) == 1
+
+
+def test_search_pages_with_the_history_cursor():
+    backend = MemoryBackend()
+    backend.save_messages([{'room_id': 'r', 'user_handle': 'a', 'message_text': f'hello {i}'} for i in range(5)])
+    first = backend.search_messages('r', ['hello'], None, 3)
+    assert [m['message_text'] for m in first] == ['hello 4', 'hello 3', 'hello 2']
+    rest = backend.search_messages('r', ['hello'], (first[-1]['created_at'], first[-1]['id']), 3)
+    assert [m['message_text'] for m in rest] == ['hello 1', 'hello 0']
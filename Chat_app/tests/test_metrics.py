@@ -0,0 +1,26 @@
+import metrics
+
+
+def test_histogram_buckets_are_cumulative():
+    hist = metrics.Histogram('test_latency_seconds', 'test', ['op'], buckets=(0.1, 1.0))
+    hist.observe(0.05, op='a')
+    hist.observe(0.5, op='a')
+    hist.observe(5, op='a')
+
+    lines = hist.samples()
+    assert 'test_latency_seconds_bucket{op="a",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{op="a",le="1"} 2' in lines
+    assert 'test_latency_seconds_bucket{op="a",le="+Inf"} 3' in lines
+    assert 'test_latency_seconds_count{op="a"} 3' in lines
+
+
+def test_counter_and_callback_gauge_render():
+    counter = metrics.Counter('test_events_total', 'test', ['kind'])
+    counter.inc(kind='x')
+    counter.inc(2, kind='x')
+    metrics.CallbackGauge('test_depth', 'test', lambda: 7)
+
+    text = metrics.render()
+    assert '# TYPE test_events_total counter' in text
+    assert 'test_events_total{kind="x"} 3' in text
+    assert 'test_depth 7' in text
@@ -0,0 +1,130 @@
+import os
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+import requests
+import socketio
+
+import pubsub
+from pubsub import LocalBroker
+from sharding import HashRing
+
+APP_DIR = Path(__file__).resolve().parent.parent
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_worker(port, queue_url, **extra_env):
+    env = dict(os.environ, PORT=str(port), SOCKETIO_MESSAGE_QUEUE=queue_url, **extra_env)
+    proc = subprocess.Popen([sys.executable, 'app.py'], cwd=APP_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 20
+    while time.time() < deadline:
+        try:
+            requests.get(f'http://127.0.0.1:{port}/', timeout=1)
+            return proc
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f'worker on port {port} did not start')
+
+
+def test_room_messages_cross_workers_through_broker():
+    broker = LocalBroker(port=0)
+    broker.start()
+    ports = [free_port(), free_port()]
+    workers = [start_worker(port, broker.url) for port in ports]
+    clients = [socketio.Client(), socketio.Client()]
+    received = threading.Event()
+    got = []
+
+    @clients[1].on('message')
+    def on_message(data):
+        got.append(data)
+        received.set()
+
+    try:
+        for client, port in zip(clients, ports):
+            client.connect(f'http://127.0.0.1:{port}', transports=['polling'])
+            client.emit('join', {'room': 'multi-worker'})
+        time.sleep(0.5)
+
+        clients[0].emit('message', {'room': 'multi-worker', 'handle': 'Anon-a', 'text': 'across workers'})
+        assert received.wait(10)
+        assert got[0]['text'] == 'across workers'
+    finally:
+        for client in clients:
+            client.disconnect()
+        for proc in workers:
+            proc.terminate()
+            proc.wait(10)
+        broker.shutdown()
+        broker.server_close()
+
+
+def sharding_stat(port, stat):
+    text = requests.get(f'http://127.0.0.1:{port}/metrics').text
+    found = re.search(rf'^chat_sharding{{stat="{stat}"}} (\S+)$', text, re.M)
+    return float(found.group(1)) if found else None
+
+
+def test_sharded_workers_forward_messages_and_history_to_the_room_owner():
+    broker = LocalBroker(port=0)
+    broker.start()
+    ports = [free_port(), free_port()]
+    shard = {'ROOM_SHARDING': '1', 'SHARD_HEARTBEAT_MS': '100', 'DB_BACKEND': 'memory'}
+    workers = [start_worker(port, broker.url, SHARD_NODE_ID=f'w{i}', **shard) for i, port in enumerate(ports)]
+    # A room worker 1 owns; its clients connect to worker 0
+    room = next(f'owned-{i}' for i in range(1000) if HashRing(['w0', 'w1']).owner(f'owned-{i}') == 'w1')
+    sender, joiner = socketio.Client(), socketio.Client()
+    histories = []
+    received = threading.Event()
+    sender.on('message', lambda data: received.set())
+    joiner.on('message_history', histories.append)
+
+    try:
+        deadline = time.time() + 10
+        while not all(sharding_stat(port, 'nodes') == 2 for port in ports) and time.time() < deadline:
+            time.sleep(0.1)
+        assert all(sharding_stat(port, 'nodes') == 2 for port in ports)
+
+        sender.connect(f'http://127.0.0.1:{ports[0]}', transports=['polling'])
+        sender.emit('join', {'room': room})
+        time.sleep(0.3)
+        sender.emit('message', 'via the owner')
+        assert received.wait(10)
+        # The message went to worker 1 to be broadcast and queued; worker 0's cold history load asked it too
+        assert sharding_stat(ports[0], 'forwarded') == 1 and sharding_stat(ports[0], 'requests') == 1
+        assert sharding_stat(ports[1], 'received') == 2
+
+        joiner.connect(f'http://127.0.0.1:{ports[1]}', transports=['polling'])
+        joiner.emit('join', {'room': room})
+        deadline = time.time() + 10
+        while not histories and time.time() < deadline:
+            time.sleep(0.05)
+        assert [m['message_text'] for m in histories[0]['messages']] == ['via the owner']
+    finally:
+        for client in (sender, joiner):
+            client.disconnect()
+        for proc in workers:
+            proc.terminate()
+            proc.wait(10)
+        broker.shutdown()
+        broker.server_close()
+
+
+def test_redis_queue_without_the_redis_package_fails_clearly(monkeypatch):
+    monkeypatch.setattr(pubsub.importlib.util, 'find_spec', lambda name: None)
+    with pytest.raises(RuntimeError, match='pip install redis'):
+        pubsub.socketio_options('redis://localhost:6379/0')
+    assert pubsub.socketio_options('amqp://localhost')['message_queue'] == 'amqp://localhost'
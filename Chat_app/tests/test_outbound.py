@@ -0,0 +1,160 @@
+import json
+
+from engineio import packet as eio_packet
+from socketio import packet
+
+from outbound import OutboundQueues
+
+
+class FakeSocket:
+    def __init__(self):
+        self.frames = []
+        self.closed = False
+
+    @property
+    def queue(self):
+        return self
+
+    def qsize(self):
+        return len(self.frames)
+
+    def read(self, n=None):
+        """The client reads n frames (all by default); returns their events"""
+        n = len(self.frames) if n is None else n
+        taken, self.frames = self.frames[:n], self.frames[n:]
+        return [json.loads(p.data[1:])[0] if p.data.startswith('2[') else p.data for p in taken]
+
+
+class FakeEngine:
+    def __init__(self):
+        self.sockets = {}
+        self.disconnected = []
+
+    def disconnect(self, eio_sid):
+        self.disconnected.append(eio_sid)
+        self.sockets.pop(eio_sid).closed = True
+
+
+class FakeServer:
+    packet_class = packet.Packet
+
+    def __init__(self):
+        self.eio = FakeEngine()
+
+    def _send_eio_packet(self, eio_sid, pkt):
+        self.eio.sockets[eio_sid].frames.append(pkt)
+
+
+def frame(event, n=0):
+    encoded = packet.Packet(packet.EVENT, namespace='/', data=[event, {'n': n}]).encode()
+    return eio_packet.Packet(eio_packet.MESSAGE, encoded)
+
+
+def make(policy='drop_oldest', max_frames=3, handoff=2):
+    server = FakeServer()
+    queues = OutboundQueues(server, max_frames=max_frames, handoff=handoff, policy=policy)
+    queues.install()
+    for sid in ('fast', 'slow'):
+        server.eio.sockets[sid] = FakeSocket()
+    return server, queues
+
+
+def broadcast(server, count, start=0):
+    """Send count messages to every client; the fast one reads each as it arrives"""
+    for n in range(start, start + count):
+        for sid in list(server.eio.sockets):
+            server._send_eio_packet(sid, frame('message', n))
+        if 'fast' in server.eio.sockets:
+            server.eio.sockets['fast'].read()
+
+
+def test_slow_client_is_held_to_its_limit_and_loses_the_oldest_frames():
+    server, queues = make()
+    slow = server.eio.sockets['slow']
+    broadcast(server, 10)
+    # The slow client's socket has the handoff's worth; the queue keeps the newest 3
+    assert slow.qsize() == 2
+    assert queues.stats() == {'clients_backlogged': 1, 'frames_held': 3, 'max_client_depth': 3,
+                              'held_total': 8, 'dropped': 5, 'resyncs': 0, 'disconnects': 0}
+
+    slow.read()
+    queues.drain()
+    slow.read()
+    queues.drain()
+    assert [json.loads(p.data[1:])[1]['n'] for p in slow.frames] == [9]
+    assert queues.stats()['clients_backlogged'] == 0
+
+
+def test_other_packets_are_never_held():
+    server, queues = make()
+    broadcast(server, 5)
+    slow = server.eio.sockets['slow']
+    server._send_eio_packet('slow', frame('your_handle'))
+    server._send_eio_packet('slow', eio_packet.Packet(eio_packet.MESSAGE, '2/admin,["message",{}]'))
+    assert slow.qsize() == 4
+
+
+def test_resync_replaces_what_was_missed_with_one_marker():
+    server, queues = make(policy='resync')
+    slow = server.eio.sockets['slow']
+    broadcast(server, 10)
+    assert slow.qsize() == 2 and queues.stats()['frames_held'] == 0
+
+    # Nothing goes out until the marker has, and the marker waits for room
+    queues.drain()
+    assert slow.qsize() == 2
+    assert slow.read() == ['message', 'message']
+    queues.drain()
+    assert slow.read() == ['resync']
+    assert queues.stats()['resyncs'] == 1 and queues.stats()['dropped'] == 8
+
+    broadcast(server, 1, 10)
+    assert slow.read() == ['message']
+
+
+def test_resync_marker_counts_every_missed_frame():
+    server, queues = make(policy='resync')
+    slow = server.eio.sockets['slow']
+    broadcast(server, 10)
+    slow.read()
+    queues.drain()
+    assert json.loads(slow.frames[0].data[1:]) == ['resync', {'missed': 8}]
+
+
+def test_disconnect_policy_disconnects_from_the_drainer():
+    server, queues = make(policy='disconnect')
+    broadcast(server, 10)
+    assert server.eio.disconnected == []
+    queues.drain()
+    assert server.eio.disconnected == ['slow']
+    assert queues.stats()['disconnects'] == 1 and queues.stats()['frames_held'] == 0
+
+
+def test_gone_clients_are_forgotten():
+    server, queues = make()
+    broadcast(server, 4)
+    server.eio.sockets['slow'].closed = True
+    queues.drain()
+    assert queues.stats()['frames_held'] == 0 and queues.stats()['clients_backlogged'] == 0
+
+
+def test_off_leaves_the_server_alone():
+    server = FakeServer()
+    send = server._send_eio_packet
+    OutboundQueues(server, max_frames=0).install()
+    assert server._send_eio_packet == send
+
+
+def test_depths_are_exported_as_buckets_and_drops_are_counted():
+    server = FakeServer()
+    drops = []
+    queues = OutboundQueues(server, max_frames=3, handoff=2, on_drop=drops.append)
+    queues.install()
+    for sid in ('fast', 'slow', 'slower'):
+        server.eio.sockets[sid] = FakeSocket()
+    broadcast(server, 3)
+    # Both slow clients have one frame held; the slower one gets three more and overflows by one
+    for n in range(3, 6):
+        server._send_eio_packet('slower', frame('message', n))
+    assert queues.depth_histogram((1, 2)) == [('1', 1), ('2', 1), ('+Inf', 2)]
+    assert sum(drops) == queues.stats()['dropped'] == 1
@@ -0,0 +1,112 @@
+import os
+import uuid
+
+import pytest
+
+import db
+
+DSN = os.getenv('TEST_DATABASE_URL')
+
+
+@pytest.fixture
+def backend():
+    if not DSN:
+        pytest.skip('set TEST_DATABASE_URL to run against a local Postgres')
+    from pg_backend import PostgresBackend
+    backend = PostgresBackend(DSN, pool_size=2, green=False)
+    backend.ensure_schema()
+    yield backend
+    backend.pool.closeall()
+
+
+def test_room_upsert_is_idempotent_and_batched(backend):
+    rooms = ['pg-' + uuid.uuid4().hex for _ in range(3)]
+    assert backend.create_rooms(rooms[:1]) == 1
+    assert backend.create_rooms(rooms) == 2
+    assert backend.create_rooms(rooms) == 0
+
+
+def test_batch_insert_and_keyset_pages(backend):
+    room = 'pg-' + uuid.uuid4().hex
+    backend.create_rooms([room])
+    rows = [db.make_message(room, 'Anon-1', f'msg {i}') for i in range(5)]
+    saved = backend.save_messages(rows)
+    assert [m['message_text'] for m in saved] == [r['message_text'] for r in rows]
+    assert all(isinstance(m['id'], int) for m in saved)
+
+    newest = backend.fetch_messages_before(room, None, 3)
+    assert [m['message_text'] for m in newest] == ['msg 2', 'msg 3', 'msg 4']
+
+    older = backend.fetch_messages_before(room, db.decode_cursor(db.encode_cursor(newest[0])), 3)
+    assert [m['message_text'] for m in older] == ['msg 0', 'msg 1']
+
+    exported = backend.fetch_messages_after(room, None, None, 3)
+    assert [m['message_text'] for m in exported] == ['msg 0', 'msg 1', 'msg 2']
+    after = db.decode_cursor(db.encode_cursor(exported[-1]))
+    assert [m['message_text'] for m in backend.fetch_messages_after(room, after, None, 3)] == ['msg 3', 'msg 4']
+
+
+def test_keyset_indexes_cover_the_id_tiebreak(backend):
+    def work(conn, cur):
+        cur.execute("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = 'messages'")
+        return dict(cur.fetchall())
+    indexes = backend._run(work)
+    assert indexes['idx_messages_room_created_id'].endswith('(room_id, created_at, id)')
+    assert indexes['idx_messages_created_id'].endswith('(created_at, id)')
+    assert 'idx_messages_room_created' not in indexes
+
+
+def test_pool_reuses_connections(backend):
+    room = 'pg-' + uuid.uuid4().hex
+    for _ in range(5):
+        backend.create_rooms([room])
+    assert backend.pool.opened == 1
+
+
+def test_retention_deletes_in_batches_and_by_count(backend):
+    room = 'pg-' + uuid.uuid4().hex
+    backend.create_rooms([room])
+    backend.save_messages([{'room_id': room, 'user_handle': 'Anon-1', 'message_text': str(day),
+                            'created_at': f'2020-01-0{day}T00:00:00'} for day in range(1, 8)])
+
+    assert backend.delete_messages_before(room, ('2020-01-04T00:00:00', None), 2) == 2
+    assert backend.delete_messages_before(room, ('2020-01-04T00:00:00', None), 2) == 1
+    boundary = backend.nth_newest(room, 1)
+    assert backend.delete_messages_before(room, boundary, 100) == 2
+    assert [m['message_text'] for m in backend.fetch_messages_before(room, None, 10)] == ['6', '7']
+    assert room in backend.list_rooms(room[:-1], 10)
+
+
+def test_search_matches_every_word_newest_first(backend):
+    room = 'pg-' + uuid.uuid4().hex
+    backend.create_rooms([room])
+    backend.save_messages([{'room_id': room, 'user_handle': 'Anon-1', 'message_text': text,
+                            'created_at': f'2020-01-0{i + 1}T00:00:00'}
+                           for i, text in enumerate(['Red apple', 'green apple', 'red pear'])])
+    assert [m['message_text'] for m in backend.search_messages(room, ['red'], None, 10)] == ['red pear', 'Red apple']
+    newest = backend.search_messages(room, ['apple'], None, 1)
+    older = backend.search_messages(room, ['apple'], db.decode_cursor(db.encode_cursor(newest[0])), 10)
+    assert [m['message_text'] for m in older] == ['Red apple']
+
+
+def test_green_pool_waits_without_blocking_the_holder(monkeypatch):
+    pytest.importorskip('psycopg2')
+    import eventlet
+    from pg_backend import ConnectionPool
+
+    class Conn:
+        closed = False
+        status = 1   # psycopg2.extensions.STATUS_READY
+
+    pool = ConnectionPool('', size=1, timeout=5, green=True)
+    monkeypatch.setattr(pool, '_open', Conn)
+
+    def query():
+        conn = pool.acquire()
+        eventlet.sleep(0.01)    # a query yielding through the wait callback
+        pool.release(conn)
+        return True
+
+    started = eventlet.hubs.get_hub().clock()
+    assert all(g.wait() for g in [eventlet.spawn(query) for _ in range(3)])
+    assert eventlet.hubs.get_hub().clock() - started < 1
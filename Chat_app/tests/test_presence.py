@@ -0,0 +1,73 @@
+from presence import PresenceTracker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make(**kwargs):
+    kwargs.setdefault('leave_grace_ms', 0)
+    sent, clock = [], Clock()
+    tracker = PresenceTracker(lambda room, diff: sent.append((room, diff)), lambda room: 7,
+                              typing_ttl_ms=3000, clock=clock, **kwargs)
+    return tracker, sent, clock
+
+
+def test_changes_are_aggregated_into_one_diff_per_room():
+    tracker, sent, clock = make()
+    tracker.joined('r', 'a')
+    tracker.joined('r', 'b')
+    tracker.joined('r', 'c')
+    tracker.left('r', 'c')      # joined and left in the same interval: not reported
+    tracker.left('r', 'z')
+
+    assert tracker.flush() == 1
+    room, diff = sent[0]
+    assert room == 'r'
+    assert diff['joined'] == ['a', 'b'] and diff['left'] == ['z'] and diff['count'] == 7
+    assert tracker.flush() == 0
+    assert tracker.stats()['pending_rooms'] == 0
+
+
+def test_typing_is_debounced_and_expires():
+    tracker, sent, clock = make()
+    tracker.typing('r', 'a')
+    tracker.typing('r', 'a')
+    tracker.flush()
+    assert sent[-1][1]['typing'] == ['a']
+
+    clock.now = 2.0
+    tracker.typing('r', 'a')    # still typing: extends the expiry, no new diff
+    assert tracker.flush() == 0
+
+    clock.now = 5.5
+    assert tracker.flush() == 1
+    assert sent[-1][1]['typing'] == []
+    assert tracker.stats()['pending_rooms'] == 0
+
+
+def test_lists_are_capped_but_counted():
+    tracker, sent, clock = make(max_list=2)
+    for handle in 'abcde':
+        tracker.joined('r', handle)
+    tracker.flush()
+    assert sent[0][1]['joined'] == ['a', 'b'] and sent[0][1]['joined_count'] == 5
+
+
+def test_rejoin_inside_the_grace_window_is_not_announced():
+    tracker, sent, clock = make(leave_grace_ms=5000)
+    tracker.left('r', 'a')
+    tracker.left('r', 'b')
+    assert tracker.flush() == 0
+
+    clock.now = 2.0
+    tracker.joined('r', 'a')    # reconnected
+    clock.now = 5.0
+    assert tracker.flush() == 1
+    assert sent[-1][1]['left'] == ['b'] and sent[-1][1]['joined'] == []
+    assert tracker.stats()['rejoins'] == 1
+    assert tracker.stats()['pending_rooms'] == 0
@@ -0,0 +1,72 @@
+import time
+
+import eventlet
+
+from profiler import HubLagMonitor, SamplingProfiler, collapse, render
+
+
+def spin(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def park():
+    eventlet.sleep(10)
+
+
+def test_collapsed_stack_is_outermost_first():
+    import sys
+
+    def inner():
+        return collapse(sys._getframe())
+    stack = inner().split(';')
+    assert stack[-1].startswith('test_collapsed_stack_is_outermost_first.<locals>.inner (test_profiler.py:')
+    assert stack[-2].startswith('test_collapsed_stack_is_outermost_first (test_profiler.py:')
+
+
+def test_profile_samples_the_code_running_on_the_hub_thread():
+    profiler = SamplingProfiler(interval_ms=1)
+    assert profiler.start()
+    assert not profiler.start()
+    spin(0.1)
+    counts = profiler.stop()
+    assert profiler.samples > 10
+    assert sum(n for stack, n in counts.items() if stack.endswith(f';spin (test_profiler.py:{spin.__code__.co_firstlineno})')) > 5
+    assert render(counts).splitlines()[0].endswith(f' {counts.most_common(1)[0][1]}')
+
+
+def test_profile_can_include_parked_green_threads():
+    parked = eventlet.spawn(park)
+    eventlet.sleep(0)
+    profiler = SamplingProfiler(interval_ms=1)
+    stacks = profiler.profile(0.05, eventlet.sleep, include_waiting=True)
+    parked.kill()
+    assert any(line.startswith('waiting;') and 'park (test_profiler.py' in line for line in stacks.splitlines())
+
+
+class FakeSocketIO:
+    sleep = staticmethod(eventlet.sleep)
+    start_background_task = staticmethod(eventlet.spawn)
+
+
+def block_hub(seconds):
+    time.sleep(seconds)
+
+
+def test_lag_monitor_records_a_stall_and_what_caused_it():
+    observed = []
+    monitor = HubLagMonitor(observed.append, interval_ms=10, slow_ms=50)
+    assert monitor.start(FakeSocketIO())
+    eventlet.sleep(0.05)
+    block_hub(0.2)
+    eventlet.sleep(0.05)
+    monitor.stop()
+
+    assert max(observed) >= 0.15
+    assert monitor.stats()['stalls'] == 1 and monitor.stats()['max_lag_ms'] >= 150
+    assert monitor.last_stall_stack.endswith(f';block_hub (test_profiler.py:{block_hub.__code__.co_firstlineno})')
+
+
+def test_lag_monitor_off():
+    assert not HubLagMonitor(lambda late: None, interval_ms=0).start(FakeSocketIO())
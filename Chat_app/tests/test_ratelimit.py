@@ -0,0 +1,60 @@
+from ratelimit import Limit, RateLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make(sid=Limit(1, 2), room=Limit(0, 0), ip=Limit(0, 0), **kwargs):
+    clock = Clock()
+    return RateLimiter(sid, room, ip, clock=clock, **kwargs), clock
+
+
+def test_bucket_allows_burst_then_refills_at_rate():
+    limiter, clock = make()
+    assert limiter.check('s') is None
+    assert limiter.check('s') is None
+    assert limiter.check('s') == ('sid', 1.0)
+
+    clock.now = 0.5
+    assert limiter.check('s') == ('sid', 0.5)
+    clock.now = 1.0
+    assert limiter.check('s') is None
+    assert limiter.stats()['limited_sid'] == 2
+
+
+def test_room_limit_spans_senders_and_a_denied_event_costs_nothing():
+    limiter, clock = make(sid=Limit(1, 1), room=Limit(1, 2))
+    assert limiter.check('a', 'r') is None
+    assert limiter.check('a', 'r') == ('sid', 1.0)
+    assert limiter.check('b', 'r') is None
+    assert limiter.check('c', 'r') == ('room', 1.0)
+    # c's own bucket was not charged for the rejected message
+    clock.now = 1.0
+    assert limiter.check('c', 'other') is None
+    assert limiter.check('c', 'other') == ('sid', 1.0)
+
+
+def test_forget_and_bounded_room_buckets():
+    limiter, clock = make(room=Limit(1, 1), max_keys=2)
+    for room in ('r1', 'r2', 'r3'):
+        limiter.check(room, room)
+    assert limiter.stats()['rooms'] == 2
+    assert limiter.stats()['sids'] == 3
+    limiter.forget('r1')
+    assert limiter.stats()['sids'] == 2
+
+
+def test_typing_has_its_own_bucket_and_leaves_messages_alone():
+    limiter, clock = make(sid=Limit(1, 1), typing_limit=Limit(1, 2))
+    assert limiter.check('s', typing=True) is None
+    assert limiter.check('s', typing=True) is None
+    assert limiter.check('s', typing=True) == ('typing', 1.0)
+    assert limiter.check('s', 'r') is None
+    assert limiter.stats()['limited_typing'] == 1
+    limiter.forget('s')
+    assert limiter.check('s', typing=True) is None
@@ -0,0 +1,62 @@
+from datetime import datetime
+
+import pytest
+
+import db
+from memory_backend import MemoryBackend
+from retention import Policy, RetentionJob, load_policies
+
+NOW = datetime(2026, 3, 10)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    backend = MemoryBackend()
+    monkeypatch.setattr(db, 'backend', backend)
+    rows = []
+    for room in ('lobby', 'archive', 'busy'):
+        for day in range(1, 10):
+            rows.append({'room_id': room, 'user_handle': 'a', 'message_text': f'{room}{day}',
+                         'created_at': f'2026-03-0{day}T12:00:00'})
+    backend.save_messages(rows)
+    backend.create_rooms(['lobby', 'archive', 'busy'])
+    return backend
+
+
+def texts(backend, room):
+    return [m['message_text'] for m in backend.fetch_messages_before(room, None, 100)]
+
+
+def test_age_and_count_policies_with_room_overrides(store):
+    job = RetentionJob(
+        default=Policy(max_age_days=5, max_count=0),
+        rooms={'archive': Policy(max_age_days=0, max_count=0), 'busy': Policy(max_age_days=5, max_count=2)},
+        batch_size=2, batch_pause_ms=0, sleep=lambda s: None, now=lambda: NOW)
+
+    assert job.run_once() == {'deleted_by_age': 8, 'deleted_by_count': 3}
+    assert texts(store, 'lobby') == ['lobby5', 'lobby6', 'lobby7', 'lobby8', 'lobby9']
+    assert len(texts(store, 'archive')) == 9
+    assert texts(store, 'busy') == ['busy8', 'busy9']
+
+    # A second run (or another worker running at the same time) finds nothing left to do
+    assert job.run_once() == {'deleted_by_age': 0, 'deleted_by_count': 0}
+
+
+def test_default_count_limit_pages_through_rooms(store, monkeypatch):
+    monkeypatch.setattr('retention.ROOMS_PAGE', 2)
+    job = RetentionJob(default=Policy(0, 3), rooms={'lobby': Policy(0, 1)},
+                       batch_pause_ms=0, sleep=lambda s: None, now=lambda: NOW)
+    assert job.run_once()['deleted_by_count'] == 8 + 6 + 6
+    assert texts(store, 'lobby') == ['lobby9']
+    assert texts(store, 'archive') == ['archive7', 'archive8', 'archive9']
+
+
+def test_delete_old_messages_deletes_in_batches(store):
+    assert db.delete_old_messages('lobby', days=(datetime.utcnow() - datetime(2026, 3, 4)).days, batch_size=1) >= 3
+
+
+def test_policies_fall_back_to_the_default():
+    policies = load_policies('{"lobby": {"max_count": 10}}', Policy(30, 0))
+    assert policies == {'lobby': Policy(30, 10)}
+    assert load_policies('not json') == {}
+    assert not RetentionJob(default=Policy(0, 0), rooms={}).enabled
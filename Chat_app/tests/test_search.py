@@ -0,0 +1,35 @@
+import search
+from search import InvertedIndex
+
+
+def message(i, text, room='r'):
+    return {'id': i, 'room_id': room, 'user_handle': 'Anon-1', 'message_text': text}
+
+
+def test_terms_are_lowercase_unique_words():
+    assert search.terms('Hello, hello WORLD!') == ['hello', 'world']
+    assert search.terms('  ?! ') == []
+
+
+def test_every_word_must_match_newest_first():
+    index = InvertedIndex()
+    for i, text in enumerate(['red apple', 'green apple', 'red pear', 'Red APPLE pie'], start=1):
+        index.add(message(i, text))
+    index.add(message(5, 'red apple', room='other'))
+
+    assert [m['id'] for m in index.search('r', ['red', 'apple'])] == [4, 1]
+    assert [m['id'] for m in index.search('r', ['apple'], before_id=4, limit=1)] == [2]
+    assert index.search('r', ['red', 'banana']) == []
+    assert index.search('nowhere', ['red']) == []
+
+
+def test_deleted_messages_are_not_found_and_get_compacted():
+    index = InvertedIndex()
+    for i in range(1, 2001):
+        index.add(message(i, 'spam' if i % 2 else 'ham'))
+    index.remove(range(1, 1001))
+    assert index.search('r', ['spam'], limit=1000)[-1]['id'] == 1001
+
+    index.remove(range(1001, 1601))
+    assert index.stats() == {'rooms': 1, 'messages': 400, 'stale': 0}
+    assert len(index.search('r', ['ham'], limit=1000)) == 200
@@ -0,0 +1,40 @@
+from sessions import SessionRegistry
+
+
+def test_join_keeps_one_handle_per_sid_and_counts_members():
+    registry = SessionRegistry()
+    handles = iter(['Anon-1', 'Anon-2'])
+    assert registry.join('a', 'r1', lambda: next(handles)).handle == 'Anon-1'
+    assert registry.join('a', 'r2', lambda: next(handles)).handle == 'Anon-1'
+    registry.join('b', 'r1', lambda: next(handles))
+
+    assert registry.count('r1') == 2
+    assert registry.handles('r1') == ['Anon-1', 'Anon-2']
+    assert registry.resolve_room('a')[1] == 'r2'
+    assert registry.resolve_room('a', 'r1')[1] == 'r1'
+    assert registry.resolve_room('b', 'r2')[1] is None
+    assert registry.resolve_room('nobody') == (None, None)
+
+
+def test_remove_cleans_up_rooms():
+    registry = SessionRegistry()
+    registry.join('a', 'r1', lambda: 'Anon-1')
+    registry.join('a', 'r2', lambda: 'Anon-1')
+    registry.join('b', 'r2', lambda: 'Anon-2')
+
+    assert registry.remove('a').handle == 'Anon-1'
+    assert registry.count('r1') == 0
+    assert sorted(registry.room_counts()) == [('r2', 1)]
+    assert registry.stats() == {'sessions': 1, 'rooms': 1}
+
+
+def test_a_resumed_handle_stays_present_until_its_last_sid_leaves():
+    registry = SessionRegistry()
+    registry.join('old', 'r', lambda: 'Anon-1')
+    registry.join('new', 'r', lambda: 'Anon-1')
+    assert registry.count('r') == 2 and registry.handles('r') == ['Anon-1']
+
+    registry.remove('old')
+    assert registry.present('r', 'Anon-1')
+    registry.remove('new')
+    assert not registry.present('r', 'Anon-1')
@@ -0,0 +1,96 @@
+from sharding import EVENT, HashRing, RoomRouter
+
+ROOMS = [f'room-{i}' for i in range(5000)]
+
+
+def test_ring_spreads_rooms_and_moves_few_when_a_node_joins():
+    ring = HashRing(['a', 'b', 'c'])
+    before = {room: ring.owner(room) for room in ROOMS}
+    counts = {node: list(before.values()).count(node) for node in 'abc'}
+    assert all(len(ROOMS) / 3 * 0.7 < n < len(ROOMS) / 3 * 1.3 for n in counts.values())
+
+    ring.add('d')
+    moved = [room for room in ROOMS if ring.owner(room) != before[room]]
+    # Only rooms taken over by the new node change owner, about a quarter of them
+    assert all(ring.owner(room) == 'd' for room in moved)
+    assert 0.15 < len(moved) / len(ROOMS) < 0.35
+
+    ring.remove('d')
+    assert {room: ring.owner(room) for room in ROOMS} == before
+
+
+class Bus:
+    """Delivers each emit to every other router, as the pub/sub bus does"""
+
+    def __init__(self):
+        self.routers = []
+
+    def join(self, node, **kwargs):
+        router = RoomRouter(lambda event, data, to: self.publish(router, event, data, to),
+                            node_id=node, enabled=True, **kwargs)
+        self.routers.append(router)
+        return router
+
+    def publish(self, sender, event, data, to):
+        for router in self.routers:
+            if router is not sender:
+                router.on_remote_emit(event, data, to)
+
+
+def heartbeat(*routers):
+    for router in routers:
+        router._emit(EVENT, {'kind': 'heartbeat', 'from': router.node}, 'shard:members')
+
+
+def test_messages_and_requests_are_forwarded_to_the_room_owner():
+    bus = Bus()
+    a, b = bus.join('a'), bus.join('b')
+    handled = {'a': [], 'b': []}
+    for router in (a, b):
+        router.handle('message', handled[router.node].append)
+        router.handle('history', lambda room, node=router.node: [f'{node} has {room}'])
+    heartbeat(a, b)
+    assert a.ring.nodes == b.ring.nodes == {'a', 'b'}
+
+    room = next(r for r in ROOMS if a.owner(r) == 'b')
+    assert b.owner(room) == 'b'
+    a.send(room, 'message', 'hi')
+    b.send(room, 'message', 'hello')
+    assert handled == {'a': [], 'b': ['hi', 'hello']}
+    assert a.request(room, 'history', room) == [f'b has {room}']
+    assert a.stats()['forwarded'] == 1 and b.stats()['received'] == 2
+
+
+def test_silent_or_departed_nodes_leave_the_ring():
+    now = [0.0]
+    bus = Bus()
+    a = bus.join('a', clock=lambda: now[0], node_timeout_ms=5000)
+    b, c = bus.join('b'), bus.join('c')
+    changes = []
+    a.on_change = lambda: changes.append(len(a.ring.nodes))
+    heartbeat(b, c)
+    assert a.ring.nodes == {'a', 'b', 'c'}
+
+    c._running = True
+    c.stop()
+    assert a.ring.nodes == {'a', 'b'}
+
+    # b goes quiet: the next heartbeat round after the timeout drops it
+    now[0] = 6.0
+    a._running, a._sleep = True, lambda seconds: setattr(a, '_running', False)
+    a._run()
+    assert a.ring.nodes == {'a'} and changes == [2, 3, 2, 1]
+
+
+def test_request_gives_up_when_the_owner_does_not_answer():
+    now = [0.0]
+    bus = Bus()
+    a = bus.join('a', clock=lambda: now[0], sleep=lambda s: now.__setitem__(0, now[0] + s),
+                 request_timeout_ms=100)
+    gone = bus.join('gone')
+    heartbeat(gone)
+    bus.routers.remove(gone)
+
+    room = next(r for r in ROOMS if a.owner(r) == 'gone')
+    assert a.request(room, 'history', room) is None
+    assert a.stats()['request_timeouts'] == 1 and not a._waiting
@@ -0,0 +1,138 @@
+import threading
+
+import pytest
+
+import db
+from sqlite_backend import SQLiteBackend
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = SQLiteBackend(tmp_path / 'chat.sqlite3', readers=2, green=False)
+    yield backend
+    backend.close()
+
+
+def test_database_is_in_wal_mode(backend):
+    assert backend._writer.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+
+def test_batch_insert_and_keyset_pages(backend):
+    backend.create_rooms(['r'])
+    rows = [{'room_id': 'r', 'user_handle': 'a', 'message_text': str(i), 'created_at': f'2026-01-01T00:00:0{i // 2}'}
+            for i in range(6)]
+    saved = backend.save_messages(rows)
+    assert [{key: m[key] for key in rows[0]} for m in saved] == rows
+    assert [m['id'] for m in saved] == list(range(1, 7))
+
+    newest = backend.fetch_messages_before('r', None, 4)
+    assert [m['message_text'] for m in newest] == ['2', '3', '4', '5']
+    older = backend.fetch_messages_before('r', db.decode_cursor(db.encode_cursor(newest[0])), 4)
+    assert [m['message_text'] for m in older] == ['0', '1']
+    assert backend.fetch_messages_before('other', None, 4) == []
+
+
+def test_export_pages_walk_forward_within_a_room_or_a_time_range(backend):
+    backend.create_rooms(['r', 'other'])
+    backend.save_messages([{'room_id': 'r' if i % 2 else 'other', 'user_handle': 'a', 'message_text': str(i),
+                            'created_at': f'2026-01-01T00:00:0{i // 2}'} for i in range(8)])
+    first = backend.fetch_messages_after('r', None, None, 2)
+    assert [m['message_text'] for m in first] == ['1', '3']
+    rest = backend.fetch_messages_after('r', db.decode_cursor(db.encode_cursor(first[-1])), None, 10)
+    assert [m['message_text'] for m in rest] == ['5', '7']
+
+    window = backend.fetch_messages_after(None, ('2026-01-01T00:00:01', None), '2026-01-01T00:00:03', 10)
+    assert [m['message_text'] for m in window] == ['2', '3', '4', '5']
+
+
+def test_create_rooms_counts_only_new_rooms(backend):
+    assert backend.create_rooms(['a', 'b']) == 2
+    assert backend.create_rooms(['b', 'c']) == 1
+    assert backend.list_rooms('a', 10) == ['b', 'c']
+
+
+def test_search_uses_the_fts_index_and_follows_deletes(backend):
+    backend.save_messages([{'room_id': room, 'user_handle': 'a', 'message_text': text, 'created_at': f'2026-01-0{i + 1}'}
+                           for i, (room, text) in enumerate([('r', 'Red apple'), ('r', 'green apple'),
+                                                             ('r', 'red "pear" OR'), ('x', 'red apple')])])
+    assert [m['message_text'] for m in backend.search_messages('r', ['red'], None, 10)] == ['red "pear" OR', 'Red apple']
+    assert [m['message_text'] for m in backend.search_messages('r', ['apple', 'red'], None, 10)] == ['Red apple']
+    assert backend.search_messages('r', ['or'], None, 10)[0]['message_text'] == 'red "pear" OR'
+
+    newest = backend.search_messages('r', ['apple'], None, 1)
+    assert [m['message_text'] for m in backend.search_messages('r', ['apple'], ('', newest[0]['id']), 5)] == ['Red apple']
+
+    backend.delete_messages_before('r', ('2026-01-02', None), 10)
+    assert [m['message_text'] for m in backend.search_messages('r', ['red'], None, 10)] == ['red "pear" OR']
+
+
+def test_an_existing_database_gets_its_search_index_built(tmp_path):
+    path = str(tmp_path / 'old.sqlite3')
+    import sqlite3
+    from sqlite_backend import SCHEMA
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.execute("INSERT INTO messages (room_id, user_handle, message_text, created_at) VALUES ('r', 'a', 'before search', 't')")
+    conn.commit()
+    conn.close()
+
+    backend = SQLiteBackend(path, green=False)
+    assert [m['message_text'] for m in backend.search_messages('r', ['search'], None, 5)] == ['before search']
+    backend.close()
+
+
+def test_history_survives_a_restart(tmp_path):
+    first = SQLiteBackend(tmp_path / 'chat.sqlite3', green=False)
+    first.save_messages([db.make_message('r', 'Anon-1', 'still here')])
+    first.close()
+
+    second = SQLiteBackend(tmp_path / 'chat.sqlite3', green=False)
+    assert [m['message_text'] for m in second.fetch_messages_before('r', None, 10)] == ['still here']
+    second.close()
+
+
+def test_reads_are_not_blocked_by_an_open_write(backend):
+    backend.save_messages([db.make_message('r', 'Anon-1', 'committed')])
+    entered, release = threading.Event(), threading.Event()
+
+    def slow_write(conn):
+        conn.execute(
+            "INSERT INTO messages (room_id, user_handle, message_text, created_at) VALUES ('r', 'b', 'pending', 'z')")
+        entered.set()
+        release.wait(5)
+
+    writer = threading.Thread(target=backend._write, args=(slow_write,))
+    writer.start()
+    try:
+        assert entered.wait(5)
+        # The write transaction is still open; a reader sees the last committed state without waiting
+        assert [m['message_text'] for m in backend.fetch_messages_before('r', None, 10)] == ['committed']
+    finally:
+        release.set()
+        writer.join()
+    assert len(backend.fetch_messages_before('r', None, 10)) == 2
+
+
+def test_retention_deletes_in_batches_and_by_count(backend):
+    backend.create_rooms(['r', 'keep'])
+    backend.save_messages([{'room_id': room, 'user_handle': 'Anon-1', 'message_text': str(day),
+                            'created_at': f'2020-01-0{day}T00:00:00'} for day in range(1, 8) for room in ('r', 'keep')])
+
+    assert backend.delete_messages_before(None, ('2020-01-04T00:00:00', None), 2, exclude=['keep']) == 2
+    assert backend.delete_messages_before(None, ('2020-01-04T00:00:00', None), 2, exclude=['keep']) == 1
+    boundary = backend.nth_newest('r', 1)
+    assert backend.delete_messages_before('r', boundary, 100) == 2
+    assert [m['message_text'] for m in backend.fetch_messages_before('r', None, 10)] == ['6', '7']
+    assert len(backend.fetch_messages_before('keep', None, 10)) == 7
+
+
+def test_green_threads_hand_queries_to_the_pool_without_monkey_patching(tmp_path):
+    eventlet = pytest.importorskip('eventlet')
+
+    # The suite never monkey patches, like python app.py
+    backend = SQLiteBackend(tmp_path / 'chat.sqlite3')
+    here = threading.get_ident()
+    assert backend._call(threading.get_ident) == here
+    assert eventlet.spawn(backend._call, threading.get_ident).wait() != here
+    assert eventlet.spawn(backend.save_messages, [db.make_message('r', 'Anon-1', 'hi')]).wait()[0]['id'] == 1
+    backend.close()
@@ -0,0 +1,29 @@
+import pytest
+
+import wire
+
+ROWS = [
+    {'id': 1, 'room_id': 'r', 'user_handle': 'Anon-1', 'message_text': 'hi', 'created_at': 't1', 'updated_at': 't1'},
+    {'id': 2, 'room_id': 'r', 'user_handle': 'Anon-2', 'message_text': 'yo', 'created_at': 't2', 'updated_at': 't2'},
+]
+PROJECTED = [{'user_handle': 'Anon-1', 'message_text': 'hi', 'created_at': 't1'},
+             {'user_handle': 'Anon-2', 'message_text': 'yo', 'created_at': 't2'}]
+
+
+@pytest.mark.parametrize('fmt', ['json', 'compact', 'msgpack'])
+def test_every_format_round_trips_to_projected_rows(fmt):
+    payload = wire.encode_history('r', ROWS, 'c', wire.negotiate(fmt))
+    assert wire.decode_history(payload) == ('r', PROJECTED, 'c')
+
+
+def test_compact_factors_out_the_room():
+    payload = wire.encode_history('r', ROWS, None, 'compact')
+    assert payload['rows'] == [['Anon-1', 'hi', 't1'], ['Anon-2', 'yo', 't2']]
+    assert 'room_id' not in str(payload)
+
+
+def test_negotiate_falls_back(monkeypatch):
+    assert wire.negotiate(None) == 'json'
+    assert wire.negotiate('xml') == 'json'
+    monkeypatch.setattr(wire, 'msgpack', None)
+    assert wire.negotiate('msgpack') == 'compact'
@@ -0,0 +1,93 @@
+from write_queue import WriteBehindQueue
+
+
+def make_queue(flush_fn, **kwargs):
+    kwargs.setdefault('retry_base', 0)
+    kwargs.setdefault('enqueue_timeout', 0)
+    return WriteBehindQueue(flush_fn, sleep=lambda s: None, **kwargs)
+
+
+def test_flush_writes_in_batches_of_max_batch():
+    batches = []
+    q = make_queue(lambda rows: batches.append(list(rows)) or rows, max_batch=3)
+    for i in range(7):
+        q.enqueue({'message_text': str(i)})
+
+    assert q.flush() == 7
+    assert [len(b) for b in batches] == [3, 3, 1]
+    assert q.stats()['depth'] == 0
+    assert q.stats()['flushed'] == 7
+
+
+def test_failed_flush_requeues_in_order_then_gives_up():
+    calls = []
+
+    def failing(rows):
+        calls.append([r['message_text'] for r in rows])
+        return None
+
+    q = make_queue(failing, max_retries=2)
+    q.enqueue({'message_text': 'a'})
+    q.enqueue({'message_text': 'b'})
+
+    assert q.flush() == 0
+    assert q.depth() == 2
+    assert calls[-1] == ['a', 'b']
+
+    q.flush()
+    q.flush()
+    assert q.depth() == 0
+    assert q.stats()['retries'] == 2
+    assert q.stats()['failed'] == 2
+
+
+def test_full_buffer_drops_and_counts():
+    q = make_queue(lambda rows: rows, max_pending=2)
+    assert q.enqueue({'message_text': 'a'})
+    assert q.enqueue({'message_text': 'b'})
+    assert not q.enqueue({'message_text': 'c'})
+    assert q.stats()['dropped'] == 1
+
+
+def test_stop_drains_pending_messages():
+    written = []
+    q = make_queue(lambda rows: written.extend(rows) or rows)
+    for i in range(5):
+        q.enqueue({'message_text': str(i)})
+
+    assert q.stop() == 0
+    assert len(written) == 5
+
+
+def test_nothing_is_written_or_retried_while_not_ready():
+    ready = [False]
+    written = []
+    q = make_queue(lambda rows: written.extend(rows) or rows, ready=lambda: ready[0], max_retries=1)
+    q.enqueue({'message_text': 'a'})
+
+    for _ in range(3):
+        assert q.flush() == 0
+    assert q.depth() == 1 and q.stats()['retries'] == 0
+
+    ready[0] = True
+    assert q.flush() == 1
+    assert written == [{'message_text': 'a'}]
+
+
+def test_flushes_from_two_greenlets_wait_green_for_each_other():
+    import eventlet
+
+    written = []
+    def yielding(rows):
+        eventlet.sleep(0.01)    # like a storage call that yields to the hub
+        written.extend(rows)
+        return rows
+
+    q = make_queue(yielding)
+    q.enqueue({'message_text': 'a'})
+    first = eventlet.spawn(q.flush)
+    eventlet.sleep(0)
+    q.enqueue({'message_text': 'b'})
+    second = eventlet.spawn(q.flush)
+    assert first.wait() + second.wait() == 2
+    assert [r['message_text'] for r in written] == ['a', 'b']
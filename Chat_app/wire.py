@@ -0,0 +1,54 @@
+"""
+Wire formats for history payloads (message_history, older_messages, /rooms/<room>/messages)
+
+A client asks for a format when it joins ({"room": ..., "format": ...}) or with ?format= over HTTP:
+  json     (default) one object per message, projected to the fields clients use
+  compact  room factored out, one array per message in "fields" order
+  msgpack  the compact payload MessagePack-encoded and sent as a binary attachment
+           (needs the optional msgpack package; falls back to compact without it)
+"""
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# The columns a client renders; id/room_id/updated_at never leave the server
+FIELDS = ('user_handle', 'message_text', 'created_at')
+FORMATS = ('json', 'compact', 'msgpack')
+
+
+def negotiate(requested):
+    """The format to use for a client that asked for `requested`"""
+    if requested == 'msgpack':
+        return 'msgpack' if msgpack is not None else 'compact'
+    return requested if requested in FORMATS else 'json'
+
+
+def project(message):
+    return {field: message.get(field) for field in FIELDS}
+
+
+def rows(messages):
+    return [[message.get(field) for field in FIELDS] for message in messages]
+
+
+def encode_history(room, messages, cursor, fmt='json'):
+    """History payload in the negotiated format"""
+    if fmt == 'json':
+        return {"room": room, "messages": [project(m) for m in messages], "cursor": cursor}
+    compact = {"room": room, "fields": list(FIELDS), "rows": rows(messages), "cursor": cursor}
+    if fmt == 'msgpack' and msgpack is not None:
+        return {"format": "msgpack", "data": msgpack.packb(compact)}
+    return dict(compact, format="compact")
+
+
+def decode_history(payload):
+    """Inverse of encode_history: (room, messages, cursor) as projected dicts"""
+    if payload.get("format") == "msgpack":
+        payload = msgpack.unpackb(payload["data"])
+    if "rows" in payload:
+        messages = [dict(zip(payload["fields"], row)) for row in payload["rows"]]
+    else:
+        messages = payload.get("messages", [])
+    return payload.get("room"), messages, payload.get("cursor")
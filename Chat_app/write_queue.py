@@ -0,0 +1,211 @@
+"""
+Write-behind queue for chat messages
+Buffers messages in memory and persists them in batches from a background worker
+"""
+
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import applog
+
+log = applog.get_logger('queue')
+
+MAX_BATCH = int(os.getenv('WRITE_QUEUE_MAX_BATCH', '100'))
+FLUSH_INTERVAL = float(os.getenv('WRITE_QUEUE_FLUSH_INTERVAL', '0.25'))
+MAX_PENDING = int(os.getenv('WRITE_QUEUE_MAX_PENDING', '10000'))
+ENQUEUE_TIMEOUT = float(os.getenv('WRITE_QUEUE_ENQUEUE_TIMEOUT', '0.5'))
+MAX_RETRIES = int(os.getenv('WRITE_QUEUE_MAX_RETRIES', '5'))
+RETRY_BASE = float(os.getenv('WRITE_QUEUE_RETRY_BASE', '0.2'))
+RETRY_CAP = 10.0
+
+
+def _green_lock():
+    # Held across flush_fn, which may yield to the hub: another greenlet has to wait
+    # on it green, not block the hub's thread (a plain lock without eventlet)
+    try:
+        from eventlet.semaphore import Semaphore
+    except ImportError:
+        return threading.Lock()
+    return Semaphore()
+
+
+class WriteBehindQueue:
+    """Bounded message buffer flushed as multi-row inserts"""
+
+    def __init__(self, flush_fn, max_batch=MAX_BATCH, flush_interval=FLUSH_INTERVAL,
+                 max_pending=MAX_PENDING, enqueue_timeout=ENQUEUE_TIMEOUT,
+                 max_retries=MAX_RETRIES, retry_base=RETRY_BASE, ready=None, sleep=time.sleep):
+        # flush_fn(rows) must return None on failure, anything else on success
+        self.flush_fn = flush_fn
+        # ready() False holds messages without spending retries (the database is known to be down)
+        self.ready = ready or (lambda: True)
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.enqueue_timeout = enqueue_timeout
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self._sleep = sleep
+
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = _green_lock()
+        self._inflight = 0
+        self._oldest_at = None
+        self._retry_at = 0.0
+        self._attempt = 0
+        self._running = False
+
+        # Counters
+        self.enqueued = 0
+        self.flushed = 0
+        self.batches = 0
+        self.retries = 0
+        self.failed = 0
+        self.dropped = 0
+        self.backpressure_waits = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def depth(self):
+        """Number of messages waiting to be written (including the batch in flight)"""
+        return len(self._pending) + self._inflight
+
+    def enqueue(self, row):
+        """Queue a message row; waits briefly for room when the buffer is full"""
+        deadline = None
+        while True:
+            with self._lock:
+                if len(self._pending) + self._inflight < self.max_pending:
+                    if not self._pending:
+                        self._oldest_at = time.monotonic()
+                    self._pending.append(row)
+                    self.enqueued += 1
+                    return True
+            now = time.monotonic()
+            if deadline is None:
+                deadline = now + self.enqueue_timeout
+                self.backpressure_waits += 1
+            if now >= deadline:
+                self.dropped += 1
+                log.warning("Buffer full - dropping message", extra={'max_pending': self.max_pending})
+                return False
+            self._sleep(0.01)
+
+    def _due(self):
+        if not self._pending or time.monotonic() < self._retry_at or not self.ready():
+            return False
+        if len(self._pending) >= self.max_batch:
+            return True
+        return time.monotonic() - self._oldest_at >= self.flush_interval
+
+    def _backoff(self):
+        # Exponential backoff with jitter so workers don't retry in lockstep
+        delay = min(RETRY_CAP, self.retry_base * (2 ** (self._attempt - 1)))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _write(self, batch):
+        try:
+            return self.flush_fn(batch) is not None
+        except Exception as e:
+            log.error("Flush raised", extra={'error': str(e)})
+            return False
+
+    def flush(self):
+        """Write all pending messages now; returns the number of rows persisted"""
+        written = 0
+        if not self.ready():
+            return written
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        break
+                    size = min(self.max_batch, len(self._pending))
+                    batch = [self._pending.popleft() for _ in range(size)]
+                    self._inflight = size
+
+                started = time.perf_counter()
+                ok = self._write(batch)
+                elapsed_ms = (time.perf_counter() - started) * 1000
+
+                with self._lock:
+                    self._inflight = 0
+                    self.last_flush_ms = elapsed_ms
+                    self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+                    self._total_flush_ms += elapsed_ms
+                    self.batches += 1
+                    if ok:
+                        self._attempt = 0
+                        self._retry_at = 0.0
+                        self.flushed += len(batch)
+                        written += len(batch)
+                        if self._pending:
+                            self._oldest_at = time.monotonic()
+                        continue
+
+                    self._attempt += 1
+                    if self._attempt > self.max_retries:
+                        self.failed += len(batch)
+                        self._attempt = 0
+                        self._retry_at = 0.0
+                        log.error("Giving up on batch", extra={'rows': len(batch), 'retries': self.max_retries})
+                        continue
+
+                    # Put the batch back at the front so message order is kept
+                    self.retries += 1
+                    self._pending.extendleft(reversed(batch))
+                    self._oldest_at = time.monotonic()
+                    self._retry_at = time.monotonic() + self._backoff()
+                    log.warning("Flush failed, will retry", extra={'attempt': self._attempt, 'max_retries': self.max_retries})
+                    break
+        return written
+
+    def _run(self):
+        tick = max(0.01, self.flush_interval / 5)
+        while self._running:
+            self._sleep(tick)
+            if self._due():
+                self.flush()
+
+    def start(self, socketio):
+        """Start the background flush worker as a Socket.IO background task"""
+        if self._running:
+            return
+        self._sleep = socketio.sleep
+        self._running = True
+        socketio.start_background_task(self._run)
+
+    def stop(self, timeout=10.0):
+        """Stop the worker and drain what is left; returns messages not written"""
+        self._running = False
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline:
+            self.flush()
+            if self._pending:
+                self._sleep(min(max(0.05, self._retry_at - time.monotonic()),
+                                max(0.0, deadline - time.monotonic())))
+        remaining = len(self._pending)
+        if remaining:
+            log.error("Shutdown with unwritten messages", extra={'remaining': remaining})
+        return remaining
+
+    def stats(self):
+        """Snapshot of queue counters"""
+        return {
+            'depth': self.depth(),
+            'enqueued': self.enqueued,
+            'flushed': self.flushed,
+            'batches': self.batches,
+            'retries': self.retries,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'backpressure_waits': self.backpressure_waits,
+            'last_flush_ms': round(self.last_flush_ms, 3),
+            'max_flush_ms': round(self.max_flush_ms, 3),
+            'avg_flush_ms': round(self._total_flush_ms / self.batches, 3) if self.batches else 0.0,
+        }
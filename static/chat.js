@@ -0,0 +1,319 @@
+const socket = io();
+let handle = "";
+let roomID = "";
+let pendingJoin = null;
+let historyCursor = null;   // cursor for the next page of older messages (null = none left)
+let lastSeen = null;        // created_at of the newest message shown, sent on rejoin to get only what is newer
+let lastSeenKey = null;     // [ms, id] lastSeen is compared by; created_at strings don't all have one format
+let resumeToken = null;     // lets a reconnect keep the same handle (kept for this tab only)
+try{ resumeToken = sessionStorage.getItem('resume_token'); }catch(e){}
+let loadingOlder = false;
+let lastTypingSent = 0;     // keystrokes are reported at most every TYPING_EVERY_MS
+const TYPING_EVERY_MS = 2000;
+
+// Update connection status text
+function updateConnectionStatus() {
+    const status = document.getElementById('status-text');
+    if(socket.connected) {
+        status.textContent = 'Connected ✓';
+        status.style.color = 'var(--accent)';
+    } else {
+        status.textContent = 'Disconnected';
+        status.style.color = 'var(--muted)';
+    }
+}
+
+// Theme toggle
+const themeToggle = document.getElementById('theme-toggle');
+function updateThemeButton() {
+    const t = document.documentElement.getAttribute('data-theme') || 'dark';
+    themeToggle.textContent = t === 'dark' ? '🌙' : '☀️';
+}
+themeToggle && themeToggle.addEventListener('click', () => {
+    const cur = document.documentElement.getAttribute('data-theme') === 'dark' ? 'dark' : 'light';
+    const next = cur === 'dark' ? 'light' : 'dark';
+    document.documentElement.setAttribute('data-theme', next);
+    try{ localStorage.setItem('theme', next); }catch(e){}
+    updateThemeButton();
+});
+updateThemeButton();
+
+// Join flow
+document.getElementById('join-btn').addEventListener('click', joinRoom);
+document.getElementById('room').addEventListener('keydown', (e)=>{ if(e.key === 'Enter') joinRoom(); });
+
+// Disable send until we have a handle (joined)
+document.getElementById('send-btn').disabled = true;
+
+function joinRoom(){
+    const roomInput = document.getElementById('room').value.trim();
+    if(!roomInput) {
+        alert('Please enter a room ID');
+        return;
+    }
+    
+    if(!socket.connected) {
+        // queue join for when socket connects
+        pendingJoin = roomInput;
+        document.getElementById('status-text').textContent = 'Queued join — waiting for connection...';
+        console.log('Join queued, socket not connected yet');
+        return;
+    }
+
+    roomID = roomInput;
+    console.log('Joining room:', roomID);
+    document.getElementById('join-screen').style.display = 'none';
+    document.getElementById('chat-screen').style.display = 'block';
+    document.getElementById('room-title').innerText = 'Room: ' + roomID;
+    lastSeen = lastSeenKey = null;
+    emitJoin();
+}
+
+function emitJoin(){
+    socket.emit('join', {room: roomID, format: 'compact', since: lastSeen, resume: resumeToken});
+}
+
+// Stored times without an offset are UTC, which Date.parse would otherwise read as local time
+function parseCreated(createdAt){
+    return Date.parse(/(Z|[+-]\d\d:?\d\d)$/.test(createdAt) ? createdAt : createdAt + 'Z');
+}
+
+// Live messages have no id yet (they are written behind); at the same time, an id beats none
+function noteSeen(createdAt, id){
+    const at = createdAt ? parseCreated(createdAt) : NaN;
+    if(isNaN(at)) return;
+    const key = [at, id == null ? -1 : id];
+    if(!lastSeenKey || at > lastSeenKey[0] || (at === lastSeenKey[0] && key[1] > lastSeenKey[1])){
+        lastSeen = createdAt;
+        lastSeenKey = key;
+    }
+}
+
+socket.on('resume_token', (token)=> {
+    resumeToken = token;
+    try{ sessionStorage.setItem('resume_token', token); }catch(e){}
+});
+
+socket.on('your_handle', (h)=>{ 
+    handle = h; 
+    document.getElementById('user-handle').textContent = h;
+    console.log('Received handle:', h);
+    // enable sending once we have an assigned handle
+    const sendBtn = document.getElementById('send-btn');
+    if(sendBtn) sendBtn.disabled = false;
+});
+
+// History arrives in the compact format asked for on join: the room once, then one array per message
+function historyMessages(data){
+    if(!data.rows) return data.messages || [];
+    return data.rows.map((row) => {
+        const msg = {};
+        data.fields.forEach((field, i) => { msg[field] = row[i]; });
+        return msg;
+    });
+}
+
+socket.on('message_history', (data)=> {
+    console.log('Message history received:', data);
+    // After a reconnect (data.since) only the messages we missed arrive: append them.
+    // Otherwise this is the room's full recent history, in chronological order.
+    if(!data.since){
+        document.getElementById('messages').innerHTML = '';
+        historyCursor = data.cursor || null;
+    }
+    historyMessages(data).forEach((msg) => {
+        const isMe = msg.user_handle === handle;
+        addMessage(msg.user_handle + ': ' + msg.message_text, isMe ? 'msg me' : 'msg');
+        noteSeen(msg.created_at, msg.id);
+    });
+});
+
+// Older pages arrive oldest-first; prepend them without moving what the user is looking at
+socket.on('older_messages', (data)=> {
+    loadingOlder = false;
+    if(data.room !== roomID) return;
+    const box = document.getElementById('messages');
+    const prevHeight = box.scrollHeight;
+    const frag = document.createDocumentFragment();
+    historyMessages(data).forEach((msg) => {
+        const isMe = msg.user_handle === handle;
+        frag.appendChild(makeMessage(msg.user_handle + ': ' + msg.message_text, isMe ? 'msg me' : 'msg'));
+    });
+    box.insertBefore(frag, box.firstChild);
+    box.scrollTop += box.scrollHeight - prevHeight;
+    historyCursor = data.cursor || null;
+});
+
+// Lazily fetch older history when the user scrolls near the top
+document.getElementById('messages').addEventListener('scroll', (e)=> {
+    if(e.target.scrollTop > 40 || !historyCursor || loadingOlder) return;
+    loadingOlder = true;
+    socket.emit('load_older', {room: roomID, cursor: historyCursor});
+});
+
+// Search: results arrive newest first; "More" asks for the page after the last one
+let searchQuery = '';
+let searchCursor = null;
+function runSearch(more){
+    const box = document.getElementById('search-results');
+    if(!more){
+        searchQuery = document.getElementById('search-q').value.trim();
+        searchCursor = null;
+        box.innerHTML = '';
+    }
+    box.style.display = searchQuery ? 'block' : 'none';
+    if(searchQuery) socket.emit('search', {room: roomID, q: searchQuery, cursor: searchCursor});
+}
+document.getElementById('search-q').addEventListener('keydown', (e)=> { if(e.key === 'Enter') runSearch(false); });
+
+socket.on('search_results', (data)=> {
+    if(data.room !== roomID || data.query !== searchQuery) return;
+    const box = document.getElementById('search-results');
+    const more = box.querySelector('.search-more');
+    if(more) more.remove();
+    const found = historyMessages(data);
+    if(!found.length && !searchCursor) box.appendChild(makeMessage(data.error || 'No messages found.', 'system'));
+    found.forEach((msg) => box.appendChild(makeMessage(msg.user_handle + ': ' + msg.message_text, 'msg')));
+    searchCursor = data.cursor || null;
+    if(searchCursor){
+        const btn = document.createElement('button');
+        btn.className = 'search-more';
+        btn.type = 'button';
+        btn.textContent = 'More';
+        btn.onclick = () => runSearch(true);
+        box.appendChild(btn);
+    }
+});
+
+socket.on('rate_limited', (data)=> {
+    console.log('Rate limited:', data);
+    if(data.event === 'message') addMessage('⏳ Slow down - that message was not sent.', 'system');
+});
+
+// Presence: the member list on join, then one aggregated diff per interval
+socket.on('presence_snapshot', (data)=> {
+    document.getElementById('online-count').textContent = data.count;
+});
+
+function presenceNotice(names, total, verb){
+    if(!total) return;
+    const others = names.filter((h) => h !== handle);
+    if(!others.length) return;
+    const more = total - names.length;
+    addMessage('🔔 ' + others.join(', ') + (more > 0 ? ' and ' + more + ' more' : '') + ' ' + verb + ' the room.', 'system');
+}
+
+socket.on('presence', (diff)=> {
+    document.getElementById('online-count').textContent = diff.count;
+    presenceNotice(diff.joined || [], diff.joined_count || 0, 'joined');
+    presenceNotice(diff.left || [], diff.left_count || 0, 'left');
+    const typers = (diff.typing || []).filter((h) => h !== handle);
+    const extra = (diff.typing_count || 0) - (diff.typing || []).length;
+    let text = '';
+    if(typers.length === 1 && extra <= 0) text = typers[0] + ' is typing…';
+    else if(typers.length) text = typers.join(', ') + (extra > 0 ? ' and ' + extra + ' more' : '') + ' are typing…';
+    document.getElementById('typing').textContent = text;
+});
+
+socket.on('system', (msg)=> {
+    console.log('System message:', msg);
+    addMessage('🔔 ' + msg, 'system');
+});
+
+socket.on('message', (data)=> {
+    console.log('Message received:', data);
+    const isMe = data.handle === handle;
+    addMessage(data.handle + ': ' + data.text, isMe ? 'msg me' : 'msg');
+    noteSeen(data.created_at);
+});
+
+// Busy rooms send several messages per frame; render them in one DOM update
+socket.on('message_batch', (data)=> {
+    const box = document.getElementById('messages');
+    const frag = document.createDocumentFragment();
+    (data.messages || []).forEach((msg) => {
+        const isMe = msg.handle === handle;
+        frag.appendChild(makeMessage(msg.handle + ': ' + msg.text, isMe ? 'msg me' : 'msg'));
+        noteSeen(msg.created_at);
+    });
+    box.appendChild(frag);
+    box.scrollTop = box.scrollHeight;
+});
+
+// The server dropped broadcasts we were too slow to read: rejoin to fetch them as history
+socket.on('resync', (data)=> {
+    console.log('Resync after missed messages:', data);
+    if(roomID) emitJoin();
+});
+
+// Composer
+document.getElementById('send-btn').addEventListener('click', sendMsg);
+document.getElementById('msg').addEventListener('keydown', (e)=>{ if(e.key === 'Enter') sendMsg(); });
+document.getElementById('msg').addEventListener('input', ()=> {
+    const now = Date.now();
+    if(!roomID || now - lastTypingSent < TYPING_EVERY_MS) return;
+    lastTypingSent = now;
+    socket.emit('typing');
+});
+
+function sendMsg(){
+    const input = document.getElementById('msg');
+    const text = input.value.trim();
+    if(!text) return;
+    console.log('Sending message:', text);
+    // The server knows our handle and room from the join, so only the text is sent
+    socket.emit('message', text);
+    input.value = '';
+    lastTypingSent = 0;
+}
+
+function makeMessage(text, kind='msg'){
+    const el = document.createElement('div');
+    el.className = 'message ' + kind;
+    el.textContent = text;
+    return el;
+}
+
+function addMessage(text, kind='msg'){
+    const box = document.getElementById('messages');
+    box.appendChild(makeMessage(text, kind));
+    box.scrollTop = box.scrollHeight;
+}
+
+// Socket.IO event monitoring
+socket.on('connect', ()=>{ 
+    console.log('Connected to server');
+    document.getElementById('connection-status').textContent = '🟢';
+    document.getElementById('connection-status').title = 'Connected';
+    updateConnectionStatus();
+    // If a join was queued while disconnected, emit it now
+    if(pendingJoin) {
+        console.log('Emitting queued join for room', pendingJoin);
+        roomID = pendingJoin;
+        pendingJoin = null;
+        document.getElementById('join-screen').style.display = 'none';
+        document.getElementById('chat-screen').style.display = 'block';
+        document.getElementById('room-title').innerText = 'Room: ' + roomID;
+        emitJoin();
+    } else if(roomID) {
+        // Reconnected: rejoin, asking only for messages newer than the last one shown
+        emitJoin();
+    }
+});
+
+socket.on('disconnect', ()=>{ 
+    console.log('Disconnected from server');
+    document.getElementById('connection-status').textContent = '🔴';
+    document.getElementById('connection-status').title = 'Disconnected';
+    updateConnectionStatus();
+});
+
+socket.on('connect_error', (err)=>{ 
+    console.error('Connection error:', err);
+    document.getElementById('connection-status').textContent = '🟡';
+    document.getElementById('connection-status').title = 'Connection error: ' + err;
+});
+
+// Initial status check
+document.addEventListener('DOMContentLoaded', updateConnectionStatus);
+setTimeout(updateConnectionStatus, 500);